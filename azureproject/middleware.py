@@ -0,0 +1,43 @@
+# azureproject/middleware.py
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.urls import reverse
+
+logger = logging.getLogger(__name__)
+
+
+class AdminQueryCountMiddleware:
+    """
+    Development aid: logs a warning when an admin page runs more than
+    ADMIN_QUERY_COUNT_WARNING queries, which usually means a list column or
+    inline queries per row. Only active with DEBUG.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'ADMIN_QUERY_COUNT_WARNING', 50)
+
+    def __call__(self, request):
+        if not request.path.startswith(reverse('admin:index')):
+            return self.get_response(request)
+
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            response = self.get_response(request)
+        if queries > self.threshold:
+            logger.warning(
+                "%s %s ran %d queries (warning threshold %d)",
+                request.method, request.get_full_path(), queries, self.threshold
+            )
+        return response
@@ -45,8 +45,12 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'azureproject.middleware.AdminQueryCountMiddleware',
 ]
 
+# Admin pages running more queries than this are logged (DEBUG only)
+ADMIN_QUERY_COUNT_WARNING = 50
+
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
 ROOT_URLCONF = 'azureproject.urls'
 
@@ -1,11 +1,19 @@
 # bookings/admin.py
 from django.contrib import admin
 from django.utils.html import format_html
-from django.urls import reverse
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib import messages
 
+from cruises.admin import PassengerSummaryAdminMixin
+from .rollups import dashboard_data
+from .search import IndexedSearchMixin
+
 from .models import (
+    SearchDocument,
     Booking,
     Passenger,
     BookingAdditionalService,
@@ -52,7 +60,7 @@ class ExcursionBookingInline(admin.TabularInline):
     filter_horizontal = ('passengers',)
 
 @admin.register(Booking)
-class BookingAdmin(admin.ModelAdmin):
+class BookingAdmin(PassengerSummaryAdminMixin, IndexedSearchMixin, admin.ModelAdmin):
     list_display = (
         'id',
         'quote_link',
@@ -79,6 +87,7 @@ class BookingAdmin(admin.ModelAdmin):
         'passengers__last_name',
         'confirmation_number'
     )
+    search_index_kind = SearchDocument.Kind.BOOKING
     inlines = [
         PassengerInline,
         BookingAdditionalServiceInline,
@@ -88,6 +97,7 @@ class BookingAdmin(admin.ModelAdmin):
         'created_at',
         'updated_at',
         'confirmation_number',
+        'cabin_reserved',
         'total_price',
         'amount_paid',
         'balance_due'
@@ -106,6 +116,7 @@ class BookingAdmin(admin.ModelAdmin):
             'fields': (
                 'status',
                 'payment_status',
+                'cabin_reserved',
                 'cancellation_reason'
             )
         }),
@@ -127,20 +138,58 @@ class BookingAdmin(admin.ModelAdmin):
         })
     )
     raw_id_fields = ('quote', 'cruise_session', 'cabin_category', 'applied_promotion')
+    change_list_template = 'admin/bookings/booking/change_list.html'
+    DASHBOARD_PERIODS = [7, 30, 90, 365]
+
+    def get_urls(self):
+        custom_urls = [
+            path(
+                'dashboard/',
+                self.admin_site.admin_view(self.dashboard_view),
+                name='bookings_dashboard'
+            ),
+        ]
+        return custom_urls + super().get_urls()
+
+    def dashboard_view(self, request):
+        """Revenue and occupancy figures from the rollups kept by the build_rollups command"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            days = int(request.GET.get('days', 30))
+        except ValueError:
+            days = 30
+        if days not in self.DASHBOARD_PERIODS:
+            days = 30
+        return TemplateResponse(request, 'admin/bookings/booking/dashboard.html', {
+            **self.admin_site.each_context(request),
+            'title': _("Revenue and occupancy"),
+            'opts': self.model._meta,
+            'days': days,
+            'periods': self.DASHBOARD_PERIODS,
+            **dashboard_data(days),
+        })
+
+    def get_queryset(self, request):
+        # Lead passenger and passenger count are stored on the booking; only
+        # the cruise and cabin columns need a join
+        return super().get_queryset(request).select_related(None).select_related(
+            'cruise_session__cruise',
+            'cabin_category'
+        )
 
     def cruise_link(self, obj):
-        url = reverse("admin:cruises_cruise_change", args=[obj.cruise_session.cruise.id])
+        url = reverse("admin:cruises_cruise_change", args=[obj.cruise_session.cruise_id])
         return format_html('<a href="{}">{}</a>', url, obj.cruise_session.cruise.name)
     cruise_link.short_description = _('Cruise')
 
     def cabin_link(self, obj):
-        url = reverse("admin:cruises_cabincategory_change", args=[obj.cabin_category.id])
+        url = reverse("admin:cruises_cabincategory_change", args=[obj.cabin_category_id])
         return format_html('<a href="{}">{}</a>', url, obj.cabin_category.name)
     cabin_link.short_description = _('Cabin')
 
     def lead_passenger(self, obj):
-        passenger = obj.passengers.filter(is_lead_passenger=True).first()
-        return passenger.full_name if passenger else _("No lead passenger")
+        return obj.lead_passenger_name or _("No lead passenger")
     lead_passenger.short_description = _('Lead Passenger')
 
     def price_display(self, obj):
@@ -155,9 +204,9 @@ class BookingAdmin(admin.ModelAdmin):
     price_display.short_description = _('Price Details')
 
     def quote_link(self, obj):
-        if obj.quote:
-            url = reverse("admin:quotes_quote_change", args=[obj.quote.id])
-            return format_html('<a href="{}">Quote {}</a>', url, obj.quote.id)
+        if obj.quote_id:
+            url = reverse("admin:quotes_quote_change", args=[obj.quote_id])
+            return format_html('<a href="{}">Quote {}</a>', url, obj.quote_id)
         return _('No Quote')
     quote_link.short_description = _('Quote')
 
@@ -179,7 +228,8 @@ class BookingAdmin(admin.ModelAdmin):
     @admin.action(description=_("Mark selected bookings as confirmed"))
     def mark_as_confirmed(self, request, queryset):
         updated = queryset.filter(status=Booking.Status.PENDING).update(
-            status=Booking.Status.CONFIRMED
+            status=Booking.Status.CONFIRMED,
+            updated_at=timezone.now()
         )
         self.message_user(
             request,
@@ -0,0 +1,35 @@
+# bookings/management/commands/backfill_passenger_summaries.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from bookings.models import Booking
+from cruises.models import refresh_passenger_summaries
+from quotes.models import Quote
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored lead passenger name and passenger count of bookings and quotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows updated per statement')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model in (Booking, Quote):
+            started = time.perf_counter()
+            pks = model._base_manager.order_by('pk').values_list('pk', flat=True)
+            updated = 0
+            last_pk = 0
+            while True:
+                batch = list(pks.filter(pk__gt=last_pk)[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1]
+                updated += refresh_passenger_summaries(model._base_manager.filter(pk__in=batch))
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{model._meta.verbose_name_plural.capitalize()} updated: {updated} in {elapsed:.2f}s"
+                )
+            )
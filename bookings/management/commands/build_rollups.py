@@ -0,0 +1,27 @@
+# bookings/management/commands/build_rollups.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from bookings.rollups import build_rollups
+
+
+class Command(BaseCommand):
+    help = 'Update the revenue and occupancy rollups from bookings, sessions and cabin prices changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Rebuild all rollups, e.g. after bookings were moved to another session',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        days, session_ids = build_rollups(full=options['full'])
+        elapsed = time.perf_counter() - started
+        if days is None:
+            summary = "all days and sessions"
+        else:
+            summary = f"{len(days)} days, {len(session_ids)} sessions"
+        self.stdout.write(self.style.SUCCESS(f"Rollups rebuilt for {summary} in {elapsed:.2f}s"))
@@ -0,0 +1,39 @@
+# bookings/management/commands/rebuild_search_index.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from bookings.models import SearchDocument
+from bookings.search import INDEXED, index_documents
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the admin search documents of all bookings and quotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Objects indexed per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for kind, (model, *_rest) in INDEXED.items():
+            started = time.perf_counter()
+            pks = model._base_manager.order_by('pk').values_list('pk', flat=True)
+            indexed = 0
+            last_pk = 0
+            while True:
+                batch = list(pks.filter(pk__gt=last_pk)[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1]
+                index_documents(kind, batch)
+                indexed += len(batch)
+            removed, _deleted = SearchDocument.objects.filter(kind=kind).exclude(
+                object_id__in=model._base_manager.values('pk')
+            ).delete()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{model._meta.verbose_name_plural.capitalize()} indexed: {indexed}, "
+                    f"stale documents removed: {removed} in {elapsed:.2f}s"
+                )
+            )
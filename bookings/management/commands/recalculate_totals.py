@@ -0,0 +1,34 @@
+# bookings/management/commands/recalculate_totals.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from bookings.models import Booking
+from bookings.services import recalculate_totals
+
+
+class Command(BaseCommand):
+    help = 'Recalculate booking totals from their services, excursions and promotions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--status',
+            nargs='+',
+            default=[Booking.Status.DRAFT, Booking.Status.PENDING, Booking.Status.CONFIRMED],
+            choices=Booking.Status.values,
+            help='Booking statuses to recalculate (default: draft, pending and confirmed)',
+        )
+        parser.add_argument('--session', type=int, action='append', help='Only bookings of this cruise session')
+        parser.add_argument('--batch-size', type=int, default=500, help='Bookings recalculated per batch')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        bookings = Booking.objects.filter(status__in=options['status'])
+        if options['session']:
+            bookings = bookings.filter(cruise_session_id__in=options['session'])
+
+        updated = recalculate_totals(bookings, batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"Booking totals updated: {updated} in {elapsed:.2f}s")
+        )
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-19 18:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='lead_passenger_name',
+            field=models.CharField(blank=True, editable=False, max_length=201, verbose_name='Lead Passenger'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='passenger_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Passengers'),
+        ),
+    ]
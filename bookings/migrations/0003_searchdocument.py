@@ -0,0 +1,71 @@
+# Generated by Django 5.0.6 on 2026-10-19 18:15
+
+from django.db import migrations, models
+
+SQLITE_CREATE = [
+    """CREATE VIRTUAL TABLE bookings_searchdocument_fts USING fts5(
+        content, content='bookings_searchdocument', content_rowid='id'
+    )""",
+    """CREATE TRIGGER bookings_searchdocument_ai AFTER INSERT ON bookings_searchdocument BEGIN
+        INSERT INTO bookings_searchdocument_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER bookings_searchdocument_ad AFTER DELETE ON bookings_searchdocument BEGIN
+        INSERT INTO bookings_searchdocument_fts(bookings_searchdocument_fts, rowid, content)
+        VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER bookings_searchdocument_au AFTER UPDATE ON bookings_searchdocument BEGIN
+        INSERT INTO bookings_searchdocument_fts(bookings_searchdocument_fts, rowid, content)
+        VALUES ('delete', old.id, old.content);
+        INSERT INTO bookings_searchdocument_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS bookings_searchdocument_au",
+    "DROP TRIGGER IF EXISTS bookings_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS bookings_searchdocument_ai",
+    "DROP TABLE IF EXISTS bookings_searchdocument_fts",
+]
+POSTGRESQL_CREATE = [
+    """CREATE INDEX bookings_searchdocument_tsv_idx ON bookings_searchdocument
+        USING gin (to_tsvector('simple', content))""",
+]
+POSTGRESQL_DROP = [
+    "DROP INDEX IF EXISTS bookings_searchdocument_tsv_idx",
+]
+
+
+def _run(schema_editor, statements):
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def create_text_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_CREATE, 'postgresql': POSTGRESQL_CREATE})
+
+
+def drop_text_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0002_passenger_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('booking', 'Booking'), ('quote', 'Quote')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('content', models.TextField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(create_text_index, drop_text_index),
+    ]
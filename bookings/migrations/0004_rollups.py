@@ -0,0 +1,97 @@
+# Generated by Django 5.0.6 on 2026-10-19 18:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0003_searchdocument'),
+        ('cruises', '0003_price_adjustment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BrandDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('passengers', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('amount_paid', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('brand', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='cruises.brand')),
+            ],
+            options={
+                'ordering': ['-day'],
+                'abstract': False,
+                'unique_together': {('brand', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SessionDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('passengers', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('amount_paid', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('cruise_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='cruises.cruisesession')),
+            ],
+            options={
+                'ordering': ['-day'],
+                'abstract': False,
+                'unique_together': {('cruise_session', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SessionOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('cabins_sold', models.PositiveIntegerField(default=0)),
+                ('cabins_available', models.PositiveIntegerField(default=0)),
+                ('passengers', models.PositiveIntegerField(default=0)),
+                ('passenger_capacity', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('brand', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='session_occupancies', to='cruises.brand')),
+                ('cruise_session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='cruises.cruisesession')),
+                ('ship', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='session_occupancies', to='cruises.ship')),
+            ],
+            options={
+                'verbose_name_plural': 'Session occupancies',
+                'indexes': [models.Index(fields=['start_date', 'status'], name='bookings_se_start_d_cb0e3b_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ShipDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('passengers', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('amount_paid', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('ship', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='cruises.ship')),
+            ],
+            options={
+                'ordering': ['-day'],
+                'abstract': False,
+                'unique_together': {('ship', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0004_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='cabin_reserved',
+            field=models.BooleanField(default=False, editable=False, help_text='A cabin was taken from the session inventory for this booking', verbose_name='Cabin reserved'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.6 on 2026-10-19 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0005_booking_cabin_reserved'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('cruise_session_id', models.PositiveBigIntegerField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,61 @@
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+# kind: (app label, model name, its own fields, passenger model name, passenger foreign key);
+# a copy of bookings.search.INDEXED as of this migration
+INDEXED = {
+    'booking': (
+        'bookings', 'Booking',
+        ('confirmation_number', 'cruise_session__cruise__name', 'user__username', 'user__email'),
+        'Passenger', 'booking'
+    ),
+    'quote': (
+        'quotes', 'Quote',
+        ('cruise_session__cruise__name', 'cabin_category__name', 'user__username', 'user__email'),
+        'QuotePassenger', 'quote'
+    ),
+}
+
+
+def backfill_search_documents(apps, schema_editor):
+    """Index the bookings and quotes that existed before the search documents did"""
+    SearchDocument = apps.get_model('bookings', 'SearchDocument')
+    for kind, (app_label, model_name, fields, passenger_model_name, parent_field) in INDEXED.items():
+        model = apps.get_model(app_label, model_name)
+        passenger_model = apps.get_model(app_label, passenger_model_name)
+        pks = model._base_manager.order_by('pk').values_list('pk', flat=True)
+        last_pk = 0
+        while True:
+            batch = list(pks.filter(pk__gt=last_pk)[:BATCH_SIZE])
+            if not batch:
+                break
+            last_pk = batch[-1]
+            documents = {
+                row[0]: [value for value in row[1:] if value]
+                for row in model._base_manager.filter(pk__in=batch).values_list('pk', *fields)
+            }
+            for parent_id, *values in passenger_model._base_manager.filter(
+                **{f'{parent_field}_id__in': batch}
+            ).values_list(f'{parent_field}_id', 'first_name', 'last_name', 'email'):
+                documents[parent_id].extend(value for value in values if value)
+            # Documents the signals wrote already are newer and kept
+            SearchDocument.objects.bulk_create(
+                [
+                    SearchDocument(kind=kind, object_id=object_id, content=' '.join(values))
+                    for object_id, values in documents.items()
+                ],
+                ignore_conflicts=True
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0006_stalerollup'),
+        ('quotes', '0004_passenger_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,5 @@
 # bookings/models.py
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils import timezone
@@ -7,11 +7,15 @@ from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator, EmailValidator
 from decimal import Decimal
 
+from cruises import pricing
+from cruises.inventory import release_cabins
 from cruises.models import (
     BaseModel,
+    PassengerSummaryModel,
     CruiseSession,
     CabinCategory,
     Ship,
+    Brand,
     Promotion,
     CruiseExcursion
 )
@@ -20,7 +24,7 @@ class BookingManager(models.Manager):
     def get_queryset(self):
         return super().get_queryset().select_related(
             'user',
-            'quotes',
+            'quote',
             'cruise_session',
             'cruise_session__cruise',
             'cruise_session__cruise__ship',
@@ -42,7 +46,7 @@ class BookingManager(models.Manager):
             cruise_session__cruise__ship_id=ship_id
         )
 
-class Booking(BaseModel):
+class Booking(PassengerSummaryModel, BaseModel):
     class Status(models.TextChoices):
         DRAFT = 'draft', _('Draft')
         PENDING = 'pending', _('Pending')
@@ -133,6 +137,12 @@ class Booking(BaseModel):
     internal_notes = models.TextField(blank=True)
     cancellation_reason = models.TextField(blank=True)
     confirmation_number = models.CharField(max_length=50, unique=True, null=True, blank=True)
+    cabin_reserved = models.BooleanField(
+        _("Cabin reserved"),
+        default=False,
+        editable=False,
+        help_text=_("A cabin was taken from the session inventory for this booking")
+    )
 
     objects = BookingManager()
 
@@ -145,8 +155,7 @@ class Booking(BaseModel):
         ]
 
     def __str__(self):
-        lead_passenger = self.passengers.first()
-        passenger_name = lead_passenger.full_name if lead_passenger else "No passenger"
+        passenger_name = self.lead_passenger_name or "No passenger"
         return f"Booking {self.confirmation_number} - {passenger_name}"
 
     def save(self, *args, **kwargs):
@@ -161,32 +170,24 @@ class Booking(BaseModel):
     def is_upcoming(self):
         return self.cruise_session.start_date > timezone.now().date()
 
-    @property
-    def passenger_count(self):
-        return self.passengers.count()
-
     @property
     def balance_due(self):
         return self.total_price - self.amount_paid
 
     def calculate_total_price(self):
         """Calculate total price including additional services and excursions"""
-        base_total = self.base_price
-        
-        # Add additional services
-        service_total = sum(service.total_price for service in self.additional_services.all())
-        
-        # Add excursion costs
-        excursion_total = sum(booking.total_price for booking in self.excursion_bookings.all())
-        
-        # Apply promotion discount if applicable
-        if self.applied_promotion and self.applied_promotion.is_active():
-            if self.applied_promotion.discount_type == 'percentage':
-                self.discount_amount = (base_total * self.applied_promotion.discount_value) / 100
-            else:  # fixed amount
-                self.discount_amount = self.applied_promotion.discount_value
-        
-        self.total_price = base_total + service_total + excursion_total - self.discount_amount
+        # Import here to avoid circular import
+        from .services import PRICE_COMPONENTS, price_booking, with_price_components
+
+        components = with_price_components(
+            Booking.objects.select_related(None).filter(pk=self.pk)
+        ).values(*PRICE_COMPONENTS).get()
+        for name, value in components.items():
+            setattr(self, name, value)
+
+        breakdown = price_booking(self)
+        self.discount_amount = breakdown.discount_amount
+        self.total_price = breakdown.total_price
         self.save()
 
     def generate_confirmation_number(self):
@@ -199,9 +200,15 @@ class Booking(BaseModel):
         if self.status not in [self.Status.PENDING, self.Status.CONFIRMED]:
             raise ValueError("Cannot cancel booking with current status")
         
-        self.status = self.Status.CANCELLED
-        self.cancellation_reason = reason
-        self.save()
+        with transaction.atomic():
+            # Only a booking that took a cabin gives one back, and only once
+            released = Booking.objects.filter(pk=self.pk, cabin_reserved=True).update(cabin_reserved=False)
+            self.status = self.Status.CANCELLED
+            self.cancellation_reason = reason
+            self.cabin_reserved = False
+            self.save()
+            if released:
+                release_cabins(self.cruise_session_id, self.cabin_category_id)
 
     def record_payment(self, amount):
         """Record a payment for the booking"""
@@ -343,4 +350,122 @@ class ExcursionBooking(BaseModel):
         return self.cruise_excursion.excursion.price * self.passengers.count()
 
     def __str__(self):
-        return f"{self.cruise_excursion.excursion.name} - {self.passengers.count()} passengers"
\ No newline at end of file
+        return f"{self.cruise_excursion.excursion.name} - {self.passengers.count()} passengers"
+
+
+class SearchDocument(models.Model):
+    """
+    Searchable text of a booking or quote, kept up to date by bookings.search.
+    The content is indexed by an FTS5 table on SQLite and by a GIN index over
+    its tsvector on PostgreSQL, both created in migration 0003.
+    """
+    class Kind(models.TextChoices):
+        BOOKING = 'booking', _('Booking')
+        QUOTE = 'quote', _('Quote')
+
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    object_id = models.PositiveBigIntegerField()
+    content = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('kind', 'object_id')
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.object_id}"
+
+
+class DailyRollup(models.Model):
+    """
+    Bookings made on ``day`` (by creation date) that are still live, summed
+    up by bookings.rollups. Cancelled, refunded and draft bookings are left out.
+    """
+    day = models.DateField()
+    bookings = models.PositiveIntegerField(default=0)
+    passengers = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    amount_paid = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+        ordering = ['-day']
+
+
+class SessionDailyRollup(DailyRollup):
+    cruise_session = models.ForeignKey(CruiseSession, on_delete=models.CASCADE, related_name='daily_rollups')
+
+    class Meta(DailyRollup.Meta):
+        unique_together = ('cruise_session', 'day')
+
+
+class ShipDailyRollup(DailyRollup):
+    ship = models.ForeignKey(Ship, on_delete=models.CASCADE, related_name='daily_rollups')
+
+    class Meta(DailyRollup.Meta):
+        unique_together = ('ship', 'day')
+
+
+class BrandDailyRollup(DailyRollup):
+    brand = models.ForeignKey(Brand, on_delete=models.CASCADE, related_name='daily_rollups')
+
+    class Meta(DailyRollup.Meta):
+        unique_together = ('brand', 'day')
+
+
+class SessionOccupancy(models.Model):
+    """
+    Current occupancy of a cruise session, kept by bookings.rollups: cabins
+    bookings took from the inventory and still hold (Booking.cabin_reserved)
+    against those plus the cabins still available, and passengers of live
+    bookings against the session capacity. Ship and brand are copied
+    so the dashboard can group without joining the sessions.
+    """
+    cruise_session = models.OneToOneField(CruiseSession, on_delete=models.CASCADE, related_name='occupancy')
+    ship = models.ForeignKey(Ship, on_delete=models.CASCADE, related_name='session_occupancies')
+    brand = models.ForeignKey(
+        Brand,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='session_occupancies'
+    )
+    start_date = models.DateField()
+    status = models.CharField(max_length=20)
+    cabins_sold = models.PositiveIntegerField(default=0)
+    cabins_available = models.PositiveIntegerField(default=0)
+    passengers = models.PositiveIntegerField(default=0)
+    passenger_capacity = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = _("Session occupancies")
+        indexes = [
+            models.Index(fields=['start_date', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.cruise_session_id}: {self.cabins_sold}/{self.cabins_sold + self.cabins_available} cabins"
+
+
+class StaleRollup(models.Model):
+    """
+    Day and session of a deleted booking, whose rollups the next incremental
+    bookings.rollups run recomputes: a deleted row has no ``updated_at`` for
+    the watermarks to find. Written by bookings.signals, deleted once used.
+    """
+    day = models.DateField()
+    # Not a foreign key: the session may be deleted along with the booking
+    cruise_session_id = models.PositiveBigIntegerField()
+
+    def __str__(self):
+        return f"{self.day}: session {self.cruise_session_id}"
+
+
+class RollupWatermark(models.Model):
+    """Latest ``updated_at`` of a source table already rolled up"""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
@@ -0,0 +1,219 @@
+# bookings/rollups.py
+"""
+Revenue and occupancy rollups behind the booking dashboard.
+
+build_rollups() finds the rows changed since its last run through
+``updated_at`` watermarks and recomputes only what they touch: the daily
+rows of the days on which changed bookings were made, and the occupancy of
+their sessions and of sessions whose capacity or cabin prices changed. Each
+recomputation is a few grouped aggregate queries, so a run after a quiet
+hour costs a handful of queries however many bookings there are.
+
+A deleted booking leaves a StaleRollup row with its day and session instead
+(see bookings.signals). Bookings moved to another session leave no trace of
+their old session; ``full=True`` (``build_rollups --full``) rebuilds
+everything.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from cruises.models import CruiseSession, CruiseSessionCabinPrice
+from .models import (
+    Booking,
+    BrandDailyRollup,
+    RollupWatermark,
+    SessionDailyRollup,
+    SessionOccupancy,
+    ShipDailyRollup,
+    StaleRollup,
+)
+
+LIVE_STATUSES = [Booking.Status.PENDING, Booking.Status.CONFIRMED, Booking.Status.COMPLETED]
+# Rows written by transactions that committed late still fall inside the next run
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+# (rollup model, its key field, the booking field grouped by)
+DAILY_ROLLUPS = [
+    (SessionDailyRollup, 'cruise_session_id', 'cruise_session_id'),
+    (ShipDailyRollup, 'ship_id', 'cruise_session__cruise__ship_id'),
+    (BrandDailyRollup, 'brand_id', 'cruise_session__cruise__ship__brand_id'),
+]
+DAILY_TOTALS = ('bookings', 'passengers', 'revenue', 'amount_paid')
+
+
+def _changed_since_watermark(model, name):
+    """Rows of ``model`` updated since the watermark ``name``; all rows before the first run"""
+    watermark = RollupWatermark.objects.filter(name=name).values_list('value', flat=True).first()
+    rows = model._base_manager.order_by()
+    if watermark is None:
+        return rows
+    return rows.filter(updated_at__gt=watermark - WATERMARK_OVERLAP)
+
+
+def _live_bookings():
+    return Booking._base_manager.filter(status__in=LIVE_STATUSES).order_by()
+
+
+def rebuild_daily_rollups(days=None):
+    """Recompute the session, ship and brand rows of ``days`` (all days if None)"""
+    bookings = _live_bookings().annotate(day=TruncDate('created_at'))
+    if days is not None:
+        bookings = bookings.filter(day__in=days)
+    for model, key_field, group_field in DAILY_ROLLUPS:
+        rows = bookings.values('day', group_field).annotate(
+            bookings=Count('pk'),
+            passengers=Coalesce(Sum('passenger_count'), 0),
+            revenue=Coalesce(Sum('total_price'), Decimal('0.00')),
+            amount_paid=Coalesce(Sum('amount_paid'), Decimal('0.00')),
+        )
+        stale = model.objects.all() if days is None else model.objects.filter(day__in=days)
+        stale.delete()
+        model.objects.bulk_create(
+            [
+                model(
+                    **{key_field: row[group_field]},
+                    day=row['day'],
+                    **{total: row[total] for total in DAILY_TOTALS}
+                )
+                # Ships without a brand have no brand row
+                for row in rows if row[group_field] is not None
+            ],
+            batch_size=1000
+        )
+
+
+def _session_total(queryset, aggregate):
+    """Subquery of one aggregate over ``queryset`` rows of the outer session"""
+    return Coalesce(
+        Subquery(
+            queryset.filter(cruise_session=OuterRef('pk')).values('cruise_session').annotate(
+                total=aggregate
+            ).values('total')
+        ),
+        0
+    )
+
+
+def rebuild_occupancy(session_ids=None):
+    """Recompute the occupancy of ``session_ids`` (all sessions if None)"""
+    sessions = CruiseSession.objects.order_by()
+    stale = SessionOccupancy.objects.all()
+    if session_ids is not None:
+        sessions = sessions.filter(pk__in=session_ids)
+        stale = stale.filter(cruise_session_id__in=session_ids)
+    rows = sessions.annotate(
+        # Counted like the inventory: cancelling gives the cabin back and clears the flag
+        cabins_sold=_session_total(Booking._base_manager.filter(cabin_reserved=True).order_by(), Count('pk')),
+        booked_passengers=_session_total(_live_bookings(), Sum('passenger_count')),
+        cabins_available=_session_total(CruiseSessionCabinPrice.objects.order_by(), Sum('available_cabins')),
+        ship_id=F('cruise__ship_id'),
+        brand_id=F('cruise__ship__brand_id'),
+    ).values(
+        'pk', 'ship_id', 'brand_id', 'start_date', 'status', 'capacity',
+        'cabins_sold', 'booked_passengers', 'cabins_available'
+    )
+    stale.delete()
+    SessionOccupancy.objects.bulk_create(
+        [
+            SessionOccupancy(
+                cruise_session_id=row['pk'],
+                ship_id=row['ship_id'],
+                brand_id=row['brand_id'],
+                start_date=row['start_date'],
+                status=row['status'],
+                cabins_sold=row['cabins_sold'],
+                cabins_available=row['cabins_available'],
+                passengers=row['booked_passengers'],
+                passenger_capacity=row['capacity'],
+            )
+            for row in rows
+        ],
+        batch_size=1000
+    )
+
+
+def build_rollups(full=False):
+    """
+    Bring the rollups up to date; returns the sets of days and session ids
+    recomputed, both None for a full rebuild.
+    """
+    started = timezone.now()
+    with transaction.atomic():
+        if full:
+            days = session_ids = None
+            StaleRollup.objects.all().delete()
+        else:
+            bookings = _changed_since_watermark(Booking, 'bookings')
+            days = set(
+                bookings.annotate(day=TruncDate('created_at')).values_list('day', flat=True).distinct()
+            )
+            session_ids = set(bookings.values_list('cruise_session_id', flat=True).distinct())
+            session_ids.update(
+                _changed_since_watermark(CruiseSession, 'sessions').values_list('pk', flat=True)
+            )
+            session_ids.update(
+                _changed_since_watermark(CruiseSessionCabinPrice, 'cabin_prices').values_list(
+                    'cruise_session_id', flat=True
+                ).distinct()
+            )
+            stale = list(StaleRollup.objects.values_list('pk', 'day', 'cruise_session_id'))
+            days.update(day for _pk, day, _session_id in stale)
+            session_ids.update(session_id for _pk, _day, session_id in stale)
+            StaleRollup.objects.filter(pk__in=[pk for pk, _day, _session_id in stale]).delete()
+        if days is None or days:
+            rebuild_daily_rollups(days)
+        if session_ids is None or session_ids:
+            rebuild_occupancy(session_ids)
+        for name in ['bookings', 'sessions', 'cabin_prices']:
+            RollupWatermark.objects.update_or_create(name=name, defaults={'value': started})
+    return days, session_ids
+
+
+def _occupancy(row):
+    cabins = row['cabins_sold'] + row['cabins_available']
+    row['occupancy'] = round(100 * row['cabins_sold'] / cabins) if cabins else None
+    return row
+
+
+def dashboard_data(days=30, today=None):
+    """Figures of the booking dashboard, read from the rollup tables only"""
+    today = today or timezone.now().date()
+    since = today - timedelta(days=days - 1)
+    totals = {total: Sum(total) for total in DAILY_TOTALS}
+    occupancy = {
+        'cabins_sold': Sum('cabins_sold'),
+        'cabins_available': Sum('cabins_available'),
+        'passengers': Sum('passengers'),
+        'passenger_capacity': Sum('passenger_capacity'),
+    }
+    upcoming = SessionOccupancy.objects.filter(start_date__gte=today).exclude(status='cancelled')
+    return {
+        'since': since,
+        'totals': ShipDailyRollup.objects.filter(day__gte=since).aggregate(**totals),
+        'by_day': ShipDailyRollup.objects.filter(day__gte=since).values('day').annotate(
+            **totals
+        ).order_by('day'),
+        'by_ship': ShipDailyRollup.objects.filter(day__gte=since).values('ship__name').annotate(
+            **totals
+        ).order_by('-revenue'),
+        'by_brand': BrandDailyRollup.objects.filter(day__gte=since).values('brand__name').annotate(
+            **totals
+        ).order_by('-revenue'),
+        'top_sessions': SessionDailyRollup.objects.filter(day__gte=since).values(
+            'cruise_session__cruise__name', 'cruise_session__start_date'
+        ).annotate(**totals).order_by('-revenue')[:10],
+        'occupancy_by_ship': [
+            _occupancy(row) for row in upcoming.values('ship__name').annotate(**occupancy).order_by('ship__name')
+        ],
+        'occupancy_by_brand': [
+            _occupancy(row) for row in upcoming.exclude(brand=None).values('brand__name').annotate(
+                **occupancy
+            ).order_by('brand__name')
+        ],
+        'built_at': RollupWatermark.objects.filter(name='bookings').values_list('value', flat=True).first(),
+    }
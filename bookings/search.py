@@ -0,0 +1,132 @@
+# bookings/search.py
+"""
+Admin search for bookings and quotes through an indexed text table.
+
+Each booking and quote has one SearchDocument holding its confirmation
+number, cruise, customer and passenger names. A search term becomes a
+prefix query against the FTS5 table (SQLite) or the tsvector GIN index
+(PostgreSQL) instead of icontains lookups across the passenger joins,
+which need DISTINCT and a full scan. Documents are rewritten after the
+transaction that changed their booking, quote or passengers commits;
+``python manage.py rebuild_search_index`` rebuilds them all, e.g. after a
+cruise was renamed.
+"""
+import re
+from functools import partial
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from quotes.models import Quote, QuotePassenger
+from .models import Booking, Passenger, SearchDocument
+
+MAX_SEARCH_TERMS = 10
+
+# kind: (model, its own fields, passenger model, passenger foreign key)
+INDEXED = {
+    SearchDocument.Kind.BOOKING: (
+        Booking,
+        ('confirmation_number', 'cruise_session__cruise__name', 'user__username', 'user__email'),
+        Passenger,
+        'booking'
+    ),
+    SearchDocument.Kind.QUOTE: (
+        Quote,
+        ('cruise_session__cruise__name', 'cabin_category__name', 'user__username', 'user__email'),
+        QuotePassenger,
+        'quote'
+    ),
+}
+
+
+def build_documents(kind, object_ids):
+    """``{object_id: content}`` for the existing objects among ``object_ids``"""
+    model, fields, passenger_model, parent_field = INDEXED[kind]
+    documents = {
+        row[0]: [value for value in row[1:] if value]
+        for row in model._base_manager.filter(pk__in=object_ids).values_list('pk', *fields)
+    }
+    for parent_id, *values in passenger_model.objects.filter(
+        **{f'{parent_field}_id__in': documents}
+    ).values_list(f'{parent_field}_id', 'first_name', 'last_name', 'email'):
+        documents[parent_id].extend(value for value in values if value)
+    return {object_id: ' '.join(values) for object_id, values in documents.items()}
+
+
+def index_documents(kind, object_ids):
+    """Rewrite the documents of ``object_ids``; those of deleted objects are removed"""
+    object_ids = set(object_ids)
+    documents = build_documents(kind, object_ids)
+    SearchDocument.objects.bulk_create(
+        [
+            SearchDocument(kind=kind, object_id=object_id, content=content)
+            for object_id, content in documents.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['kind', 'object_id'],
+        update_fields=['content', 'updated_at']
+    )
+    deleted = object_ids - documents.keys()
+    if deleted:
+        SearchDocument.objects.filter(kind=kind, object_id__in=deleted).delete()
+
+
+def schedule_index(kind, object_id):
+    """Index an object once the current transaction commits"""
+    transaction.on_commit(partial(index_documents, kind, [object_id]))
+
+
+def _terms(search_term):
+    return re.findall(r'\w+', search_term)[:MAX_SEARCH_TERMS]
+
+
+def matching_ids(kind, search_term):
+    """
+    Expression for the ids of the objects whose document contains every word
+    of ``search_term`` as a word prefix, for use in a ``pk__in`` lookup.
+    """
+    terms = _terms(search_term)
+    if connection.vendor == 'sqlite':
+        return RawSQL(
+            "SELECT d.object_id FROM bookings_searchdocument_fts f "
+            "JOIN bookings_searchdocument d ON d.id = f.rowid "
+            "WHERE bookings_searchdocument_fts MATCH %s AND d.kind = %s",
+            (' '.join(f'"{term}"*' for term in terms), kind)
+        )
+    if connection.vendor == 'postgresql':
+        return RawSQL(
+            "SELECT object_id FROM bookings_searchdocument "
+            "WHERE kind = %s AND to_tsvector('simple', content) @@ to_tsquery('simple', %s)",
+            (kind, ' & '.join(f'{term}:*' for term in terms))
+        )
+    # Other databases have no text index here; the documents still avoid the joins
+    documents = SearchDocument.objects.filter(kind=kind)
+    for term in terms:
+        documents = documents.filter(content__icontains=term)
+    return documents.values('object_id')
+
+
+class IndexedSearchMixin:
+    """
+    ModelAdmin search through the search documents. ``search_index_kind``
+    names the indexed model and ``search_index_lookup`` the path from the
+    admin's model to its id; ``search_index_own_fields`` are fields of the
+    admin's own table searched with icontains besides the index.
+    ``search_fields`` only has to be set for the admin to show the search box.
+    """
+    search_index_kind = None
+    search_index_lookup = 'pk'
+    search_index_own_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        if not _terms(search_term):
+            return queryset.none(), False
+        condition = Q(**{
+            f'{self.search_index_lookup}__in': matching_ids(self.search_index_kind, search_term)
+        })
+        for field in self.search_index_own_fields:
+            condition |= Q(**{f'{field}__icontains': search_term})
+        return queryset.filter(condition), False
@@ -0,0 +1,121 @@
+# bookings/services.py
+"""
+Booking totals computed in the database.
+
+The passenger count and the service and excursion sums of a booking are
+annotated as subqueries, so any number of bookings is priced with one query
+instead of a COUNT per per-person service and per excursion.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from cruises import pricing
+from .models import Booking, BookingAdditionalService, ExcursionBooking, Passenger
+
+AMOUNT = DecimalField(max_digits=12, decimal_places=2)
+PRICE_COMPONENTS = (
+    'passenger_total', 'fixed_services_total', 'per_person_services_total', 'excursions_total'
+)
+
+
+def _booking_sum(queryset, booking_field, amount):
+    """Subquery summing ``amount`` over ``queryset`` rows of the outer booking"""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{booking_field: OuterRef('pk')}).order_by().values(
+                booking_field
+            ).annotate(total=Sum(amount, output_field=AMOUNT)).values('total'),
+            output_field=AMOUNT
+        ),
+        Value(Decimal('0.00')),
+        output_field=AMOUNT
+    )
+
+
+def with_price_components(bookings):
+    """
+    Annotate the parts of a booking's total: ``passenger_total``,
+    ``fixed_services_total``, ``per_person_services_total`` (price per
+    passenger) and ``excursions_total``.
+    """
+    services = BookingAdditionalService.objects.all()
+    return bookings.annotate(
+        passenger_total=Coalesce(
+            Subquery(
+                Passenger.objects.filter(booking=OuterRef('pk')).order_by().values(
+                    'booking'
+                ).annotate(total=Count('pk')).values('total')
+            ),
+            0
+        ),
+        fixed_services_total=_booking_sum(
+            services.filter(is_per_person=False), 'booking', F('price') * F('quantity')
+        ),
+        per_person_services_total=_booking_sum(
+            services.filter(is_per_person=True), 'booking', F('price') * F('quantity')
+        ),
+        # One through row per passenger booked on an excursion
+        excursions_total=_booking_sum(
+            ExcursionBooking.passengers.through.objects.all(),
+            'excursionbooking__booking',
+            F('excursionbooking__cruise_excursion__excursion__price')
+        ),
+    )
+
+
+def services_total(booking):
+    """Services and excursions of a booking annotated by with_price_components"""
+    return pricing.round_price(
+        booking.fixed_services_total +
+        booking.per_person_services_total * booking.passenger_total +
+        booking.excursions_total
+    )
+
+
+def price_booking(booking, today=None):
+    """PriceBreakdown of an annotated booking; keeps its locked discount without a running promotion"""
+    return pricing.calculate_total(
+        booking.base_price,
+        promotion=booking.applied_promotion,
+        services_total=services_total(booking),
+        locked_discount=booking.discount_amount,
+        today=today
+    )
+
+
+def recalculate_totals(bookings, batch_size=500, today=None):
+    """
+    Recompute ``total_price`` and ``discount_amount`` of many bookings.
+
+    Per batch of ``batch_size`` bookings: one query for the bookings with
+    their price components and promotions, one bulk UPDATE of those whose
+    total changed. Returns the number of bookings updated.
+    """
+    updated = 0
+    today = today or timezone.now().date()
+    bookings = with_price_components(
+        bookings.select_related(None).select_related('applied_promotion')
+    ).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(bookings.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return updated
+        last_pk = batch[-1].pk
+
+        changed = []
+        now = timezone.now()
+        for booking in batch:
+            breakdown = price_booking(booking, today)
+            if (booking.total_price, booking.discount_amount) != (
+                breakdown.total_price, breakdown.discount_amount
+            ):
+                booking.total_price = breakdown.total_price
+                booking.discount_amount = breakdown.discount_amount
+                booking.updated_at = now
+                changed.append(booking)
+        Booking.objects.bulk_update(changed, ['total_price', 'discount_amount', 'updated_at'])
+        updated += len(changed)
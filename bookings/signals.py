@@ -0,0 +1,57 @@
+# bookings/signals.py
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from cruises.models import refresh_passenger_summaries
+from .models import Booking, Passenger, SearchDocument, StaleRollup
+from .search import schedule_index
+
+
+def deleted_with_parent(origin, parent_model):
+    """Whether a delete started from ``parent_model`` rows, which takes their passengers along"""
+    return isinstance(origin, parent_model) or (
+        isinstance(origin, QuerySet) and origin.model is parent_model
+    )
+
+
+def sync_passenger_summary(passenger, parent_field):
+    """Refresh the summary of a passenger's Booking or Quote after it was saved or deleted"""
+    field = passenger._meta.get_field(parent_field)
+    parent_model = field.related_model
+    refresh_passenger_summaries(
+        parent_model._base_manager.filter(pk=getattr(passenger, field.attname))
+    )
+    if field.is_cached(passenger):
+        getattr(passenger, parent_field).refresh_from_db(fields=parent_model.SUMMARY_FIELDS)
+
+
+@receiver([post_save, post_delete], sender=Booking)
+def booking_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_index(SearchDocument.Kind.BOOKING, instance.pk)
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted(sender, instance, **kwargs):
+    # Same day as the TruncDate('created_at') grouping of bookings.rollups
+    StaleRollup.objects.create(
+        day=timezone.localdate(instance.created_at),
+        cruise_session_id=instance.cruise_session_id
+    )
+
+
+@receiver(post_save, sender=Passenger)
+def passenger_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        sync_passenger_summary(instance, 'booking')
+        schedule_index(SearchDocument.Kind.BOOKING, instance.booking_id)
+
+
+@receiver(post_delete, sender=Passenger)
+def passenger_deleted(sender, instance, origin=None, **kwargs):
+    # Passengers deleted along with their booking leave nothing to update
+    if not deleted_with_parent(origin, Booking):
+        sync_passenger_summary(instance, 'booking')
+        schedule_index(SearchDocument.Kind.BOOKING, instance.booking_id)
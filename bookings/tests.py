@@ -1,3 +1,433 @@
-from django.test import TestCase
+from datetime import date, time, timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from cruises.inventory import reserve_cabins
+from cruises.models import CruiseExcursion, CruiseSession, CruiseSessionCabinPrice, Excursion
+from cruises.tests import create_cabin_price, create_promotion
+from quotes.models import Quote, QuotePassenger
+from quotes.tests import create_quote
+from .models import (
+    Booking,
+    BookingAdditionalService,
+    ExcursionBooking,
+    Passenger,
+    SearchDocument,
+    SessionDailyRollup,
+    SessionOccupancy,
+    ShipDailyRollup,
+    StaleRollup,
+)
+from .rollups import build_rollups
+from .services import price_booking, recalculate_totals, with_price_components
+
+
+class BookingAdminChangelistTest(TestCase):
+    def setUp(self):
+        self.cabin_price = create_cabin_price(available_cabins=10)
+        self.client.force_login(
+            User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        )
+
+    def create_bookings(self, count):
+        Booking.objects.bulk_create([
+            Booking(
+                cruise_session_id=self.cabin_price.cruise_session_id,
+                cabin_category_id=self.cabin_price.cabin_category_id,
+                base_price=Decimal('999.00'),
+                total_price=Decimal('999.00'),
+                lead_passenger_name=f'Guest {i}',
+                passenger_count=1
+            )
+            for i in range(count)
+        ])
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:bookings_booking_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Guest ')
+        return len(queries.captured_queries)
+
+    def test_query_count_does_not_grow_with_bookings(self):
+        self.create_bookings(10)
+        queries_for_ten = self.changelist_queries()
+        self.create_bookings(990)
+        self.assertEqual(self.changelist_queries(), queries_for_ten)
+
+
+class BookingCancelTest(TestCase):
+    def setUp(self):
+        self.cabin_price = create_cabin_price(available_cabins=5)
+
+    def create_booking(self, cabin_reserved):
+        if cabin_reserved:
+            reserve_cabins(self.cabin_price.cruise_session_id, self.cabin_price.cabin_category_id)
+        return Booking.objects.create(
+            cruise_session_id=self.cabin_price.cruise_session_id,
+            cabin_category_id=self.cabin_price.cabin_category_id,
+            base_price=Decimal('999.00'),
+            total_price=Decimal('999.00'),
+            cabin_reserved=cabin_reserved
+        )
+
+    def available_cabins(self):
+        self.cabin_price.refresh_from_db()
+        return self.cabin_price.available_cabins
+
+    def test_cancel_gives_back_the_reserved_cabin_once(self):
+        booking = self.create_booking(cabin_reserved=True)
+        self.assertEqual(self.available_cabins(), 4)
+        stale_copy = Booking.objects.get(pk=booking.pk)
+        booking.cancel('Changed plans')
+        self.assertEqual(self.available_cabins(), 5)
+        self.assertFalse(Booking.objects.get(pk=booking.pk).cabin_reserved)
+        # A second cancellation from a copy loaded earlier finds no cabin to give back
+        stale_copy.cancel()
+        self.assertEqual(self.available_cabins(), 5)
+
+    def test_cancel_without_reserved_cabin_leaves_inventory_alone(self):
+        self.create_booking(cabin_reserved=False).cancel()
+        self.assertEqual(self.available_cabins(), 5)
+
+
+class BookingSearchTest(TestCase):
+    def setUp(self):
+        self.cabin_price = create_cabin_price(available_cabins=10)
+        self.client.force_login(
+            User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        )
+
+    def create_booking(self, last_name):
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = Booking.objects.create(
+                cruise_session_id=self.cabin_price.cruise_session_id,
+                cabin_category_id=self.cabin_price.cabin_category_id,
+                base_price=Decimal('999.00'),
+                total_price=Decimal('999.00')
+            )
+            Passenger.objects.create(
+                booking=booking, first_name='Anna', last_name=last_name,
+                email='anna@example.com', phone='123', date_of_birth=date(1980, 1, 1),
+                nationality='LU', passport_number='P1', passport_expiry_date=date(2035, 1, 1),
+                passport_issued_country='LU', is_lead_passenger=True
+            )
+        return booking
+
+    def search(self, term):
+        response = self.client.get(reverse('admin:bookings_booking_changelist'), {'q': term})
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['cl'].result_list)
+
+    def test_finds_booking_by_passenger_name_prefix(self):
+        booking = self.create_booking('Schmitt')
+        self.create_booking('Weber')
+        self.assertEqual(self.search('schmi'), [booking])
+        self.assertEqual(self.search('anna schmitt'), [booking])
+        self.assertEqual(self.search('muller'), [])
+
+    def test_passenger_changes_update_the_index(self):
+        booking = self.create_booking('Schmitt')
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.passengers.update(last_name='Hoffmann')
+            booking.passengers.get().save()
+        self.assertEqual(self.search('hoffmann'), [booking])
+        self.assertEqual(self.search('schmitt'), [])
+
+
+class PassengerSummaryTest(TestCase):
+    def setUp(self):
+        self.cabin_price = create_cabin_price(available_cabins=10)
+        self.booking = Booking.objects.create(
+            cruise_session_id=self.cabin_price.cruise_session_id,
+            cabin_category_id=self.cabin_price.cabin_category_id,
+            base_price=Decimal('999.00'),
+            total_price=Decimal('999.00')
+        )
+
+    def add_passenger(self, first_name, last_name, is_lead_passenger=False):
+        return Passenger.objects.create(
+            booking=self.booking, first_name=first_name, last_name=last_name,
+            email='guest@example.com', phone='123', date_of_birth=date(1980, 1, 1),
+            nationality='LU', passport_number='P1', passport_expiry_date=date(2035, 1, 1),
+            passport_issued_country='LU', is_lead_passenger=is_lead_passenger
+        )
+
+    def summary(self, obj):
+        obj.refresh_from_db(fields=obj.SUMMARY_FIELDS)
+        return obj.lead_passenger_name, obj.passenger_count
+
+    def test_passenger_signals_refresh_the_summary(self):
+        self.add_passenger('Zoe', 'Adams')
+        lead = self.add_passenger('Anna', 'Schmitt', is_lead_passenger=True)
+        self.assertEqual(self.summary(self.booking), ('Anna Schmitt', 2))
+        lead.delete()
+        self.assertEqual(self.summary(self.booking), ('Zoe Adams', 1))
+
+        quote = create_quote(self.cabin_price)
+        QuotePassenger.objects.create(
+            quote=quote, first_name='Anna', last_name='Weber', email='anna@example.com', phone='123'
+        )
+        self.assertEqual(self.summary(quote), ('Anna Weber', 1))
+
+    def test_admin_save_of_a_stale_copy_keeps_the_summary(self):
+        stale = Booking.objects.get(pk=self.booking.pk)
+        self.add_passenger('Anna', 'Schmitt', is_lead_passenger=True)
+        stale.internal_notes = 'Window table'
+        admin.site._registry[Booking].save_model(None, stale, None, True)
+        self.assertEqual(self.summary(self.booking), ('Anna Schmitt', 1))
+        self.assertEqual(Booking.objects.get(pk=self.booking.pk).internal_notes, 'Window table')
+
+    def test_backfill_command_recomputes_summaries(self):
+        self.add_passenger('Anna', 'Schmitt', is_lead_passenger=True)
+        quote = create_quote(self.cabin_price)
+        QuotePassenger.objects.create(
+            quote=quote, first_name='Anna', last_name='Weber', email='anna@example.com', phone='123'
+        )
+        Booking.objects.update(lead_passenger_name='', passenger_count=0)
+        Quote.objects.update(lead_passenger_name='', passenger_count=0)
+
+        output = StringIO()
+        call_command('backfill_passenger_summaries', batch_size=1, stdout=output)
+        self.assertEqual(self.summary(self.booking), ('Anna Schmitt', 1))
+        self.assertEqual(self.summary(quote), ('Anna Weber', 1))
+        self.assertIn('Bookings updated: 1', output.getvalue())
+
+
+class BookingPricingTest(TestCase):
+    def setUp(self):
+        self.cabin_price = create_cabin_price(available_cabins=10)
+        session = self.cabin_price.cruise_session
+        excursion = Excursion.objects.create(
+            name='City Walk', description='Test', port=session.embarkation_port,
+            duration=timedelta(hours=3), maximum_participants=20, price=Decimal('45.50'),
+            meeting_point='Pier'
+        )
+        self.cruise_excursion = CruiseExcursion.objects.create(
+            cruise=session.cruise, excursion=excursion, available_date=session.start_date,
+            departure_time=time(9), available_spots=20
+        )
+
+    def create_booking(self, passengers=2, services=(), excursion_passengers=0, promotion=None,
+                       discount_amount=Decimal('0.00')):
+        """``services`` are (price, quantity, is_per_person) tuples"""
+        booking = Booking.objects.create(
+            cruise_session_id=self.cabin_price.cruise_session_id,
+            cabin_category_id=self.cabin_price.cabin_category_id,
+            base_price=Decimal('999.00'),
+            total_price=Decimal('0.00'),
+            applied_promotion=promotion,
+            discount_amount=discount_amount
+        )
+        booked = [
+            Passenger.objects.create(
+                booking=booking, first_name='Guest', last_name=str(i),
+                email='guest@example.com', phone='123', date_of_birth=date(1980, 1, 1),
+                nationality='LU', passport_number=f'P{i}', passport_expiry_date=date(2035, 1, 1),
+                passport_issued_country='LU', is_lead_passenger=i == 0
+            )
+            for i in range(passengers)
+        ]
+        BookingAdditionalService.objects.bulk_create([
+            BookingAdditionalService(
+                booking=booking, service_name='Service', description='Test',
+                price=price, quantity=quantity, is_per_person=is_per_person
+            )
+            for price, quantity, is_per_person in services
+        ])
+        if excursion_passengers:
+            excursion_booking = ExcursionBooking.objects.create(
+                booking=booking, cruise_excursion=self.cruise_excursion
+            )
+            excursion_booking.passengers.set(booked[:excursion_passengers])
+        return booking
+
+    def per_object_total(self, booking):
+        """Total as it was computed one service and one excursion at a time"""
+        booking = Booking.objects.get(pk=booking.pk)
+        discount = booking.discount_amount
+        if booking.applied_promotion and booking.applied_promotion.is_active():
+            discount = booking.base_price * booking.applied_promotion.discount_value / 100
+        return (
+            booking.base_price +
+            sum(service.total_price for service in booking.additional_services.all()) +
+            sum(excursion.total_price for excursion in booking.excursion_bookings.all()) -
+            discount
+        )
+
+    def create_priced_bookings(self):
+        expired = create_promotion()
+        expired.start_date = expired.end_date = timezone.now().date() - timedelta(days=1)
+        expired.save()
+        return [
+            self.create_booking(
+                services=[(Decimal('30.00'), 2, True), (Decimal('80.00'), 1, False)],
+                excursion_passengers=2
+            ),
+            self.create_booking(passengers=3, services=[(Decimal('12.50'), 1, True)], excursion_passengers=1),
+            self.create_booking(passengers=1),
+            self.create_booking(promotion=create_promotion(), services=[(Decimal('10.00'), 1, False)]),
+            self.create_booking(promotion=expired, discount_amount=Decimal('50.00'), excursion_passengers=2),
+        ]
+
+    def test_annotated_totals_match_the_per_object_calculation(self):
+        bookings = self.create_priced_bookings()
+        annotated = with_price_components(Booking.objects.filter(pk__in=[b.pk for b in bookings]))
+        for booking in annotated:
+            with self.subTest(booking=booking.pk):
+                self.assertEqual(price_booking(booking).total_price, self.per_object_total(booking))
+
+    def test_locked_discount_is_kept_without_a_running_promotion(self):
+        booking = self.create_priced_bookings()[-1]
+        breakdown = price_booking(with_price_components(Booking.objects.filter(pk=booking.pk)).get())
+        self.assertEqual(breakdown.discount_amount, Decimal('50.00'))
+        self.assertEqual(breakdown.total_price, Decimal('1040.00'))
+
+    def test_recalculate_totals_updates_only_changed_bookings(self):
+        bookings = self.create_priced_bookings()
+        self.assertEqual(recalculate_totals(Booking.objects.all(), batch_size=2), len(bookings))
+        for booking in bookings:
+            booking.refresh_from_db()
+            self.assertEqual(booking.total_price, self.per_object_total(booking))
+        self.assertEqual(recalculate_totals(Booking.objects.all()), 0)
+
+    def test_command_reports_updated_bookings(self):
+        self.create_priced_bookings()
+        Booking.objects.filter(applied_promotion__isnull=False).update(status=Booking.Status.CANCELLED)
+        out = StringIO()
+        call_command('recalculate_totals', stdout=out)
+        self.assertIn('Booking totals updated: 3 in', out.getvalue())
+        self.assertEqual(Booking.objects.filter(total_price=0).count(), 2)
+
+    def test_query_count_does_not_grow_with_bookings(self):
+        def recalculate_queries(count):
+            Booking.objects.all().delete()
+            for i in range(count):
+                self.create_booking(services=[(Decimal('30.00'), 1, True)], excursion_passengers=1)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(recalculate_totals(Booking.objects.all()), count)
+            return len(queries.captured_queries)
+
+        self.assertEqual(recalculate_queries(50), recalculate_queries(5))
+
+
+class SearchBackfillMigrationTest(TransactionTestCase):
+    before = [('bookings', '0006_stalerollup')]
+    after = [('bookings', '0007_backfill_search_documents')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+
+    def test_existing_bookings_and_quotes_are_searchable_after_migrating(self):
+        self.migrate(self.before)
+        cabin_price = create_cabin_price(available_cabins=10)
+        booking = Booking.objects.create(
+            cruise_session_id=cabin_price.cruise_session_id,
+            cabin_category_id=cabin_price.cabin_category_id,
+            base_price=Decimal('999.00'),
+            total_price=Decimal('999.00')
+        )
+        Passenger.objects.create(
+            booking=booking, first_name='Anna', last_name='Schmitt',
+            email='anna@example.com', phone='123', date_of_birth=date(1980, 1, 1),
+            nationality='LU', passport_number='P1', passport_expiry_date=date(2035, 1, 1),
+            passport_issued_country='LU', is_lead_passenger=True
+        )
+        quote = create_quote(cabin_price)
+        QuotePassenger.objects.create(
+            quote=quote, first_name='Paul', last_name='Weber', email='paul@example.com', phone='123'
+        )
+        # Rows written before the search documents existed
+        SearchDocument.objects.all().delete()
+
+        self.migrate(self.after)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.get(reverse('admin:bookings_booking_changelist'), {'q': 'schmi'})
+        self.assertEqual(list(response.context['cl'].result_list), [booking])
+        response = self.client.get(reverse('admin:quotes_quote_changelist'), {'q': 'paul weber'})
+        self.assertEqual(list(response.context['cl'].result_list), [quote])
+
+
+class RollupTest(TestCase):
+    def setUp(self):
+        self.cabin_price = create_cabin_price(available_cabins=10)
+        reserve_cabins(self.cabin_price.cruise_session_id, self.cabin_price.cabin_category_id, 2)
+        self.bookings = Booking.objects.bulk_create([
+            Booking(
+                cruise_session_id=self.cabin_price.cruise_session_id,
+                cabin_category_id=self.cabin_price.cabin_category_id,
+                base_price=Decimal('999.00'),
+                total_price=Decimal('1998.00'),
+                amount_paid=Decimal('500.00'),
+                passenger_count=2,
+                status=Booking.Status.CONFIRMED,
+                cabin_reserved=True
+            )
+            for i in range(2)
+        ])
+
+    def test_incremental_build_picks_up_changed_bookings(self):
+        build_rollups()
+        session_day = SessionDailyRollup.objects.get()
+        self.assertEqual(
+            (session_day.bookings, session_day.passengers, session_day.revenue, session_day.amount_paid),
+            (2, 4, Decimal('3996.00'), Decimal('1000.00'))
+        )
+        occupancy = SessionOccupancy.objects.get()
+        self.assertEqual((occupancy.cabins_sold, occupancy.cabins_available), (2, 8))
+
+        self.bookings[0].cancel()
+        days, session_ids = build_rollups()
+        self.assertEqual(session_ids, {self.cabin_price.cruise_session_id})
+        self.assertEqual(ShipDailyRollup.objects.get().revenue, Decimal('1998.00'))
+        occupancy = SessionOccupancy.objects.get()
+        self.assertEqual((occupancy.cabins_sold, occupancy.cabins_available), (1, 9))
+
+    def test_incremental_build_picks_up_deleted_bookings(self):
+        build_rollups()
+        # Out of the watermark overlap, so only the deletion marks the session
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        for model in (Booking, CruiseSession, CruiseSessionCabinPrice):
+            model.objects.update(updated_at=an_hour_ago)
+        self.assertEqual(build_rollups(), (set(), set()))
+
+        self.bookings[0].delete()
+        self.assertEqual(StaleRollup.objects.count(), 1)
+        days, session_ids = build_rollups()
+        self.assertEqual((days, session_ids), ({timezone.localdate()}, {self.cabin_price.cruise_session_id}))
+        self.assertEqual(SessionDailyRollup.objects.get().bookings, 1)
+        self.assertEqual(SessionOccupancy.objects.get().cabins_sold, 1)
+        self.assertFalse(StaleRollup.objects.exists())
+
+    def test_occupancy_counts_only_reserved_cabins(self):
+        Booking.objects.create(
+            cruise_session_id=self.cabin_price.cruise_session_id,
+            cabin_category_id=self.cabin_price.cabin_category_id,
+            base_price=Decimal('999.00'),
+            total_price=Decimal('999.00'),
+            passenger_count=1,
+            status=Booking.Status.CONFIRMED
+        )
+        build_rollups()
+        occupancy = SessionOccupancy.objects.get()
+        self.assertEqual((occupancy.cabins_sold, occupancy.cabins_available, occupancy.passengers), (2, 8, 5))
+
+    def test_dashboard_reads_only_rollups(self):
+        build_rollups()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:bookings_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '3996')
+        self.assertFalse(any('"bookings_booking"' in query['sql'] for query in queries.captured_queries))
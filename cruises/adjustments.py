@@ -0,0 +1,171 @@
+# cruises/adjustments.py
+"""
+Tariff changes applied to many session cabin prices at once.
+
+A change is one UPDATE of the selected rows with the new value computed in
+SQL from the old one (F expressions, rounded to cents), so repricing a
+whole ship or season does not load a single row. The preview is one
+aggregate query over the same expressions, which also counts the rows the
+change would take below zero or past the largest value the column holds;
+a change with such rows is rejected. Applying a change bumps the rows'
+``version`` and stores a PriceAdjustment record.
+"""
+from decimal import Decimal
+from functools import partial, reduce
+from operator import or_
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import Round
+from django.db.models.lookups import GreaterThan, LessThan
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from . import pricing
+from .models import CruiseSessionCabinPrice, PriceAdjustment
+
+ADJUSTABLE_FIELDS = ['price', 'regular_price', 'single_supplement']
+# Stored as percentages of the price: only changed by a percentage of themselves
+PERCENTAGE_FIELDS = ['single_supplement']
+
+
+class AdjustmentOutOfRange(ValueError):
+    """Raised when a change would take cabin prices outside the values their fields hold"""
+
+
+def select_cabin_prices(ship=None, cruise=None, deck=None, start_from=None, start_until=None):
+    """Cabin prices of sessions starting in the date range, optionally of one ship, cruise or deck"""
+    cabin_prices = CruiseSessionCabinPrice.objects.all()
+    if ship:
+        cabin_prices = cabin_prices.filter(cruise_session__cruise__ship=ship)
+    if cruise:
+        cabin_prices = cabin_prices.filter(cruise_session__cruise=cruise)
+    if deck:
+        cabin_prices = cabin_prices.filter(cabin_category__deck=deck)
+    if start_from:
+        cabin_prices = cabin_prices.filter(cruise_session__start_date__gte=start_from)
+    if start_until:
+        cabin_prices = cabin_prices.filter(cruise_session__start_date__lte=start_until)
+    return cabin_prices
+
+
+def amount_change_error(fields, change_type):
+    """Why an amount cannot be added to ``fields``, or None"""
+    if change_type == PriceAdjustment.ChangeType.AMOUNT:
+        percentages = [field for field in fields if field in PERCENTAGE_FIELDS]
+        if percentages:
+            return _("%(fields)s can only be changed by a percentage.") % {
+                'fields': ', '.join(
+                    str(CruiseSessionCabinPrice._meta.get_field(field).verbose_name).capitalize()
+                    for field in percentages
+                )
+            }
+    return None
+
+
+def largest_value(output_field):
+    """Largest value a DecimalField holds, e.g. 999.99 for max_digits=5, decimal_places=2"""
+    places = output_field.decimal_places
+    return Decimal(10) ** (output_field.max_digits - places) - Decimal(10) ** -places
+
+
+def adjusted_value(field, change_type, value):
+    """Expression for ``field`` changed by ``value`` percent or by the amount ``value``"""
+    error = amount_change_error([field], change_type)
+    if error:
+        raise ValueError(error)
+    output_field = CruiseSessionCabinPrice._meta.get_field(field)
+    if change_type == PriceAdjustment.ChangeType.PERCENT:
+        # One factor: SQLite keeps whole prices as integers and would divide them as such
+        changed = F(field) * Value((100 + value) / 100)
+    else:
+        changed = F(field) + Value(value)
+    return Round(changed, 2, output_field=output_field)
+
+
+def out_of_range(field, new_value):
+    """Condition for rows where ``new_value`` is below zero or past the largest value ``field`` holds"""
+    output_field = CruiseSessionCabinPrice._meta.get_field(field)
+    return Q(LessThan(new_value, Value(pricing.ZERO))) | Q(
+        GreaterThan(new_value, Value(largest_value(output_field)))
+    )
+
+
+def out_of_range_error(rows):
+    return _(
+        "The change would take %(rows)d cabin price(s) below zero or past the largest value "
+        "their fields hold; nothing was changed."
+    ) % {'rows': rows}
+
+
+def preview_adjustment(cabin_prices, fields, change_type, value):
+    """
+    What a change would do, from one aggregate query: ``{'rows': n,
+    'out_of_range': n, 'totals': {field: {'before', 'after', 'lowest',
+    'highest'}}}`` where before/after are sums over the rows and
+    lowest/highest the new values.
+    """
+    aggregates = {}
+    conditions = []
+    for field in fields:
+        new_value = adjusted_value(field, change_type, value)
+        conditions.append(out_of_range(field, new_value))
+        aggregates.update({
+            f'{field}__before': Sum(field),
+            f'{field}__after': Sum(new_value),
+            f'{field}__lowest': Min(new_value),
+            f'{field}__highest': Max(new_value),
+        })
+    result = cabin_prices.order_by().aggregate(
+        rows=Count('pk'),
+        out_of_range=Count('pk', filter=reduce(or_, conditions)),
+        **aggregates
+    )
+    rows, out_of_range_rows = result.pop('rows'), result.pop('out_of_range')
+    totals = {field: {} for field in fields}
+    for key, amount in result.items():
+        field, figure = key.split('__')
+        totals[field][figure] = None if amount is None else pricing.round_price(amount)
+    return {'rows': rows, 'out_of_range': out_of_range_rows, 'totals': totals}
+
+
+def invalidate_price_snapshots(session_ids):
+    # Import here to avoid circular import
+    from quotes.services import price_snapshot_key
+
+    cache.delete_many([price_snapshot_key(session_id) for session_id in session_ids])
+
+
+def apply_adjustment(cabin_prices, fields, change_type, value, filters=None, user=None):
+    """
+    Change ``fields`` of all ``cabin_prices`` in one UPDATE and record it as
+    a PriceAdjustment, returned. ``filters`` describes the selection for
+    the record. Quote price snapshots of the sessions are dropped on commit.
+    Raises AdjustmentOutOfRange, changing nothing, if any row would leave
+    the values its fields hold.
+    """
+    with transaction.atomic():
+        preview = preview_adjustment(cabin_prices, fields, change_type, value)
+        if preview['out_of_range']:
+            raise AdjustmentOutOfRange(out_of_range_error(preview['out_of_range']))
+        session_ids = set(cabin_prices.values_list('cruise_session_id', flat=True))
+        rows_updated = cabin_prices.update(
+            **{field: adjusted_value(field, change_type, value) for field in fields},
+            version=F('version') + 1,
+            updated_at=timezone.now()
+        )
+        adjustment = PriceAdjustment.objects.create(
+            fields=list(fields),
+            change_type=change_type,
+            value=value,
+            filters=filters or {},
+            rows_updated=rows_updated,
+            totals={
+                field: {figure: str(amount) for figure, amount in figures.items() if amount is not None}
+                for field, figures in preview['totals'].items()
+            },
+            created_by=user
+        )
+        transaction.on_commit(partial(invalidate_price_snapshots, session_ids))
+    return adjustment
@@ -1,18 +1,29 @@
 # cruises/admin.py
+import json
+
 import nested_admin
 from django import forms
 from django.contrib import admin
-from django.db import transaction
+from django.contrib.admin import helpers
+from django.core.exceptions import PermissionDenied
+from django.db.models import Count, Prefetch
 from django.utils import timezone
 from django.utils.formats import localize
 from django.urls import reverse, path
 from django.utils.html import format_html
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.contrib import messages
-from django.shortcuts import redirect
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
 from django.utils.translation import gettext_lazy as _
 
+from . import pricing
+from .adjustments import AdjustmentOutOfRange, apply_adjustment, out_of_range_error, preview_adjustment
+from .annotations import with_cruise_summary, with_session_price_range
+from .cloning import clone_cruises, roll_forward_season
+from .forms import PriceAdjustmentForm, RollForwardForm, VersionedModelForm
 from .models import (
+    ConcurrentModificationError,
     Location,
     Port,
     CruiseCompany,
@@ -28,12 +39,41 @@ from .models import (
     Excursion,
     CruiseExcursion,
     CruiseSessionCabinPrice,
+    PriceAdjustment,
     Promotion
 )
+from .price_grid import load_grid, save_grid
 
 import logging
 logger = logging.getLogger(__name__)
 
+
+class VersionConflictMixin:
+    """Reports a save that lost a race against another edit instead of failing with a server error"""
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except ConcurrentModificationError as e:
+            self.message_user(
+                request,
+                _("Your changes were not saved: %(error)s. Reload the page and apply them again.") % {
+                    'error': e
+                },
+                messages.ERROR
+            )
+            return redirect(request.get_full_path())
+
+
+class PassengerSummaryAdminMixin:
+    """Saves changed bookings and quotes without their passenger summary, which the passenger signals keep"""
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            obj.save(update_fields=obj.fields_without_summary())
+        else:
+            super().save_model(request, obj, form, change)
+
 # Nested Inline Classes
 class CabinEquipmentInline(nested_admin.NestedTabularInline):
     model = CabinEquipment  # Updated from CabinTypeEquipment to CabinEquipment
@@ -44,8 +84,10 @@ class CabinEquipmentInline(nested_admin.NestedTabularInline):
 
 class CruiseSessionCabinPriceInline(nested_admin.NestedTabularInline):
     model = CruiseSessionCabinPrice
+    form = VersionedModelForm
     extra = 1
     fields = (
+        'version',
         'cabin_category',
         'price',
         'regular_price',
@@ -59,7 +101,20 @@ class CruiseSessionCabinPriceInline(nested_admin.NestedTabularInline):
     )
     readonly_fields = ('get_current_price_display', 'get_availability_status')
     autocomplete_fields = ['cabin_category']
-    
+
+    def get_queryset(self, request):
+        # Row titles name the cabin category's ship and company and the cruise
+        return super().get_queryset(request).select_related(
+            'cabin_category__ship__company',
+            'cruise_session__cruise'
+        )
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'cabin_category':
+            # The autocomplete widget loads each row's selected label from this queryset
+            kwargs['queryset'] = CabinCategory.objects.select_related('ship__company')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
     def get_current_price_display(self, obj):
         if obj and obj.pk:
             return format_html(
@@ -94,9 +149,11 @@ class PromotionAdmin(admin.ModelAdmin):
 
 class CruiseSessionInline(nested_admin.NestedStackedInline):
     model = CruiseSession
+    form = VersionedModelForm
     extra = 1
     show_change_link = True
     fields = (
+        'version',
         ('start_date', 'end_date'),
         ('embarkation_port', 'disembarkation_port'),
         'capacity',
@@ -131,6 +188,11 @@ class CruiseCompanyAdmin(admin.ModelAdmin):
     search_fields = ('name', 'description')
     filter_horizontal = ('operating_regions',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('operating_regions', queryset=Region.objects.only('id', 'name'))
+        )
+
     def get_regions(self, obj):
         return ", ".join(region.name for region in obj.operating_regions.all())
     get_regions.short_description = _("Operating Regions")
@@ -140,6 +202,7 @@ class BrandAdmin(admin.ModelAdmin):
     list_display = ('name', 'parent_company', 'market_segment', 'featured')
     list_filter = ('market_segment', 'featured', 'parent_company')
     search_fields = ('name', 'description')
+    list_select_related = ('parent_company',)
 
 @admin.register(Region)
 class RegionAdmin(admin.ModelAdmin):
@@ -148,9 +211,15 @@ class RegionAdmin(admin.ModelAdmin):
     search_fields = ('name', 'description')
     filter_horizontal = ('ports',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('parent_region').annotate(
+            ports_count=Count('ports', distinct=True)
+        )
+
     def get_ports_count(self, obj):
-        return obj.ports.count()
+        return obj.ports_count
     get_ports_count.short_description = _("Number of Ports")
+    get_ports_count.admin_order_field = 'ports_count'
 
 @admin.register(Ship)
 class ShipAdmin(admin.ModelAdmin):
@@ -159,6 +228,9 @@ class ShipAdmin(admin.ModelAdmin):
     search_fields = ('name', 'company__name', 'brand__name')
     readonly_fields = ('get_cabin_categories',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('company', 'brand')
+
     def get_cabin_categories(self, obj):
         categories = obj.cabin_categories.all()
         return format_html("<br>".join(
@@ -168,7 +240,7 @@ class ShipAdmin(admin.ModelAdmin):
     get_cabin_categories.short_description = _("Cabin Categories")
 
 @admin.register(Cruise)
-class CruiseAdmin(nested_admin.NestedModelAdmin):
+class CruiseAdmin(VersionConflictMixin, nested_admin.NestedModelAdmin):
     list_display = (
         'name',
         'ship',
@@ -178,7 +250,8 @@ class CruiseAdmin(nested_admin.NestedModelAdmin):
         'get_next_available_session',
         'get_session_count',
         'get_duration',
-        'is_featured'
+        'is_featured',
+        'get_price_grid_link'
     )
     list_filter = (
         'cruise_type', 
@@ -194,7 +267,7 @@ class CruiseAdmin(nested_admin.NestedModelAdmin):
     )
     filter_horizontal = ('regions',)
     inlines = [CruiseSessionInline, CruiseExcursionInline]
-    actions = ['duplicate_cruise']
+    actions = ['duplicate_cruise', 'roll_forward']
 
     fieldsets = (
         (None, {
@@ -209,16 +282,23 @@ class CruiseAdmin(nested_admin.NestedModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        # Every list column is annotated, so a page costs the same queries for any size
+        return with_cruise_summary(
+            super().get_queryset(request).select_related('ship__company', 'cruise_type')
+        )
+
     def get_next_available_session(self, obj):
-        next_session = obj.get_upcoming_sessions().first()
-        if next_session:
+        if obj.next_session_start:
+            status_field = CruiseSession._meta.get_field('status')
             return format_html(
                 '{} <br/><small>({})</small>',
-                next_session.start_date,
-                next_session.get_status_display()
+                obj.next_session_start,
+                dict(status_field.flatchoices).get(obj.next_session_status, obj.next_session_status)
             )
         return "No upcoming sessions"
     get_next_available_session.short_description = "Next Session"
+    get_next_available_session.admin_order_field = 'next_session_start'
 
     def get_company(self, obj):
         return obj.ship.company
@@ -226,69 +306,130 @@ class CruiseAdmin(nested_admin.NestedModelAdmin):
     get_company.admin_order_field = 'ship__company'
 
     def get_session_count(self, obj):
-        active = obj.get_active_sessions().count()
-        total = obj.get_session_count()
-        return f"{active} active / {total} total"
+        return f"{obj.active_session_count} active / {obj.session_count} total"
     get_session_count.short_description = "Sessions"
+    get_session_count.admin_order_field = 'session_count'
 
     def get_duration(self, obj):
-        return obj.duration_range
+        if obj.min_duration is None:
+            return "No sessions scheduled"
+        return obj.format_duration_range(obj.min_duration.days + 1, obj.max_duration.days + 1)
     get_duration.short_description = "Duration"
 
     def get_price_range(self, obj):
-        min_price, max_price = obj.price_range
-        if min_price is not None and max_price is not None:
-            return format_html("€{} - €{}", localize(min_price), localize(max_price))
+        if obj.min_price is not None and obj.max_price is not None:
+            return format_html(
+                "€{} - €{}",
+                localize(pricing.round_price(obj.min_price)),
+                localize(pricing.round_price(obj.max_price))
+            )
         return _("N/A")
     get_price_range.short_description = _("Price Range")
+    get_price_range.admin_order_field = 'min_price'
+
+    def get_price_grid_link(self, obj):
+        return format_html(
+            '<a href="{}">{}</a>',
+            reverse('admin:cruise_price_grid', args=[obj.pk]),
+            _("Edit prices")
+        )
+    get_price_grid_link.short_description = _("Price Grid")
+
+    def get_urls(self):
+        custom_urls = [
+            path(
+                '<int:cruise_id>/price-grid/',
+                self.admin_site.admin_view(self.price_grid_view),
+                name='cruise_price_grid'
+            ),
+            path(
+                '<int:cruise_id>/price-grid/data/',
+                self.admin_site.admin_view(self.price_grid_data),
+                name='cruise_price_grid_data'
+            ),
+        ]
+        return custom_urls + super().get_urls()
+
+    def price_grid_view(self, request, cruise_id):
+        """Sessions × cabin categories price editor; the grid loads its data from price_grid_data"""
+        if not request.user.has_perm('cruises.view_cruisesessioncabinprice'):
+            raise PermissionDenied
+        cruise = get_object_or_404(Cruise.objects.select_related('ship'), pk=cruise_id)
+        return TemplateResponse(request, 'admin/cruises/cruise/price_grid.html', {
+            **self.admin_site.each_context(request),
+            'title': _("Prices of %(cruise)s") % {'cruise': cruise},
+            'opts': self.model._meta,
+            'original': cruise,
+            'can_change': request.user.has_perm('cruises.change_cruisesessioncabinprice'),
+            'data_url': reverse('admin:cruise_price_grid_data', args=[cruise.pk]),
+        })
+
+    def price_grid_data(self, request, cruise_id):
+        """GET a page of the grid, POST ``{"cells": [...]}`` to save edited cells"""
+        cruise = get_object_or_404(Cruise.objects.only('id', 'ship_id'), pk=cruise_id)
+        if request.method == 'POST':
+            if not request.user.has_perm('cruises.change_cruisesessioncabinprice'):
+                raise PermissionDenied
+            try:
+                cells = json.loads(request.body)['cells']
+            except (ValueError, KeyError, TypeError):
+                return JsonResponse({'success': False, 'errors': 'Expected {"cells": [...]}'}, status=400)
+            if not isinstance(cells, list) or not all(isinstance(cell, dict) for cell in cells):
+                return JsonResponse({'success': False, 'errors': 'Expected {"cells": [...]}'}, status=400)
+            saved, conflicts, errors = save_grid(cruise, cells)
+            if errors:
+                return JsonResponse({'success': False, 'errors': errors}, status=400)
+            return JsonResponse({'success': True, 'saved': saved, 'conflicts': conflicts})
+
+        if not request.user.has_perm('cruises.view_cruisesessioncabinprice'):
+            raise PermissionDenied
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        return JsonResponse({'success': True, **load_grid(cruise, page)})
 
     @admin.action(description=_("Duplicate selected cruises"))
     def duplicate_cruise(self, request, queryset):
-        for cruise in queryset:
-            with transaction.atomic():
-                # Create new cruise
-                new_cruise = Cruise.objects.create(
-                    name=f"Copy of {cruise.name}",
-                    description=cruise.description,
-                    cruise_type=cruise.cruise_type,
-                    ship=cruise.ship,
-                    image=cruise.image,
-                    image_url=cruise.image_url,
-                    flyer_pdf=cruise.flyer_pdf,
-                    is_featured=False,
-                    difficulty_level=cruise.difficulty_level
-                )
-                
-                # Copy regions
-                new_cruise.regions.set(cruise.regions.all())
-                
-                # Copy sessions and their cabin prices
-                for session in cruise.sessions.all():
-                    old_session = session
-                    session.pk = None
-                    session.cruise = new_cruise
-                    session.save()
-                    
-                    # Copy cabin prices
-                    for cabin_price in old_session.cabin_prices.all():
-                        cabin_price.pk = None
-                        cabin_price.cruise_session = session
-                        cabin_price.save()
-                
-                # Copy excursions
-                for excursion in cruise.excursions.all():
-                    excursion.pk = None
-                    excursion.cruise = new_cruise
-                    excursion.save()
-                    
+        copies = clone_cruises(queryset)
         self.message_user(
             request,
-            _("%(count)d cruise(s) duplicated successfully.") % {'count': len(queryset)}
+            _("%(count)d cruise(s) duplicated successfully.") % {'count': len(copies)}
         )
 
+    @admin.action(description=_("Roll selected cruises forward into a new season"))
+    def roll_forward(self, request, queryset):
+        form = RollForwardForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            created, skipped = roll_forward_season(
+                queryset,
+                form.date_shift(),
+                form.price_rule(),
+                form.cleaned_data['start_from'],
+                form.cleaned_data['start_until']
+            )
+            self.message_user(
+                request,
+                _("%(created)d session(s) created, %(skipped)d skipped because their "
+                  "cruise already has a session on the new start date.") % {
+                    'created': created,
+                    'skipped': skipped
+                }
+            )
+            return None
+        return TemplateResponse(request, 'admin/cruises/cruise/roll_forward_season.html', {
+            **self.admin_site.each_context(request),
+            'title': _("Roll cruises forward into a new season"),
+            'opts': self.model._meta,
+            'form': form,
+            'cruises': queryset,
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
+
 
 @admin.register(CruiseSession)
-class CruiseSessionAdmin(admin.ModelAdmin):
+class CruiseSessionAdmin(VersionConflictMixin, admin.ModelAdmin):
+    form = VersionedModelForm
     list_display = (
         'cruise',
         'start_date',
@@ -314,23 +455,26 @@ class CruiseSessionAdmin(admin.ModelAdmin):
     date_hierarchy = 'start_date'
     inlines = [CruiseSessionCabinPriceInline]
 
+    def get_queryset(self, request):
+        return with_session_price_range(
+            super().get_queryset(request).select_related('cruise__ship__company')
+        )
+
     def get_duration(self, obj):
         return f"{obj.duration} days"
     get_duration.short_description = _("Duration")
 
     def get_price_range(self, obj):
-        prices = obj.cabin_prices.all()
-        if not prices:
+        if obj.lowest_price is None:
             return _("No prices set")
-        
-        current_prices = [price.get_current_price() for price in prices]
-        min_price = min(current_prices)
-        max_price = max(current_prices)
-        
+
+        min_price = pricing.round_price(obj.lowest_price)
+        max_price = pricing.round_price(obj.highest_price)
         if min_price == max_price:
             return format_html('€{}', localize(min_price))
         return format_html('€{} - €{}', localize(min_price), localize(max_price))
     get_price_range.short_description = _("Price Range")
+    get_price_range.admin_order_field = 'lowest_price'
 
 @admin.register(CabinCategory)
 class CabinCategoryAdmin(nested_admin.NestedModelAdmin):
@@ -340,6 +484,9 @@ class CabinCategoryAdmin(nested_admin.NestedModelAdmin):
     inlines = [CabinEquipmentInline]
     exclude = ('equipment',)  # Exclude since we're using the through model
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ship__company')
+
 
 @admin.register(Equipment)
 class EquipmentAdmin(admin.ModelAdmin):
@@ -355,6 +502,7 @@ class ExcursionAdmin(admin.ModelAdmin):
     list_filter = ('port', 'difficulty_level', 'is_accessible', 'includes_transport')
     search_fields = ('name', 'description', 'port__name')
     raw_id_fields = ('port',)
+    list_select_related = ('port',)
 
 @admin.register(CruiseExcursion)
 class CruiseExcursionAdmin(admin.ModelAdmin):
@@ -366,9 +514,11 @@ class CruiseExcursionAdmin(admin.ModelAdmin):
     search_fields = ('excursion__name', 'cruise__name')
     raw_id_fields = ('cruise', 'excursion')
     date_hierarchy = 'available_date'
+    list_select_related = ('excursion__port', 'cruise__ship__company')
 
 @admin.register(CruiseSessionCabinPrice)
-class CruiseSessionCabinPriceAdmin(admin.ModelAdmin):
+class CruiseSessionCabinPriceAdmin(VersionConflictMixin, admin.ModelAdmin):
+    form = VersionedModelForm
     list_display = (
         'cabin_category',
         'cruise_session',
@@ -394,6 +544,7 @@ class CruiseSessionCabinPriceAdmin(admin.ModelAdmin):
         'cabin_category__name',
         'cabin_category__category_code'
     )
+    actions = ['adjust_prices']
     
     readonly_fields = (
         'get_current_price_display',
@@ -405,6 +556,7 @@ class CruiseSessionCabinPriceAdmin(admin.ModelAdmin):
     fieldsets = (
         (None, {
             'fields': (
+                'version',
                 'cruise_session',
                 'cabin_category',
             )
@@ -438,6 +590,12 @@ class CruiseSessionCabinPriceAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'cabin_category__ship__company',
+            'cruise_session__cruise'
+        )
+
     def get_current_price_display(self, obj):
         current_price = obj.get_current_price()
         if obj.is_early_bird and obj.early_bird_deadline:
@@ -507,4 +665,69 @@ class CruiseSessionCabinPriceAdmin(admin.ModelAdmin):
             'all': [
                 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4/css/all.min.css'
             ]
-        }
\ No newline at end of file
+        }
+
+    @admin.action(description=_("Adjust prices of selected cabin prices"))
+    def adjust_prices(self, request, queryset):
+        submitted = 'preview' in request.POST or 'apply' in request.POST
+        form = PriceAdjustmentForm(request.POST if submitted else None)
+        preview = None
+        if form.is_valid():
+            change = (
+                queryset,
+                form.cleaned_data['price_fields'],
+                form.cleaned_data['change_type'],
+                form.cleaned_data['value']
+            )
+            if 'apply' in request.POST:
+                try:
+                    adjustment = apply_adjustment(
+                        *change, filters=self.get_adjustment_filters(request), user=request.user
+                    )
+                except AdjustmentOutOfRange as e:
+                    self.message_user(request, str(e), messages.ERROR)
+                else:
+                    self.message_user(request, _("Price adjustment applied: %(adjustment)s.") % {
+                        'adjustment': adjustment
+                    })
+                    return None
+            preview = preview_adjustment(*change)
+            if preview['out_of_range'] and 'apply' not in request.POST:
+                self.message_user(request, out_of_range_error(preview['out_of_range']), messages.WARNING)
+        return TemplateResponse(request, 'admin/cruises/cruisesessioncabinprice/adjust_prices.html', {
+            **self.admin_site.each_context(request),
+            'title': _("Adjust cabin prices"),
+            'opts': self.model._meta,
+            'form': form,
+            'preview': preview,
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
+
+    def get_adjustment_filters(self, request):
+        """How the adjusted rows were selected, for the PriceAdjustment record"""
+        if request.POST.get('select_across') == '1':
+            return {'changelist_filters': request.GET.urlencode()}
+        return {'cabin_prices': sorted(int(pk) for pk in request.POST.getlist(helpers.ACTION_CHECKBOX_NAME))}
+
+
+@admin.register(PriceAdjustment)
+class PriceAdjustmentAdmin(admin.ModelAdmin):
+    list_display = ('created_at', '__str__', 'change_type', 'value', 'rows_updated', 'created_by')
+    list_filter = ('change_type', 'created_at')
+    list_select_related = ('created_by',)
+    readonly_fields = (
+        'fields',
+        'change_type',
+        'value',
+        'filters',
+        'rows_updated',
+        'totals',
+        'created_by',
+        'created_at'
+    )
+    exclude = ('is_active',)
+
+    def has_add_permission(self, request):
+        return False
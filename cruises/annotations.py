@@ -0,0 +1,97 @@
+# cruises/annotations.py
+"""
+Queryset annotations for admin lists: the figures the Cruise and
+CruiseSession helper methods compute per row, expressed as subqueries so a
+whole page is loaded with one query.
+"""
+from django.db.models import (
+    Case,
+    Count,
+    DecimalField,
+    DurationField,
+    ExpressionWrapper,
+    F,
+    Max,
+    Min,
+    OuterRef,
+    Subquery,
+    When,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import CruiseSession, CruiseSessionCabinPrice
+
+# Session statuses counted as active, as in Cruise.get_active_sessions()
+ACTIVE_SESSION_STATUSES = ['scheduled', 'booking', 'guaranteed']
+
+
+def current_price(today=None):
+    """SQL counterpart of cruises.pricing.current_price for a CruiseSessionCabinPrice row"""
+    return Case(
+        When(
+            is_early_bird=True,
+            early_bird_deadline__gte=today or timezone.now().date(),
+            then=F('price')
+        ),
+        default=F('regular_price'),
+        output_field=DecimalField(max_digits=10, decimal_places=2)
+    )
+
+
+def _aggregate(queryset, group_field, aggregate):
+    """Subquery of one aggregate over ``queryset`` rows of the outer row"""
+    return Subquery(
+        queryset.filter(**{group_field: OuterRef('pk')}).order_by().values(
+            group_field
+        ).annotate(value=aggregate).values('value')
+    )
+
+
+def with_cruise_summary(cruises, today=None):
+    """
+    Annotate what the cruise admin list shows: ``min_price``/``max_price``
+    (current prices of bookable upcoming sessions, as Cruise.price_range),
+    ``next_session_start``/``next_session_status``, ``active_session_count``,
+    ``session_count`` and ``min_duration``/``max_duration`` (timedeltas of
+    end minus start date).
+    """
+    today = today or timezone.now().date()
+    prices = CruiseSessionCabinPrice.objects.filter(
+        cruise_session__start_date__gte=today,
+        cruise_session__status__in=['booking', 'guaranteed'],
+        available_cabins__gt=0
+    )
+    upcoming = CruiseSession.objects.filter(
+        cruise=OuterRef('pk'),
+        start_date__gte=today,
+        status__in=ACTIVE_SESSION_STATUSES
+    ).order_by('start_date')
+    length = ExpressionWrapper(F('end_date') - F('start_date'), output_field=DurationField())
+    sessions = CruiseSession.objects.all()
+    return cruises.annotate(
+        min_price=_aggregate(prices, 'cruise_session__cruise', Min(current_price(today))),
+        max_price=_aggregate(prices, 'cruise_session__cruise', Max(current_price(today))),
+        next_session_start=Subquery(upcoming.values('start_date')[:1]),
+        next_session_status=Subquery(upcoming.values('status')[:1]),
+        active_session_count=Coalesce(
+            _aggregate(sessions.filter(status__in=ACTIVE_SESSION_STATUSES), 'cruise', Count('pk')),
+            0
+        ),
+        session_count=Coalesce(_aggregate(sessions, 'cruise', Count('pk')), 0),
+        min_duration=_aggregate(sessions, 'cruise', Min(length)),
+        max_duration=_aggregate(sessions, 'cruise', Max(length)),
+    )
+
+
+def with_session_price_range(sessions, today=None):
+    """
+    Annotate ``lowest_price`` and ``highest_price``, the current prices over
+    all cabin prices of a session (CruiseSession.min_price only counts
+    bookable ones).
+    """
+    prices = CruiseSessionCabinPrice.objects.all()
+    return sessions.annotate(
+        lowest_price=_aggregate(prices, 'cruise_session', Min(current_price(today))),
+        highest_price=_aggregate(prices, 'cruise_session', Max(current_price(today))),
+    )
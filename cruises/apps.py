@@ -9,3 +9,4 @@ class CruisesConfig(AppConfig):
     def ready(self):
         from django.apps import apps
         from django.db import connection
+        from . import signals  # noqa: F401
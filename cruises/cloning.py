@@ -0,0 +1,209 @@
+# cruises/cloning.py
+"""
+Copies of cruises and sessions written with bulk_create.
+
+Source sessions are read in keyset batches of CLONE_BATCH_SIZE; per batch
+one INSERT writes the new sessions, one query loads the source cabin prices
+and one INSERT writes their copies. Duplicating a cruise or rolling a whole
+season forward costs a handful of statements per batch instead of one
+save() per session, cabin price and excursion.
+"""
+import calendar
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils.text import slugify
+
+from . import pricing
+from .models import Cruise, CruiseExcursion, CruiseSession, CruiseSessionCabinPrice
+from .promotions import invalidate_promotion_index
+
+CLONE_BATCH_SIZE = 500
+
+
+@dataclass(frozen=True)
+class DateShift:
+    """Moves dates by ``weeks`` weeks and ``years`` years; 29 February becomes the 28th"""
+    weeks: int = 0
+    years: int = 0
+
+    def __call__(self, day):
+        if day is None:
+            return None
+        day += timedelta(weeks=self.weeks)
+        if self.years:
+            year = day.year + self.years
+            day = day.replace(year=year, day=min(day.day, calendar.monthrange(year, day.month)[1]))
+        return day
+
+
+@dataclass(frozen=True)
+class PriceRule:
+    """Changes a price by ``percent`` and rounds it to a multiple of ``round_to`` if given"""
+    percent: Decimal = Decimal('0')
+    round_to: Decimal = None
+
+    def __call__(self, amount):
+        amount = amount * (100 + self.percent) / 100
+        if self.round_to:
+            amount = (amount / self.round_to).quantize(Decimal('1'), rounding=ROUND_HALF_UP) * self.round_to
+        return pricing.round_price(amount)
+
+
+def _copy(instance, **changes):
+    """Turn a loaded instance into an unsaved copy with ``changes`` applied"""
+    instance.pk = None
+    instance._state.adding = True
+    for field, value in changes.items():
+        setattr(instance, field, value)
+    return instance
+
+
+def _free_slugs(names):
+    """Unique slugs for new cruises, numbered name-2, name-3, … when taken"""
+    bases = [slugify(name) for name in names]
+    taken = set(Cruise.objects.filter(
+        Q(slug__in=bases) | Q(*[Q(slug__startswith=f'{base}-') for base in bases], _connector=Q.OR)
+    ).values_list('slug', flat=True))
+    slugs = []
+    for base in bases:
+        slug, number = base, 1
+        while slug in taken:
+            number += 1
+            slug = f'{base}-{number}'
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def _sold_cabins(session_ids):
+    """``{(session_id, cabin_category_id): cabins}`` bookings took from the inventory and still hold"""
+    # Import here to avoid circular import
+    from bookings.models import Booking
+
+    return {
+        (row['cruise_session_id'], row['cabin_category_id']): row['cabins']
+        for row in Booking.objects.filter(
+            cruise_session_id__in=session_ids,
+            cabin_reserved=True
+        ).order_by().values('cruise_session_id', 'cabin_category_id').annotate(cabins=Count('pk'))
+    }
+
+
+def _copy_sessions(sessions, cruise_ids, shift=None, price_rule=None, new_season=False):
+    """
+    Copy ``sessions`` with their cabin prices; ``cruise_ids`` maps a source
+    cruise id to the cruise of the copies. ``shift`` moves the dates and
+    ``price_rule`` changes the prices. A ``new_season`` copy is scheduled,
+    has no promotion and starts with the cabins its source had before any
+    were booked. Copies whose cruise already has a session on the new start
+    date are skipped. Returns ``(created, skipped)``.
+    """
+    created = skipped = 0
+    sessions = sessions.select_related(None).order_by('pk')
+    # Copies get higher ids than their sources and must not be copied again
+    max_pk = sessions.aggregate(max_pk=Max('pk'))['max_pk'] or 0
+    last_pk = 0
+    while True:
+        batch = list(sessions.filter(pk__gt=last_pk, pk__lte=max_pk)[:CLONE_BATCH_SIZE])
+        if not batch:
+            return created, skipped
+        last_pk = batch[-1].pk
+        source_ids = [session.pk for session in batch]
+
+        copies = {}
+        for session in batch:
+            start_date = shift(session.start_date) if shift else session.start_date
+            copies[session.pk] = (cruise_ids[session.cruise_id], start_date)
+        taken = set(CruiseSession.objects.filter(
+            cruise_id__in={cruise_id for cruise_id, _start in copies.values()},
+            start_date__in={start_date for _cruise, start_date in copies.values()}
+        ).values_list('cruise_id', 'start_date'))
+
+        new_sessions = {}
+        for session in batch:
+            key = copies[session.pk]
+            if key in taken:
+                skipped += 1
+                continue
+            taken.add(key)
+            source_id = session.pk
+            changes = {'cruise_id': key[0], 'start_date': key[1], 'version': 0}
+            if shift:
+                changes['end_date'] = shift(session.end_date)
+            if new_season:
+                changes.update(status='scheduled', promotion=None)
+            new_sessions[source_id] = _copy(session, **changes)
+        CruiseSession.objects.bulk_create(new_sessions.values())
+        created += len(new_sessions)
+
+        sold = _sold_cabins(source_ids) if new_season else {}
+        new_prices = []
+        for cabin_price in CruiseSessionCabinPrice.objects.filter(cruise_session_id__in=new_sessions):
+            key = (cabin_price.cruise_session_id, cabin_price.cabin_category_id)
+            changes = {'cruise_session': new_sessions[cabin_price.cruise_session_id], 'version': 0}
+            if shift:
+                changes['early_bird_deadline'] = shift(cabin_price.early_bird_deadline)
+            if price_rule:
+                changes.update(
+                    price=price_rule(cabin_price.price),
+                    regular_price=price_rule(cabin_price.regular_price)
+                )
+            if new_season:
+                changes['available_cabins'] = cabin_price.available_cabins + sold.get(key, 0)
+            new_prices.append(_copy(cabin_price, **changes))
+        CruiseSessionCabinPrice.objects.bulk_create(new_prices)
+
+
+def clone_cruises(cruises):
+    """
+    Copy cruises with their regions, sessions, cabin prices and excursions.
+    The copies are named "Copy of …" and not featured. Returns the copies.
+    """
+    sources = list(Cruise.objects.filter(pk__in=cruises.values('pk')).order_by('pk'))
+    names = [f"Copy of {cruise.name}" for cruise in sources]
+    with transaction.atomic():
+        source_ids = [cruise.pk for cruise in sources]
+        copies = Cruise.objects.bulk_create([
+            _copy(cruise, name=name, slug=slug, is_featured=False)
+            for cruise, name, slug in zip(sources, names, _free_slugs(names))
+        ])
+        cruise_ids = dict(zip(source_ids, [cruise.pk for cruise in copies]))
+
+        CruiseRegion = Cruise.regions.through
+        CruiseRegion.objects.bulk_create([
+            CruiseRegion(cruise_id=cruise_ids[cruise_id], region_id=region_id)
+            for cruise_id, region_id in CruiseRegion.objects.filter(
+                cruise_id__in=source_ids
+            ).values_list('cruise_id', 'region_id')
+        ])
+        _copy_sessions(CruiseSession.objects.filter(cruise_id__in=source_ids), cruise_ids)
+        CruiseExcursion.objects.bulk_create([
+            _copy(excursion, cruise_id=cruise_ids[excursion.cruise_id])
+            for excursion in CruiseExcursion.objects.filter(cruise_id__in=source_ids)
+        ], batch_size=CLONE_BATCH_SIZE)
+        # The copied sessions keep their promotion, but bulk_create sends no
+        # post_save for cruises.signals to rebuild the promotion index
+        transaction.on_commit(invalidate_promotion_index)
+    return copies
+
+
+def roll_forward_season(cruises, shift, price_rule=None, start_from=None, start_until=None):
+    """
+    Schedule the sessions of ``cruises`` again ``shift`` later, e.g. one year
+    on, with their cabin prices changed by ``price_rule``. Cancelled sessions
+    are left out; ``start_from``/``start_until`` limit the sessions copied to
+    those starting in that range. Returns ``(created, skipped)``, skipped
+    being sessions whose new start date is already taken.
+    """
+    cruise_ids = {cruise_id: cruise_id for cruise_id in cruises.values_list('pk', flat=True)}
+    sessions = CruiseSession.objects.filter(cruise_id__in=cruise_ids).exclude(status='cancelled')
+    if start_from:
+        sessions = sessions.filter(start_date__gte=start_from)
+    if start_until:
+        sessions = sessions.filter(start_date__lte=start_until)
+    with transaction.atomic():
+        return _copy_sessions(sessions, cruise_ids, shift, price_rule, new_season=True)
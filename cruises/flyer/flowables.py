@@ -113,7 +113,7 @@ class HeaderFlowable(Flowable):
         canvas.setFont("Roboto-Bold", 24)
         canvas.drawCentredString(circle_x, circle_y + 0.4*inch, "ab")
         canvas.setFont("Roboto-Bold", 28)
-        canvas.drawCentredString(circle_x, circle_y, f"{self.cruise.min_price()} €")
+        canvas.drawCentredString(circle_x, circle_y, f"{self.cruise.get_min_price()} €")
         canvas.setFont("Roboto", 18)
         canvas.drawCentredString(circle_x, circle_y - 0.4*inch, "p.P.")
 
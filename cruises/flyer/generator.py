@@ -1,6 +1,8 @@
 #cruises/flyer/generator.py
 
 import os
+from io import BytesIO
+
 from django.conf import settings
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
@@ -13,29 +15,48 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.styles import ParagraphStyle
 
-from ..models import Cruise, CruiseSession, CruiseCategoryPrice
+from ..models import Cruise, CruiseSession, CruiseSessionCabinPrice
 from .styles import StyleSheet
 
 from .flowables import HeaderFlowable
 from ..utils import image_utils
-from ..utils.pdf_utils import create_colored_box  # Add this import
+from ..utils.pdf_utils import create_colored_box, register_fonts
+
+
+def warm_flyer_worker():
+    """Render pool warm-up: register the flyer fonts once per worker"""
+    register_fonts()
+
+
+def render_flyer(cruise_id):
+    """Render one flyer in a worker; returns (cruise_id, pdf_bytes, error)"""
+    try:
+        output = BytesIO()
+        CruiseFlyerGenerator(cruise_id).generate(output)
+        return cruise_id, output.getvalue(), None
+    except Exception as e:
+        return cruise_id, None, str(e)
 
 
 class CruiseFlyerGenerator:
     def __init__(self, cruise_id):
         self.cruise = Cruise.objects.get(id=cruise_id)
         self.sessions = CruiseSession.objects.filter(cruise=self.cruise).order_by('start_date')
-        self.prices = CruiseCategoryPrice.objects.filter(cruise=self.cruise).select_related('category')
+        self.prices = CruiseSessionCabinPrice.objects.filter(
+            cruise_session__cruise=self.cruise
+        ).select_related('cabin_category').order_by('cabin_category', 'price')
         self.styles = StyleSheet().styles
         self.main_color = colors.HexColor("#007a99")
         self.light_color = colors.HexColor("#e6f3f7")
         self.width, self.height = A4
         self.header_height = self.height * 0.45  # Match the HeaderFlowable height
 
-    def generate(self):
-        flyer_dir = os.path.join(settings.MEDIA_ROOT, 'flyers')
-        os.makedirs(flyer_dir, exist_ok=True)
-        output_path = os.path.join(flyer_dir, f'{self.cruise.name}_flyer.pdf')
+    def generate(self, output=None):
+        """Build the flyer into ``output`` (a path or file object); defaults to MEDIA_ROOT/flyers"""
+        if output is None:
+            flyer_dir = os.path.join(settings.MEDIA_ROOT, 'flyers')
+            os.makedirs(flyer_dir, exist_ok=True)
+            output = os.path.join(flyer_dir, f'{self.cruise.name}_flyer.pdf')
 
         def on_page(canvas, doc):
             header = HeaderFlowable(self.cruise)
@@ -52,17 +73,16 @@ class CruiseFlyerGenerator:
             onPage=on_page
         )
 
-        doc = BaseDocTemplate(output_path, pagesize=A4)
+        doc = BaseDocTemplate(output, pagesize=A4)
         doc.addPageTemplates(page_template)
 
         self._register_fonts()
         content = self._build_content()
         doc.build(content)
-        return output_path
+        return output
 
     def _register_fonts(self):
-        pdfmetrics.registerFont(TTFont('Roboto', os.path.join(settings.BASE_DIR, 'fonts', 'Roboto-Regular.ttf')))
-        pdfmetrics.registerFont(TTFont('Roboto-Bold', os.path.join(settings.BASE_DIR, 'fonts', 'Roboto-Bold.ttf')))
+        register_fonts()
 
     def _build_content(self):
         content = []
@@ -155,7 +175,13 @@ class CruiseFlyerGenerator:
 
         content.append(Paragraph("PREISE", self.styles['FlyerHeading1']))
         price_data = [['DECK/LAGE', 'AUSSENKABINE', 'PREIS P.P.']]
-        price_data.extend([[price.category.name, getattr(price.category, 'description', 'Standard'), f"{price.price} €"] for price in self.prices])
+        # Lowest current price per cabin category across the cruise's sessions
+        category_prices = {}
+        for price in self.prices:
+            current = price.get_current_price()
+            if price.cabin_category not in category_prices or current < category_prices[price.cabin_category]:
+                category_prices[price.cabin_category] = current
+        price_data.extend([[category.name, getattr(category, 'description', 'Standard'), f"{current} €"] for category, current in category_prices.items()])
         price_table = Table(price_data, colWidths=[2.5*inch, 3*inch, 2*inch])
         price_table.setStyle(TableStyle([
             ('BACKGROUND', (0,0), (-1,0), self.main_color),
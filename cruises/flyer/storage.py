@@ -0,0 +1,73 @@
+#cruises/flyer/storage.py
+import hashlib
+import posixpath
+
+from django.core.files.storage import default_storage
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from ..models import CruiseSessionCabinPrice
+from ..utils.storage_utils import remove_other_files, save_if_absent
+
+FLYER_DIR = 'flyers'
+
+
+def flyer_content_hash(cruise, today=None):
+    """
+    Hash of everything the generated flyer shows, from aggregates rather than
+    the rows: cruise, type, ship and company details, when the sessions and
+    cabin prices (and their categories) last changed, the number of
+    early-bird prices still running (the price shown changes when one ends)
+    and the minimum price.
+    """
+    today = today or timezone.now().date()
+    sessions = cruise.sessions.aggregate(count=Count('pk'), updated=Max('updated_at'))
+    prices = CruiseSessionCabinPrice.objects.filter(cruise_session__cruise=cruise).aggregate(
+        count=Count('pk'),
+        updated=Max('updated_at'),
+        categories=Max('cabin_category__updated_at'),
+        early_bird=Count('pk', filter=Q(is_early_bird=True, early_bird_deadline__gte=today)),
+    )
+    parts = [
+        cruise.pk,
+        cruise.name,
+        cruise.description,
+        cruise.image.name if cruise.image else '',
+        cruise.image_url or '',
+        cruise.updated_at,
+        cruise.cruise_type.updated_at,
+        cruise.ship.updated_at,
+        cruise.company.name,
+        cruise.get_min_price(),
+        sessions,
+        prices,
+    ]
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:12]
+
+
+def flyer_path(cruise, content_hash):
+    return posixpath.join(FLYER_DIR, cruise.slug, f"{content_hash}.pdf")
+
+
+def get_prerendered_flyer(cruise, content_hash=None):
+    """Return the storage name of the current flyer, or None if it was not rendered yet"""
+    name = flyer_path(cruise, content_hash or flyer_content_hash(cruise))
+    return name if default_storage.exists(name) else None
+
+
+def store_flyer(cruise, content_hash, content, replace=False):
+    """
+    Save a rendered flyer unless this version is stored already; returns its
+    storage name. Safe in the request path: the stored file is never deleted
+    unless ``replace`` is given, which only prerender_flyers --force does.
+    """
+    name = flyer_path(cruise, content_hash)
+    if replace:
+        default_storage.delete(name)
+    save_if_absent(name, content)
+    return name
+
+
+def remove_outdated_flyers(cruise, content_hash):
+    """Delete the stored flyers of a cruise other than the given version (prerender_flyers only)"""
+    return remove_other_files(flyer_path(cruise, content_hash))
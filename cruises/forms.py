@@ -1,5 +1,13 @@
+from decimal import Decimal
+
 from django import forms
-from .models import CruiseSession
+from django.core.exceptions import ValidationError
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+
+from .cloning import DateShift, PriceRule
+from .adjustments import ADJUSTABLE_FIELDS, amount_change_error
+from .models import CruiseSession, CruiseSessionCabinPrice, PriceAdjustment
 
 
 class ContactForm(forms.Form):
@@ -19,4 +27,127 @@ class ContactForm(forms.Form):
         'class': 'form-control input-sm',
         'placeholder': 'Enter Your Message',
         'rows': 5
-    }))
\ No newline at end of file
+    }))
+
+class VersionedModelForm(forms.ModelForm):
+    """
+    Model form for VersionedModel rows: carries the version the form was
+    rendered with and rejects changes to a row edited by someone else since.
+    """
+    version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    @cached_property
+    def changed_data(self):
+        # An unchanged row is not saved, so a newer version does not matter
+        return [name for name in super().changed_data if name != 'version']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        version = cleaned_data.get('version')
+        if version is None:
+            cleaned_data['version'] = self.instance.version
+        elif self.instance.pk and self.has_changed():
+            if version != self.instance.version:
+                raise ValidationError(
+                    _("%(object)s was changed by someone else while you were editing it "
+                      "(for example by a booking). Reload the page and apply your changes again.") % {
+                        'object': self.instance
+                    },
+                    code='version_conflict'
+                )
+        return cleaned_data
+
+
+class RollForwardForm(forms.Form):
+    """Options of the admin action that rolls cruise sessions forward into a new season"""
+    SHIFT_CHOICES = [
+        ('year', _("One year (same dates)")),
+        ('weeks', _("A number of weeks (same weekdays)")),
+    ]
+    shift = forms.ChoiceField(choices=SHIFT_CHOICES, initial='year', label=_("Shift sessions by"))
+    weeks = forms.IntegerField(min_value=1, initial=52, required=False, label=_("Weeks"))
+    start_from = forms.DateField(
+        required=False,
+        label=_("Sessions starting from"),
+        widget=forms.DateInput(attrs={'type': 'date'})
+    )
+    start_until = forms.DateField(
+        required=False,
+        label=_("Sessions starting until"),
+        widget=forms.DateInput(attrs={'type': 'date'})
+    )
+    price_change = forms.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        min_value=-99,
+        initial=0,
+        label=_("Price change (%)")
+    )
+    round_to = forms.DecimalField(
+        max_digits=8,
+        decimal_places=2,
+        min_value=Decimal('0.01'),
+        required=False,
+        label=_("Round prices to a multiple of"),
+        help_text=_("For example 10 to round 1,234.56 to 1,230.00; empty keeps the cents.")
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('shift') == 'weeks' and not cleaned_data.get('weeks'):
+            self.add_error('weeks', _("Enter the number of weeks to shift the sessions by."))
+        start_from, start_until = cleaned_data.get('start_from'), cleaned_data.get('start_until')
+        if start_from and start_until and start_from > start_until:
+            self.add_error('start_until', _("The end of the range must not be before its start."))
+        return cleaned_data
+
+    def date_shift(self):
+        if self.cleaned_data['shift'] == 'year':
+            return DateShift(years=1)
+        return DateShift(weeks=self.cleaned_data['weeks'])
+
+    def price_rule(self):
+        return PriceRule(self.cleaned_data['price_change'], self.cleaned_data['round_to'])
+
+
+class PriceAdjustmentForm(forms.Form):
+    """Options of the admin action that changes many cabin prices at once"""
+    price_fields = forms.MultipleChoiceField(
+        choices=[
+            (field, CruiseSessionCabinPrice._meta.get_field(field).verbose_name.capitalize())
+            for field in ADJUSTABLE_FIELDS
+        ],
+        initial=['price', 'regular_price'],
+        widget=forms.CheckboxSelectMultiple,
+        label=_("Fields")
+    )
+    change_type = forms.ChoiceField(choices=PriceAdjustment.ChangeType.choices, label=_("Change by"))
+    value = forms.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        label=_("Value"),
+        help_text=_("Percentage or amount to add; negative values lower the prices. "
+                    "Prices never drop below zero. The single supplement is a percentage "
+                    "itself and can only be changed by a percentage.")
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        value = cleaned_data.get('value')
+        if value == 0:
+            self.add_error('value', _("A change of zero would not change any price."))
+        elif value is not None and value <= -100 and cleaned_data.get('change_type') == PriceAdjustment.ChangeType.PERCENT:
+            self.add_error('value', _("A percentage change must be above -100."))
+        error = amount_change_error(cleaned_data.get('price_fields', []), cleaned_data.get('change_type'))
+        if error:
+            self.add_error('price_fields', error)
+        return cleaned_data
+
+
+class PriceGridCellForm(forms.Form):
+    """One edited cell of the admin price grid, as posted by the grid's script"""
+    id = forms.IntegerField()
+    version = forms.IntegerField(min_value=0)
+    price = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    regular_price = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    available_cabins = forms.IntegerField(min_value=0)
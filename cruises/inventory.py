@@ -0,0 +1,64 @@
+# cruises/inventory.py
+"""
+Cabin inventory changes as single conditional UPDATE statements.
+
+The availability check and the decrement happen in the same statement, so
+concurrent bookings cannot oversell a cabin category: whichever UPDATE runs
+second sees the already decremented count and matches no row. Each change
+bumps the row's ``version``, so admin edits based on an older count fail
+instead of overwriting it.
+"""
+from django.db.models import F, Value
+from django.utils import timezone
+
+from .models import CruiseSessionCabinPrice
+
+
+def _cabin_prices(cruise_session_id, cabin_category_id):
+    return CruiseSessionCabinPrice.objects.filter(
+        cruise_session_id=cruise_session_id,
+        cabin_category_id=cabin_category_id
+    )
+
+
+def reserve_cabins(cruise_session_id, cabin_category_id, count=1, promised=None):
+    """
+    Take ``count`` cabins of a category on a session; False if not enough are
+    left. ``promised`` is an optional expression for cabins that must stay
+    free on top, e.g. those held for other quotes.
+    """
+    return _reserve(_cabin_prices(cruise_session_id, cabin_category_id), count, promised)
+
+
+def release_cabins(cruise_session_id, cabin_category_id, count=1):
+    """Give ``count`` cabins back, e.g. when a booking is cancelled"""
+    return _release(_cabin_prices(cruise_session_id, cabin_category_id), count)
+
+
+def reserve_cabin_price(cabin_price_id, count=1):
+    return _reserve(CruiseSessionCabinPrice.objects.filter(pk=cabin_price_id), count)
+
+
+def release_cabin_price(cabin_price_id, count=1):
+    return _release(CruiseSessionCabinPrice.objects.filter(pk=cabin_price_id), count)
+
+
+def _reserve(cabin_prices, count, promised=None):
+    if count < 1:
+        raise ValueError("Cabin count must be positive")
+    needed = count if promised is None else Value(count) + promised
+    return cabin_prices.filter(available_cabins__gte=needed).update(
+        available_cabins=F('available_cabins') - count,
+        version=F('version') + 1,
+        updated_at=timezone.now()
+    ) == 1
+
+
+def _release(cabin_prices, count):
+    if count < 1:
+        raise ValueError("Cabin count must be positive")
+    return cabin_prices.update(
+        available_cabins=F('available_cabins') + count,
+        version=F('version') + 1,
+        updated_at=timezone.now()
+    ) == 1
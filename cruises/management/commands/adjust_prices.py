@@ -0,0 +1,92 @@
+# cruises/management/commands/adjust_prices.py
+import time
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cruises.adjustments import (
+    ADJUSTABLE_FIELDS,
+    AdjustmentOutOfRange,
+    amount_change_error,
+    apply_adjustment,
+    preview_adjustment,
+    select_cabin_prices,
+)
+from cruises.models import PriceAdjustment
+
+
+class Command(BaseCommand):
+    help = 'Change session cabin prices by a percentage or an amount; previews unless --apply is given'
+
+    def add_arguments(self, parser):
+        change = parser.add_mutually_exclusive_group(required=True)
+        change.add_argument('--percent', type=Decimal, help='Percentage to add, e.g. 4.5 or -10')
+        change.add_argument('--amount', type=Decimal, help='Amount to add, e.g. 50 or -25.50')
+        parser.add_argument(
+            '--field',
+            action='append',
+            choices=ADJUSTABLE_FIELDS,
+            help='Field to change; repeat for several (default: price and regular_price)',
+        )
+        parser.add_argument('--ship', type=int, help='Only cabin prices of this ship')
+        parser.add_argument('--cruise', type=int, help='Only cabin prices of this cruise')
+        parser.add_argument('--deck', help='Only cabin categories on this deck')
+        parser.add_argument('--from', dest='start_from', type=date.fromisoformat,
+                            help='Only sessions starting on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--until', dest='start_until', type=date.fromisoformat,
+                            help='Only sessions starting on or before this date (YYYY-MM-DD)')
+        parser.add_argument('--apply', action='store_true', help='Change the prices instead of previewing')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        fields = options['field'] or ['price', 'regular_price']
+        if options['percent'] is not None:
+            change_type, value = PriceAdjustment.ChangeType.PERCENT, options['percent']
+        else:
+            change_type, value = PriceAdjustment.ChangeType.AMOUNT, options['amount']
+        error = amount_change_error(fields, change_type)
+        if error:
+            raise CommandError(error)
+        filters = {
+            name: options[name]
+            for name in ['ship', 'cruise', 'deck', 'start_from', 'start_until']
+            if options[name]
+        }
+        cabin_prices = select_cabin_prices(**filters)
+
+        if not options['apply']:
+            preview = preview_adjustment(cabin_prices, fields, change_type, value)
+            for field, figures in preview['totals'].items():
+                self.stdout.write(
+                    f"{field}: total {figures['before']} -> {figures['after']}, "
+                    f"new values {figures['lowest']} to {figures['highest']}"
+                )
+            if preview['out_of_range']:
+                self.stdout.write(self.style.WARNING(
+                    f"{preview['out_of_range']} cabin prices would go below zero or past the largest "
+                    f"value their fields hold; --apply would be rejected"
+                ))
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Dry run: {preview['rows']} cabin prices would change in {elapsed:.2f}s "
+                    f"(add --apply to change them)"
+                )
+            )
+            return
+
+        try:
+            adjustment = apply_adjustment(
+                cabin_prices,
+                fields,
+                change_type,
+                value,
+                filters={name: str(criterion) for name, criterion in filters.items()}
+            )
+        except AdjustmentOutOfRange as e:
+            raise CommandError(e)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"Price adjustment #{adjustment.pk}: {adjustment} in {elapsed:.2f}s")
+        )
@@ -0,0 +1,107 @@
+# cruises/management/commands/prerender_flyers.py
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cruises.flyer.generator import render_flyer
+from cruises.flyer.storage import (
+    flyer_content_hash,
+    get_prerendered_flyer,
+    remove_outdated_flyers,
+    store_flyer,
+)
+from cruises.models import Cruise
+from cruises.utils.process_utils import render_pool
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Pre-render flyers of all cruises with upcoming sessions into media storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Number of render processes (defaults to the CPU count)',
+        )
+        parser.add_argument(
+            '--upload-workers',
+            type=int,
+            default=4,
+            help='Number of parallel uploads to media storage',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Render every flyer even if its content has not changed',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        cruises = Cruise.objects.filter(
+            sessions__start_date__gte=timezone.now().date(),
+            sessions__status__in=['scheduled', 'booking', 'guaranteed']
+        ).select_related('cruise_type', 'ship', 'ship__company').distinct()
+
+        to_render = {}
+        stored = []  # (cruise, content_hash) of the flyers now in storage
+        skipped = 0
+        for cruise in cruises:
+            content_hash = flyer_content_hash(cruise)
+            if not options['force'] and get_prerendered_flyer(cruise, content_hash):
+                skipped += 1
+                stored.append((cruise, content_hash))
+            else:
+                to_render[cruise.pk] = (cruise, content_hash)
+
+        rendered = 0
+        failed = 0
+        if to_render:
+            with render_pool(options['workers'], 'cruises.flyer.generator.warm_flyer_worker') as renderers, \
+                    ThreadPoolExecutor(max_workers=options['upload_workers']) as uploaders:
+                uploads = {}
+                for future in as_completed([renderers.submit(render_flyer, pk) for pk in to_render]):
+                    cruise_id, pdf, error = future.result()
+                    cruise, content_hash = to_render[cruise_id]
+                    if error:
+                        failed += 1
+                        self._report_failure(cruise, error)
+                        continue
+                    upload = uploaders.submit(
+                        store_flyer, cruise, content_hash, ContentFile(pdf), replace=options['force']
+                    )
+                    uploads[upload] = (cruise, content_hash)
+
+                for upload in as_completed(uploads):
+                    cruise, content_hash = uploads[upload]
+                    try:
+                        name = upload.result()
+                    except Exception as e:
+                        failed += 1
+                        self._report_failure(cruise, e)
+                    else:
+                        rendered += 1
+                        stored.append((cruise, content_hash))
+                        self.stdout.write(f"Rendered: {cruise.name} -> {name}")
+
+        # Outdated versions are only removed here, never while a download may be serving them
+        with ThreadPoolExecutor(max_workers=options['upload_workers']) as cleaners:
+            removed = sum(cleaners.map(lambda flyer: remove_outdated_flyers(*flyer), stored))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Flyers rendered: {rendered}, skipped (unchanged): {skipped}, "
+                f"failed: {failed}, outdated removed: {removed} in {elapsed:.1f}s"
+            )
+        )
+
+    def _report_failure(self, cruise, error):
+        logger.error(f"Failed to pre-render flyer for cruise {cruise.pk}: {error}")
+        self.stdout.write(self.style.ERROR(f"Failed: {cruise.name}: {error}"))
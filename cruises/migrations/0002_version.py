@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-19 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cruises', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cruisesession',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cruisesessioncabinprice',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.6 on 2026-10-19 18:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cruises', '0002_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceAdjustment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('fields', models.JSONField(help_text='Cabin price fields that were changed')),
+                ('change_type', models.CharField(choices=[('percent', 'Percentage'), ('amount', 'Absolute amount')], max_length=10)),
+                ('value', models.DecimalField(decimal_places=2, help_text='Percentage or amount added; negative values lower the prices', max_digits=10)),
+                ('filters', models.JSONField(blank=True, default=dict, help_text='Criteria that selected the changed cabin prices')),
+                ('rows_updated', models.PositiveIntegerField(default=0)),
+                ('totals', models.JSONField(blank=True, default=dict, help_text='Sum of each field over the changed rows before and after the change')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='price_adjustments', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Price Adjustment',
+                'verbose_name_plural': 'Price Adjustments',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -1,15 +1,18 @@
 # cruises/models.py
 import random
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models import Min, Q
+from django.db.models import Count, F, Min, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Concat
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 from decimal import Decimal
 import logging
 
+from . import pricing
+
 logger = logging.getLogger(__name__)
 
 class BaseModel(models.Model):
@@ -20,6 +23,106 @@ class BaseModel(models.Model):
     class Meta:
         abstract = True
 
+
+class ConcurrentModificationError(Exception):
+    """Raised when a row was changed by someone else since it was loaded"""
+
+
+class VersionedModel(models.Model):
+    """
+    Optimistic concurrency control: saving an existing row first bumps its
+    ``version`` with a conditional UPDATE on the version it was loaded with,
+    so a save based on a stale copy of the row raises
+    ConcurrentModificationError instead of overwriting the newer data.
+    Queryset updates of these rows must bump ``version`` themselves.
+    """
+    # Editable so model forms can carry it back as a hidden field (see VersionedModelForm)
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if self._state.adding or kwargs.get('force_insert') or update_fields is not None and not update_fields:
+            return super().save(*args, **kwargs)
+
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        manager = type(self)._base_manager.using(using)
+        expected = self.version
+        with transaction.atomic(using=using):
+            # The claimed row stays locked until the full UPDATE below commits
+            claimed = manager.filter(pk=self.pk, version=expected).update(version=F('version') + 1)
+            if not claimed:
+                if manager.filter(pk=self.pk).exists():
+                    raise ConcurrentModificationError(
+                        f"{self._meta.verbose_name} {self.pk} was changed by someone else"
+                    )
+                # Deleted meanwhile: Model.save() inserts it again, as it always did
+                return super().save(*args, **kwargs)
+            self.version = expected + 1
+            try:
+                super().save(*args, **kwargs)
+            except Exception:
+                self.version = expected
+                raise
+
+class PassengerSummaryModel(models.Model):
+    """
+    Lead passenger name and passenger count stored on the row of a Booking or
+    Quote, so string rendering, admin lists and pricing do not query the
+    passengers. refresh_passenger_summaries() keeps them up to date (see the
+    passenger signals). They are not editable in forms, and the admin saves
+    changed rows with fields_without_summary() as update_fields, so a copy
+    loaded before a passenger change cannot overwrite them.
+    """
+    SUMMARY_FIELDS = ('lead_passenger_name', 'passenger_count')
+
+    lead_passenger_name = models.CharField(
+        _("Lead Passenger"),
+        max_length=201,
+        blank=True,
+        editable=False
+    )
+    passenger_count = models.PositiveIntegerField(_("Passengers"), default=0, editable=False)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def fields_without_summary(cls):
+        """Names of the fields a save of a possibly stale copy may write"""
+        return [
+            field.name for field in cls._meta.concrete_fields
+            if not field.primary_key and field.name not in cls.SUMMARY_FIELDS
+        ]
+
+
+def refresh_passenger_summaries(queryset):
+    """Recompute the passenger summary of the queryset's rows in one UPDATE"""
+    relation = queryset.model._meta.get_field('passengers')
+    parent_field = relation.field.name
+    passengers = relation.related_model.objects.filter(**{parent_field: OuterRef('pk')})
+    return queryset.update(
+        passenger_count=Coalesce(
+            Subquery(
+                passengers.order_by().values(parent_field).annotate(total=Count('pk')).values('total')
+            ),
+            0
+        ),
+        lead_passenger_name=Coalesce(
+            Subquery(
+                passengers.order_by('-is_lead_passenger', 'last_name', 'first_name').annotate(
+                    name=Concat('first_name', Value(' '), 'last_name', output_field=models.CharField())
+                ).values('name')[:1]
+            ),
+            Value('')
+        ),
+        # Marks the rows as changed for the reporting rollups (bookings.rollups)
+        updated_at=timezone.now()
+    )
+
+
 class Location(BaseModel):
     """Base model for any location (ports, cities, etc)"""
     name = models.CharField(max_length=100)
@@ -315,9 +418,10 @@ class Cruise(BaseModel):
             return "No sessions scheduled"
             
         durations = [(session.end_date - session.start_date).days + 1 for session in sessions]
-        min_duration = min(durations)
-        max_duration = max(durations)
-        
+        return self.format_duration_range(min(durations), max(durations))
+
+    @staticmethod
+    def format_duration_range(min_duration, max_duration):
         if min_duration == max_duration:
             return f"{min_duration} days"
         return f"{min_duration}-{max_duration} days"
@@ -386,7 +490,7 @@ class CruiseItinerary(BaseModel):
             return departure - arrival
         return None
 
-class CruiseSession(BaseModel):
+class CruiseSession(VersionedModel, BaseModel):
     cruise = models.ForeignKey(Cruise, related_name='sessions', on_delete=models.CASCADE)
     start_date = models.DateField()
     end_date = models.DateField()
@@ -760,7 +864,7 @@ class CabinEquipment(BaseModel):
     def __str__(self):
         return f"{self.equipment.name} (x{self.quantity}) - {self.cabin_category.name}"
     
-class CruiseSessionCabinPrice(BaseModel):
+class CruiseSessionCabinPrice(VersionedModel, BaseModel):
     """Model to manage cabin prices for specific cruise sessions"""
     cruise_session = models.ForeignKey(
         CruiseSession,
@@ -818,22 +922,15 @@ class CruiseSessionCabinPrice(BaseModel):
 
     def get_current_price(self):
         """Get the current applicable price based on early bird status"""
-        if self.is_early_bird and self.early_bird_deadline:
-            if timezone.now().date() <= self.early_bird_deadline:
-                return self.price
-        return self.regular_price
+        return pricing.current_price(self)
 
     def get_single_price(self):
         """Calculate price for single occupation"""
-        base_price = self.get_current_price()
-        supplement = (base_price * self.single_supplement) / 100
-        return base_price + supplement
+        return pricing.single_price(self)
 
     def get_third_person_price(self):
         """Calculate price for third person in cabin"""
-        base_price = self.get_current_price()
-        discount = (base_price * self.third_person_discount) / 100
-        return base_price - discount
+        return pricing.third_person_price(self)
 
     @property
     def is_available(self):
@@ -842,8 +939,51 @@ class CruiseSessionCabinPrice(BaseModel):
 
     def decrease_availability(self, count=1):
         """Decrease available cabins"""
-        if self.available_cabins >= count:
-            self.available_cabins -= count
-            self.save()
+        # Import here to avoid circular import
+        from .inventory import reserve_cabin_price
+
+        if reserve_cabin_price(self.pk, count):
+            self.refresh_from_db(fields=['available_cabins', 'version', 'updated_at'])
             return True
-        return False
\ No newline at end of file
+        return False
+
+class PriceAdjustment(BaseModel):
+    """Audit record of one bulk change to session cabin prices (see cruises.adjustments)"""
+    class ChangeType(models.TextChoices):
+        PERCENT = 'percent', _('Percentage')
+        AMOUNT = 'amount', _('Absolute amount')
+
+    fields = models.JSONField(help_text=_("Cabin price fields that were changed"))
+    change_type = models.CharField(max_length=10, choices=ChangeType.choices)
+    value = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        help_text=_("Percentage or amount added; negative values lower the prices")
+    )
+    filters = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text=_("Criteria that selected the changed cabin prices")
+    )
+    rows_updated = models.PositiveIntegerField(default=0)
+    totals = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text=_("Sum of each field over the changed rows before and after the change")
+    )
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='price_adjustments'
+    )
+
+    class Meta:
+        verbose_name = _("Price Adjustment")
+        verbose_name_plural = _("Price Adjustments")
+        ordering = ['-created_at']
+
+    def __str__(self):
+        unit = '%' if self.change_type == self.ChangeType.PERCENT else '€'
+        return f"{', '.join(self.fields)} {self.value:+}{unit} on {self.rows_updated} cabin prices"
@@ -0,0 +1,117 @@
+# cruises/price_grid.py
+"""
+Data behind the admin price grid: sessions of a cruise as rows, cabin
+categories of its ship as columns, one cabin price per cell.
+
+A page of GRID_PAGE_SIZE sessions costs three queries (the sessions, their
+cabin prices, the ship's categories) whatever its size, and saving a batch
+of edited cells is one version check and one bulk_update.
+"""
+from decimal import Decimal
+from functools import partial
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from .adjustments import invalidate_price_snapshots
+from .forms import PriceGridCellForm
+from .models import CabinCategory, CruiseSession, CruiseSessionCabinPrice
+
+GRID_PAGE_SIZE = 20
+GRID_FIELDS = ['price', 'regular_price', 'available_cabins']
+
+
+def _json_value(value):
+    # Decimals travel as strings so the grid shows the stored cents
+    return str(value) if isinstance(value, Decimal) else value
+
+
+def load_grid(cruise, page=1):
+    """One page of the grid of ``cruise`` as JSON-ready data"""
+    offset = (page - 1) * GRID_PAGE_SIZE
+    sessions = list(
+        CruiseSession.objects.filter(cruise=cruise).order_by('start_date').values(
+            'id', 'start_date', 'end_date', 'status'
+        )[offset:offset + GRID_PAGE_SIZE + 1]
+    )
+    has_next = len(sessions) > GRID_PAGE_SIZE
+    sessions = sessions[:GRID_PAGE_SIZE]
+
+    cells = {session['id']: {} for session in sessions}
+    for cabin_price in CruiseSessionCabinPrice.objects.filter(cruise_session_id__in=cells).values(
+        'id', 'cruise_session_id', 'cabin_category_id', 'version', *GRID_FIELDS
+    ):
+        session_id = cabin_price.pop('cruise_session_id')
+        category_id = cabin_price.pop('cabin_category_id')
+        cells[session_id][category_id] = {field: _json_value(value) for field, value in cabin_price.items()}
+    return {
+        'categories': list(
+            CabinCategory.objects.filter(ship_id=cruise.ship_id).order_by('category_code').values(
+                'id', 'name', 'category_code'
+            )
+        ),
+        'sessions': [
+            {
+                'id': session['id'],
+                'start_date': session['start_date'].isoformat(),
+                'end_date': session['end_date'].isoformat(),
+                'status': session['status'],
+                'prices': cells[session['id']],
+            }
+            for session in sessions
+        ],
+        'page': page,
+        'has_next': has_next,
+    }
+
+
+def save_grid(cruise, cells):
+    """
+    Save edited cells, each a dict with the cabin price ``id``, the
+    ``version`` it was loaded with and the GRID_FIELDS values. Returns
+    ``(saved, conflicts, errors)``: ``{id: new version}`` of the saved
+    cells, ``{id: current values}`` of cells changed by someone else since
+    they were loaded, and ``{id: form errors}``. Nothing is saved if any
+    cell is invalid.
+    """
+    forms = [PriceGridCellForm(cell) for cell in cells]
+    errors = {
+        form.data.get('id'): {field: list(messages) for field, messages in form.errors.items()}
+        for form in forms if not form.is_valid()
+    }
+    if errors:
+        return {}, {}, errors
+    edits = {form.cleaned_data['id']: form.cleaned_data for form in forms}
+
+    with transaction.atomic():
+        cabin_prices = list(
+            CruiseSessionCabinPrice.objects.select_for_update().filter(
+                pk__in=edits, cruise_session__cruise=cruise
+            ).only('id', 'cruise_session_id', 'version', *GRID_FIELDS)
+        )
+        unknown = edits.keys() - {cabin_price.pk for cabin_price in cabin_prices}
+        if unknown:
+            return {}, {}, {pk: {'id': [_("Not a cabin price of this cruise.")]} for pk in unknown}
+
+        now = timezone.now()
+        changed, conflicts = [], {}
+        for cabin_price in cabin_prices:
+            edit = edits[cabin_price.pk]
+            if edit['version'] != cabin_price.version:
+                conflicts[cabin_price.pk] = {
+                    'version': cabin_price.version,
+                    **{field: _json_value(getattr(cabin_price, field)) for field in GRID_FIELDS},
+                }
+                continue
+            for field in GRID_FIELDS:
+                setattr(cabin_price, field, edit[field])
+            cabin_price.version += 1
+            cabin_price.updated_at = now
+            changed.append(cabin_price)
+        # Rows are locked above, so the versions cannot move before this UPDATE
+        CruiseSessionCabinPrice.objects.bulk_update(changed, [*GRID_FIELDS, 'version', 'updated_at'])
+        transaction.on_commit(partial(
+            invalidate_price_snapshots, {cabin_price.cruise_session_id for cabin_price in changed}
+        ))
+    return {cabin_price.pk: cabin_price.version for cabin_price in changed}, conflicts, {}
@@ -0,0 +1,159 @@
+# cruises/pricing.py
+"""
+Pricing rules for quotes and bookings as pure functions.
+
+Nothing here queries the database: callers pass already loaded
+CruiseSessionCabinPrice and Promotion rows (or anything with the same
+attributes), so a whole session grid or thousands of quotes can be priced
+with the rows fetched in one go.
+"""
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.utils import timezone
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+
+@dataclass(frozen=True)
+class PriceRequest:
+    cabin_price: object
+    number_of_passengers: int
+    promotion: object = None
+    services_total: Decimal = ZERO
+
+
+@dataclass(frozen=True)
+class PriceBreakdown:
+    base_price: Decimal  # average price per person
+    cabin_total: Decimal
+    discount_amount: Decimal
+    services_total: Decimal
+    total_price: Decimal
+
+
+def _today(today):
+    return today or timezone.now().date()
+
+
+def round_price(amount):
+    return Decimal(amount).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def current_price(cabin_price, today=None):
+    """Early bird price until the deadline, regular price afterwards"""
+    if cabin_price.is_early_bird and cabin_price.early_bird_deadline:
+        if _today(today) <= cabin_price.early_bird_deadline:
+            return cabin_price.price
+    return cabin_price.regular_price
+
+
+def single_price(cabin_price, today=None):
+    """Price for single occupation: current price plus the single supplement"""
+    base_price = current_price(cabin_price, today)
+    return base_price + (base_price * cabin_price.single_supplement) / 100
+
+
+def third_person_price(cabin_price, today=None):
+    """Price for the third and further persons in a cabin"""
+    base_price = current_price(cabin_price, today)
+    return base_price - (base_price * cabin_price.third_person_discount) / 100
+
+
+def per_person_price(cabin_price, number_of_passengers, today=None):
+    """Average price per person: single supplement for one, third-person discount from three"""
+    today = _today(today)
+    if number_of_passengers == 1:
+        return single_price(cabin_price, today)
+    base_price = current_price(cabin_price, today)
+    if number_of_passengers > 2:
+        # First two passengers at regular price
+        return (
+            base_price * 2 +
+            third_person_price(cabin_price, today) * (number_of_passengers - 2)
+        ) / number_of_passengers
+    return base_price
+
+
+def promotion_discount(promotion, amount, today=None):
+    """
+    Discount a promotion gives on ``amount``, or None if there is no promotion
+    or it is not running on ``today``. Cabin upgrades carry no price discount.
+    """
+    if promotion is None:
+        return None
+    if not promotion.start_date <= _today(today) <= promotion.end_date:
+        return None
+    if promotion.discount_type == 'percentage':
+        discount = (amount * promotion.discount_value) / 100
+    elif promotion.discount_type == 'fixed':
+        discount = promotion.discount_value
+    else:
+        discount = ZERO
+    return round_price(min(discount, amount))
+
+
+def calculate_total(base_price, number_of_passengers=1, promotion=None, services_total=ZERO,
+                    locked_discount=None, today=None):
+    """
+    Total for an already agreed per-person ``base_price``.
+
+    The promotion discounts the cabin total only, not services. Without a
+    running promotion, ``locked_discount`` (a discount granted earlier or set
+    by hand) is kept if given, otherwise there is no discount.
+    """
+    base_price = round_price(base_price)
+    cabin_total = base_price * number_of_passengers
+    discount = promotion_discount(promotion, cabin_total, today)
+    if discount is None:
+        discount = locked_discount if locked_discount is not None else ZERO
+    services_total = round_price(services_total)
+    return PriceBreakdown(
+        base_price=base_price,
+        cabin_total=cabin_total,
+        discount_amount=discount,
+        services_total=services_total,
+        total_price=cabin_total + services_total - discount,
+    )
+
+
+def price(request, today=None):
+    """Price one PriceRequest from its cabin price row"""
+    today = _today(today)
+    return calculate_total(
+        per_person_price(request.cabin_price, request.number_of_passengers, today),
+        request.number_of_passengers,
+        promotion=request.promotion,
+        services_total=request.services_total,
+        today=today,
+    )
+
+
+def price_many(requests, today=None):
+    """Price a batch of PriceRequests against the same date; results keep the input order"""
+    today = _today(today)
+    return [price(request, today) for request in requests]
+
+
+def price_grid(cabin_prices, passenger_counts=None, promotions=None, today=None):
+    """
+    Price every cabin price of a session grid for each passenger count.
+
+    ``passenger_counts`` defaults to 1 up to each cabin category's capacity
+    (the category must then be loaded with the row). ``promotions`` maps
+    session ids to their promotion, e.g.
+    ``cruises.promotions.active_promotions_by_session()``. Returns
+    ``{(cabin_price.pk, number_of_passengers): PriceBreakdown}``.
+    """
+    today = _today(today)
+    promotions = promotions or {}
+    grid = {}
+    for cabin_price in cabin_prices:
+        promotion = promotions.get(cabin_price.cruise_session_id)
+        counts = passenger_counts or range(1, cabin_price.cabin_category.capacity + 1)
+        for number_of_passengers in counts:
+            grid[cabin_price.pk, number_of_passengers] = price(
+                PriceRequest(cabin_price, number_of_passengers, promotion), today
+            )
+    return grid
@@ -0,0 +1,96 @@
+# cruises/promotions.py
+"""
+In-process index of the promotions running today, keyed by cruise session.
+
+Built with one query and kept until the next promotion start or end date,
+until a Promotion or CruiseSession is written (see cruises.signals; the
+version key in the cache lets other processes notice the write too), or
+for at most PROMOTION_INDEX_MAX_AGE seconds.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import CruiseSession
+
+PROMOTION_INDEX_MAX_AGE = 300  # seconds
+PROMOTION_INDEX_VERSION_KEY = 'cruises:promotion-index-version'
+
+_lock = threading.Lock()
+_index = None
+
+
+class PromotionIndex:
+    def __init__(self, today, version, promotions, valid_until):
+        self.today = today
+        self.version = version
+        self.promotions = promotions  # {session_id: Promotion}
+        self.valid_until = valid_until
+        self.built_at = time.monotonic()
+
+    def is_current(self, today, version):
+        return (
+            self.today <= today < self.valid_until and
+            self.version == version and
+            time.monotonic() - self.built_at < PROMOTION_INDEX_MAX_AGE
+        )
+
+
+def _build_index(today, version):
+    sessions = CruiseSession.objects.filter(
+        promotion__end_date__gte=today
+    ).select_related('promotion').only('id', 'promotion')
+
+    promotions = {}
+    boundaries = []
+    for session in sessions:
+        promotion = session.promotion
+        if promotion.start_date <= today:
+            promotions[session.pk] = promotion
+            boundaries.append(promotion.end_date + timedelta(days=1))
+        else:
+            boundaries.append(promotion.start_date)
+    valid_until = min(boundaries) if boundaries else today + timedelta(days=1)
+    return PromotionIndex(today, version, promotions, valid_until)
+
+
+def active_promotions_by_session():
+    """Return ``{session_id: Promotion}`` for the promotions running today"""
+    global _index
+    today = timezone.now().date()
+    version = cache.get(PROMOTION_INDEX_VERSION_KEY, 0)
+    index = _index
+    if index is None or not index.is_current(today, version):
+        with _lock:
+            index = _index
+            if index is None or not index.is_current(today, version):
+                index = _index = _build_index(today, version)
+    return index.promotions
+
+
+def get_active_promotion(session_id):
+    """The promotion running today for a cruise session, or None"""
+    return active_promotions_by_session().get(session_id)
+
+
+def get_active_promotions(session_ids):
+    """Distinct promotions running today for any of the given sessions"""
+    promotions = active_promotions_by_session()
+    found = {}
+    for session_id in session_ids:
+        promotion = promotions.get(session_id)
+        if promotion is not None:
+            found[promotion.pk] = promotion
+    return sorted(found.values(), key=lambda promotion: promotion.name)
+
+
+def invalidate_promotion_index():
+    global _index
+    _index = None
+    try:
+        cache.incr(PROMOTION_INDEX_VERSION_KEY)
+    except ValueError:
+        cache.set(PROMOTION_INDEX_VERSION_KEY, 1, None)
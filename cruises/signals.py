@@ -0,0 +1,14 @@
+# cruises/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CruiseSession, Promotion
+from .promotions import invalidate_promotion_index
+
+
+@receiver([post_save, post_delete], sender=Promotion)
+@receiver([post_save, post_delete], sender=CruiseSession)
+def promotion_changed(sender, instance, **kwargs):
+    # Rebuilt after the commit only, or another thread could index the old rows again
+    transaction.on_commit(invalidate_promotion_index)
@@ -1,3 +1,675 @@
-from django.test import TestCase
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.exceptions import NON_FIELD_ERRORS
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.forms import modelform_factory
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from bookings.models import Booking
+from . import pricing
+from .adjustments import AdjustmentOutOfRange, apply_adjustment, preview_adjustment, select_cabin_prices
+from .cloning import DateShift, PriceRule, clone_cruises, roll_forward_season
+from .flyer.storage import flyer_content_hash, flyer_path, store_flyer
+from .forms import PriceAdjustmentForm, VersionedModelForm
+from .inventory import release_cabins, reserve_cabins
+from .price_grid import load_grid, save_grid
+from .promotions import get_active_promotion, invalidate_promotion_index
+from .utils.storage_utils import save_if_absent
+from .models import (
+    Brand,
+    CabinCategory,
+    ConcurrentModificationError,
+    Cruise,
+    CruiseCompany,
+    CruiseSession,
+    CruiseSessionCabinPrice,
+    CruiseType,
+    Port,
+    PriceAdjustment,
+    Promotion,
+    Region,
+    Ship,
+)
+
+
+def create_cabin_price(available_cabins):
+    today = timezone.now().date()
+    company = CruiseCompany.objects.create(name='Test Cruises', description='Test')
+    ship = Ship.objects.create(
+        name='MS Test', company=company, year_built=2020, passenger_capacity=180,
+        crew_capacity=40, gross_tonnage=2500, length=Decimal('110.00'), speed=Decimal('12.0')
+    )
+    cruise_type = CruiseType.objects.create(name='Test Cruise', description='Test', typical_duration=7)
+    port = Port.objects.create(name='Test Port', country='Test', port_code='TP1')
+    cruise = Cruise.objects.create(name='Test Cruise', description='Test', cruise_type=cruise_type, ship=ship)
+    session = CruiseSession.objects.create(
+        cruise=cruise, start_date=today + timedelta(days=30), end_date=today + timedelta(days=36),
+        embarkation_port=port, disembarkation_port=port, capacity=180, status='booking'
+    )
+    category = CabinCategory.objects.create(
+        name='Test Cabin', ship=ship, description='Test', capacity=2,
+        deck='Main', category_code='TC', square_meters=Decimal('16.00')
+    )
+    return CruiseSessionCabinPrice.objects.create(
+        cruise_session=session, cabin_category=category, price=Decimal('999.00'),
+        regular_price=Decimal('999.00'), available_cabins=available_cabins
+    )
+
+
+def thread_pool(max_workers=None, initializer=None):
+    # Workers share the test database only as threads of this process
+    return ThreadPoolExecutor(max_workers)
+
+
+def create_promotion():
+    today = timezone.now().date()
+    return Promotion.objects.create(
+        name='Winter Deal', description='Test', promotion_type='seasonal', discount_type='percentage',
+        discount_value=Decimal('10'), start_date=today, end_date=today + timedelta(days=30),
+        terms_conditions='Test'
+    )
+
+
+class CabinInventoryTest(TestCase):
+    def setUp(self):
+        self.cabin_price = create_cabin_price(available_cabins=2)
+
+    def test_reserve_fails_when_not_enough_cabins(self):
+        price = self.cabin_price
+        self.assertFalse(reserve_cabins(price.cruise_session_id, price.cabin_category_id, 3))
+        self.assertTrue(reserve_cabins(price.cruise_session_id, price.cabin_category_id, 2))
+        self.assertFalse(reserve_cabins(price.cruise_session_id, price.cabin_category_id))
+        price.refresh_from_db()
+        self.assertEqual(price.available_cabins, 0)
+
+    def test_release_returns_cabins(self):
+        price = self.cabin_price
+        self.assertTrue(price.decrease_availability(2))
+        self.assertEqual(price.available_cabins, 0)
+        self.assertTrue(release_cabins(price.cruise_session_id, price.cabin_category_id))
+        price.refresh_from_db()
+        self.assertEqual(price.available_cabins, 1)
+
+
+class CabinInventoryConcurrencyTest(TransactionTestCase):
+    CABINS = 10
+    THREADS = 16
+    ATTEMPTS_PER_THREAD = 3
+
+    def setUp(self):
+        self.cabin_price = create_cabin_price(available_cabins=self.CABINS)
+
+    def test_concurrent_reservations_never_oversell(self):
+        price = self.cabin_price
+        start = threading.Barrier(self.THREADS)
+        results = []
+        errors = []
+
+        def book():
+            try:
+                start.wait()
+                for _ in range(self.ATTEMPTS_PER_THREAD):
+                    while True:
+                        try:
+                            results.append(reserve_cabins(price.cruise_session_id, price.cabin_category_id))
+                            break
+                        except OperationalError:
+                            # SQLite reports "table is locked" instead of waiting for the writer
+                            time.sleep(0.001)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), self.THREADS * self.ATTEMPTS_PER_THREAD)
+        self.assertEqual(results.count(True), self.CABINS)
+        price.refresh_from_db()
+        self.assertEqual(price.available_cabins, 0)
+
+
+class VersionedModelTest(TestCase):
+    def setUp(self):
+        self.cabin_price = create_cabin_price(available_cabins=5)
+        self.form_class = modelform_factory(
+            CruiseSessionCabinPrice, form=VersionedModelForm, fields=['version', 'price']
+        )
+
+    def test_stale_save_raises(self):
+        stale = CruiseSessionCabinPrice.objects.get(pk=self.cabin_price.pk)
+        self.cabin_price.price = Decimal('899.00')
+        self.cabin_price.save()
+        self.assertEqual(self.cabin_price.version, 1)
+        stale.price = Decimal('799.00')
+        with self.assertRaises(ConcurrentModificationError):
+            stale.save()
+        self.assertEqual(stale.version, 0)
+        self.cabin_price.refresh_from_db()
+        self.assertEqual((self.cabin_price.price, self.cabin_price.version), (Decimal('899.00'), 1))
+
+    def test_stale_form_reports_conflict(self):
+        # The form was rendered at version 0, then a booking took a cabin
+        reserve_cabins(self.cabin_price.cruise_session_id, self.cabin_price.cabin_category_id)
+        form = self.form_class(
+            {'version': 0, 'price': '899.00'},
+            instance=CruiseSessionCabinPrice.objects.get(pk=self.cabin_price.pk)
+        )
+        self.assertFalse(form.is_valid())
+        self.assertTrue(form.has_error(NON_FIELD_ERRORS, 'version_conflict'))
+
+    def test_form_saved_after_a_concurrent_change_raises(self):
+        form = self.form_class(
+            {'version': 0, 'price': '899.00'},
+            instance=CruiseSessionCabinPrice.objects.get(pk=self.cabin_price.pk)
+        )
+        self.assertTrue(form.is_valid())
+        reserve_cabins(self.cabin_price.cruise_session_id, self.cabin_price.cabin_category_id)
+        with self.assertRaises(ConcurrentModificationError):
+            form.save()
+        self.cabin_price.refresh_from_db()
+        self.assertEqual((self.cabin_price.price, self.cabin_price.available_cabins), (Decimal('999.00'), 4))
+
+
+class CruiseCloningTest(TestCase):
+    def setUp(self):
+        self.price = create_cabin_price(available_cabins=5)
+        self.session = self.price.cruise_session
+        self.cruise = self.session.cruise
+
+    def add_sessions(self, count):
+        weeks = CruiseSession.objects.count()
+        for week in range(weeks, weeks + count):
+            session = CruiseSession.objects.create(
+                cruise=self.cruise,
+                start_date=self.session.start_date + timedelta(weeks=week),
+                end_date=self.session.end_date + timedelta(weeks=week),
+                embarkation_port=self.session.embarkation_port,
+                disembarkation_port=self.session.disembarkation_port,
+                capacity=180,
+                status='booking'
+            )
+            CruiseSessionCabinPrice.objects.create(
+                cruise_session=session, cabin_category=self.price.cabin_category,
+                price=Decimal('999.00'), regular_price=Decimal('999.00'), available_cabins=5
+            )
+
+    def test_clone_copies_sessions_and_prices(self):
+        copy, = clone_cruises(Cruise.objects.filter(pk=self.cruise.pk))
+        again, = clone_cruises(Cruise.objects.filter(pk=self.cruise.pk))
+        self.assertEqual(copy.name, 'Copy of Test Cruise')
+        self.assertNotEqual(copy.slug, again.slug)
+        copied_price = CruiseSessionCabinPrice.objects.get(cruise_session__cruise=copy)
+        self.assertEqual(copied_price.cruise_session.start_date, self.session.start_date)
+        self.assertEqual(copied_price.available_cabins, 5)
+
+    def test_roll_forward_shifts_dates_and_prices(self):
+        created, skipped = roll_forward_season(
+            Cruise.objects.filter(pk=self.cruise.pk), DateShift(years=1), PriceRule(Decimal('5'), Decimal('10'))
+        )
+        self.assertEqual((created, skipped), (1, 0))
+        new_price = CruiseSessionCabinPrice.objects.exclude(pk=self.price.pk).get()
+        self.assertEqual(new_price.cruise_session.status, 'scheduled')
+        self.assertEqual(new_price.cruise_session.end_date, DateShift(years=1)(self.session.end_date))
+        self.assertEqual(new_price.price, Decimal('1050.00'))
+
+        # The new season's sessions exist now and are not created twice
+        self.assertEqual(
+            roll_forward_season(
+                Cruise.objects.filter(pk=self.cruise.pk), DateShift(years=1), start_until=self.session.start_date
+            ),
+            (0, 1)
+        )
+
+    def test_clone_keeps_promotions_running(self):
+        promotion = create_promotion()
+        CruiseSession.objects.filter(pk=self.session.pk).update(promotion=promotion)
+        invalidate_promotion_index()
+        self.assertEqual(get_active_promotion(self.session.pk), promotion)
+        with self.captureOnCommitCallbacks(execute=True):
+            copy, = clone_cruises(Cruise.objects.filter(pk=self.cruise.pk))
+        self.assertEqual(get_active_promotion(CruiseSession.objects.get(cruise=copy).pk), promotion)
+
+    def test_roll_forward_restores_only_cabins_reserved_by_bookings(self):
+        reserve_cabins(self.session.pk, self.price.cabin_category_id, 2)
+        Booking.objects.bulk_create([
+            Booking(
+                cruise_session=self.session, cabin_category=self.price.cabin_category,
+                base_price=Decimal('999.00'), total_price=Decimal('999.00'),
+                status=Booking.Status.CONFIRMED, cabin_reserved=cabin_reserved
+            )
+            for cabin_reserved in (True, True, False)
+        ])
+        roll_forward_season(Cruise.objects.filter(pk=self.cruise.pk), DateShift(years=1))
+        new_price = CruiseSessionCabinPrice.objects.exclude(pk=self.price.pk).get()
+        self.assertEqual(new_price.available_cabins, 5)
+
+    def test_roll_forward_query_count_does_not_grow_with_sessions(self):
+        cruises = Cruise.objects.filter(pk=self.cruise.pk)
+        self.add_sessions(2)
+        with CaptureQueriesContext(connection) as few:
+            roll_forward_season(cruises, DateShift(weeks=52))
+        self.add_sessions(30)
+        sessions = CruiseSession.objects.count()
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(roll_forward_season(cruises, DateShift(weeks=104)), (sessions, 0))
+        self.assertEqual(len(many.captured_queries), len(few.captured_queries))
+
+    def test_date_shift_by_a_year_keeps_leap_days_in_february(self):
+        self.assertEqual(DateShift(years=1)(date(2028, 2, 29)), date(2029, 2, 28))
+
+
+class PriceAdjustmentTest(TestCase):
+    def setUp(self):
+        self.price = create_cabin_price(available_cabins=5)
+
+    def test_preview_does_not_change_prices(self):
+        preview = preview_adjustment(
+            select_cabin_prices(deck='Main'), ['price'], PriceAdjustment.ChangeType.PERCENT, Decimal('10')
+        )
+        self.assertEqual(preview['rows'], 1)
+        self.assertEqual(preview['totals']['price']['after'], Decimal('1098.90'))
+        self.price.refresh_from_db()
+        self.assertEqual(self.price.price, Decimal('999.00'))
+
+    def test_apply_updates_prices_in_one_statement_and_records_it(self):
+        with CaptureQueriesContext(connection) as queries:
+            adjustment = apply_adjustment(
+                select_cabin_prices(ship=self.price.cabin_category.ship_id),
+                ['price', 'regular_price'],
+                PriceAdjustment.ChangeType.AMOUNT,
+                Decimal('-100'),
+                filters={'ship': self.price.cabin_category.ship_id}
+            )
+        updates = [query for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(adjustment.rows_updated, 1)
+        self.assertEqual(adjustment.totals['price'], {
+            'before': '999.00', 'after': '899.00', 'lowest': '899.00', 'highest': '899.00'
+        })
+        self.price.refresh_from_db()
+        self.assertEqual((self.price.price, self.price.regular_price), (Decimal('899.00'), Decimal('899.00')))
+        self.assertEqual(self.price.version, 1)
+        self.assertFalse(select_cabin_prices(deck='Lower').exists())
+
+    def test_changes_leaving_the_values_a_field_holds_are_rejected(self):
+        category = self.price.cabin_category
+        category.pk, category.category_code = None, 'TC2'
+        category.save()
+        CruiseSessionCabinPrice.objects.create(
+            cruise_session=self.price.cruise_session, cabin_category=category, price=Decimal('999.00'),
+            regular_price=Decimal('999.00'), single_supplement=Decimal('60.00'), available_cabins=5
+        )
+        cabin_prices = select_cabin_prices(deck='Main')
+        changes = [
+            (['single_supplement'], PriceAdjustment.ChangeType.PERCENT, Decimal('1600')),  # 50 -> 850, 60 -> 1020
+            (['price', 'regular_price'], PriceAdjustment.ChangeType.AMOUNT, Decimal('-1000')),
+        ]
+        for change, rows in zip(changes, [1, 2]):
+            with self.subTest(change=change):
+                self.assertEqual(preview_adjustment(cabin_prices, *change)['out_of_range'], rows)
+                with self.assertRaisesMessage(AdjustmentOutOfRange, f'{rows} cabin price(s)'):
+                    apply_adjustment(cabin_prices, *change)
+        with self.assertRaisesMessage(CommandError, '2 cabin price(s)'):
+            call_command('adjust_prices', '--amount', '-1000', '--deck', 'Main', '--apply', stdout=StringIO())
+
+        self.assertFalse(PriceAdjustment.objects.exists())
+        self.assertEqual(
+            sorted(CruiseSessionCabinPrice.objects.values_list('price', 'single_supplement', 'version')),
+            [(Decimal('999.00'), Decimal('50.00'), 0), (Decimal('999.00'), Decimal('60.00'), 0)]
+        )
+
+    def test_single_supplement_only_changes_by_a_percentage(self):
+        with self.assertRaises(ValueError):
+            apply_adjustment(
+                select_cabin_prices(), ['price', 'single_supplement'], PriceAdjustment.ChangeType.AMOUNT, Decimal('10')
+            )
+        form = PriceAdjustmentForm({
+            'price_fields': ['single_supplement'], 'change_type': PriceAdjustment.ChangeType.AMOUNT, 'value': '10'
+        })
+        self.assertIn('price_fields', form.errors)
+        with self.assertRaises(CommandError):
+            call_command('adjust_prices', '--amount', '10', '--field', 'single_supplement', stdout=StringIO())
+        self.price.refresh_from_db()
+        self.assertEqual((self.price.price, self.price.single_supplement), (Decimal('999.00'), Decimal('50.00')))
+
+
+class PriceGridTest(TestCase):
+    def setUp(self):
+        self.price = create_cabin_price(available_cabins=5)
+        self.cruise = self.price.cruise_session.cruise
+
+    def cell(self, **changes):
+        return {
+            'id': self.price.pk, 'version': self.price.version, 'price': '899.00',
+            'regular_price': '999.00', 'available_cabins': 5, **changes
+        }
+
+    def test_load_grid_uses_three_queries(self):
+        with self.assertNumQueries(3):
+            grid = load_grid(self.cruise)
+        session, = grid['sessions']
+        self.assertEqual(session['prices'][self.price.cabin_category_id]['price'], '999.00')
+        self.assertFalse(grid['has_next'])
+
+    def test_save_grid_rejects_stale_cells(self):
+        saved, conflicts, errors = save_grid(self.cruise, [self.cell()])
+        self.assertEqual((saved, conflicts, errors), ({self.price.pk: 1}, {}, {}))
+        self.price.refresh_from_db()
+        self.assertEqual(self.price.price, Decimal('899.00'))
+
+        # A booking took a cabin after the grid was loaded
+        reserve_cabins(self.price.cruise_session_id, self.price.cabin_category_id)
+        saved, conflicts, errors = save_grid(self.cruise, [self.cell(version=1, price='799.00')])
+        self.assertEqual(saved, {})
+        self.assertEqual(conflicts[self.price.pk]['available_cabins'], 4)
+        self.price.refresh_from_db()
+        self.assertEqual(self.price.price, Decimal('899.00'))
+
+
+class FlyerContentHashTest(TestCase):
+    def setUp(self):
+        self.price = create_cabin_price(available_cabins=5)
+
+    def content_hash(self):
+        cruise = Cruise.objects.select_related('cruise_type', 'ship', 'ship__company').get()
+        with self.assertNumQueries(3):
+            return flyer_content_hash(cruise)
+
+    def test_hash_changes_with_prices_only(self):
+        content_hash = self.content_hash()
+        self.assertEqual(self.content_hash(), content_hash)
+        reserve_cabins(self.price.cruise_session_id, self.price.cabin_category_id)
+        self.assertNotEqual(self.content_hash(), content_hash)
+
+
+@mock.patch('cruises.management.commands.prerender_flyers.render_pool', thread_pool)
+class FlyerStorageTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.cruise = create_cabin_price(available_cabins=5).cruise_session.cruise
+
+    def stored_flyers(self):
+        return sorted(default_storage.listdir(f'flyers/{self.cruise.slug}')[1])
+
+    def test_storing_never_replaces_the_current_flyer(self):
+        name = store_flyer(self.cruise, 'current', ContentFile(b'first'))
+        self.assertEqual(store_flyer(self.cruise, 'current', ContentFile(b'second')), name)
+        with default_storage.open(name) as flyer:
+            self.assertEqual(flyer.read(), b'first')
+
+    def test_losing_a_save_race_keeps_the_winners_file(self):
+        name = flyer_path(self.cruise, 'current')
+        default_storage.save(name, ContentFile(b'winner'))
+        # Another request stored the file after this one checked for it
+        exists = default_storage.exists
+        checks = []
+
+        def exists_after_first_check(name):
+            checks.append(name)
+            return len(checks) > 1 and exists(name)
+
+        with mock.patch.object(default_storage, 'exists', exists_after_first_check):
+            self.assertFalse(save_if_absent(name, ContentFile(b'loser')))
+        self.assertGreater(len(checks), 1)
+        self.assertEqual(self.stored_flyers(), ['current.pdf'])
+        with default_storage.open(name) as flyer:
+            self.assertEqual(flyer.read(), b'winner')
+
+    def test_download_serves_the_rendered_flyer_and_keeps_old_versions(self):
+        store_flyer(self.cruise, 'outdated', ContentFile(b'old'))
+        response = self.client.get(reverse('cruises:cruise_flyer', args=[self.cruise.slug]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        self.assertEqual(len(self.stored_flyers()), 2)
+
+        call_command('prerender_flyers', '--workers', '1', stdout=StringIO())
+        self.assertEqual(self.stored_flyers(), [f'{flyer_content_hash(self.cruise)}.pdf'])
+
+
+class PricingTest(SimpleTestCase):
+    DEADLINE = date(2027, 3, 31)
+
+    def cabin_price(self, **changes):
+        return SimpleNamespace(**{
+            'price': Decimal('800.00'),
+            'regular_price': Decimal('1000.00'),
+            'is_early_bird': True,
+            'early_bird_deadline': self.DEADLINE,
+            'single_supplement': Decimal('50.00'),
+            'third_person_discount': Decimal('30.00'),
+            **changes
+        })
+
+    def promotion(self, discount_type='percentage', discount_value=Decimal('10')):
+        return SimpleNamespace(
+            start_date=date(2027, 1, 1), end_date=date(2027, 1, 31),
+            discount_type=discount_type, discount_value=discount_value
+        )
+
+    def test_per_person_price(self):
+        cabin_price = self.cabin_price()
+        after_deadline = self.DEADLINE + timedelta(days=1)
+        self.assertEqual(pricing.per_person_price(cabin_price, 2, self.DEADLINE), Decimal('800.00'))
+        self.assertEqual(pricing.per_person_price(cabin_price, 2, after_deadline), Decimal('1000.00'))
+        self.assertEqual(pricing.per_person_price(cabin_price, 1, after_deadline), Decimal('1500.00'))
+        # Two passengers at the full price, the others with the third-person discount
+        self.assertEqual(pricing.per_person_price(cabin_price, 3, after_deadline), Decimal('900.00'))
+        self.assertEqual(pricing.per_person_price(cabin_price, 4, after_deadline), Decimal('850.00'))
+
+    def test_promotion_discount_only_while_running(self):
+        promotion = self.promotion()
+        amount = Decimal('1999.99')
+        self.assertIsNone(pricing.promotion_discount(None, amount, date(2027, 1, 15)))
+        self.assertIsNone(pricing.promotion_discount(promotion, amount, date(2026, 12, 31)))
+        self.assertEqual(pricing.promotion_discount(promotion, amount, date(2027, 1, 1)), Decimal('200.00'))
+        self.assertEqual(pricing.promotion_discount(promotion, amount, date(2027, 1, 31)), Decimal('200.00'))
+        self.assertIsNone(pricing.promotion_discount(promotion, amount, date(2027, 2, 1)))
+
+    def test_promotion_discount_kinds(self):
+        today = date(2027, 1, 15)
+        fixed = self.promotion('fixed', Decimal('500.00'))
+        self.assertEqual(pricing.promotion_discount(fixed, Decimal('800.00'), today), Decimal('500.00'))
+        self.assertEqual(pricing.promotion_discount(fixed, Decimal('300.00'), today), Decimal('300.00'))
+        self.assertEqual(pricing.promotion_discount(self.promotion('upgrade'), Decimal('800.00'), today), Decimal('0.00'))
+
+    def test_calculate_total_rounds_to_cents(self):
+        breakdown = pricing.calculate_total(
+            Decimal('2750') / 3, 3, promotion=self.promotion(), services_total=Decimal('99.999'),
+            today=date(2027, 1, 15)
+        )
+        self.assertEqual(breakdown.base_price, Decimal('916.67'))
+        self.assertEqual(breakdown.cabin_total, Decimal('2750.01'))
+        # Services are not discounted
+        self.assertEqual(breakdown.discount_amount, Decimal('275.00'))
+        self.assertEqual(breakdown.services_total, Decimal('100.00'))
+        self.assertEqual(breakdown.total_price, Decimal('2575.01'))
+
+    def test_calculate_total_keeps_locked_discount_without_running_promotion(self):
+        after_promotion = date(2027, 2, 1)
+        breakdown = pricing.calculate_total(
+            Decimal('1000'), 2, promotion=self.promotion(), locked_discount=Decimal('150.00'), today=after_promotion
+        )
+        self.assertEqual((breakdown.discount_amount, breakdown.total_price), (Decimal('150.00'), Decimal('1850.00')))
+        breakdown = pricing.calculate_total(Decimal('1000'), 2, promotion=self.promotion(), today=after_promotion)
+        self.assertEqual((breakdown.discount_amount, breakdown.total_price), (Decimal('0.00'), Decimal('2000.00')))
+        # A running promotion replaces the locked discount
+        breakdown = pricing.calculate_total(
+            Decimal('1000'), 2, promotion=self.promotion(), locked_discount=Decimal('150.00'), today=date(2027, 1, 2)
+        )
+        self.assertEqual(breakdown.discount_amount, Decimal('200.00'))
+
+
+class PromotionIndexTest(TestCase):
+    def setUp(self):
+        self.session = create_cabin_price(available_cabins=5).cruise_session
+        invalidate_promotion_index()
+
+    def test_index_is_rebuilt_after_commit(self):
+        self.assertIsNone(get_active_promotion(self.session.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            promotion = create_promotion()
+            self.session.promotion = promotion
+            self.session.save()
+            self.assertIsNone(get_active_promotion(self.session.pk))
+        self.assertEqual(get_active_promotion(self.session.pk), promotion)
+
+
+class AdminChangelistTest(TestCase):
+    def setUp(self):
+        self.cabin_price = create_cabin_price(available_cabins=10)
+        self.session = self.cabin_price.cruise_session
+        self.ship = self.cabin_price.cabin_category.ship
+        self.client.force_login(
+            User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        )
+
+    def changelist_queries(self, url_name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return len(queries.captured_queries)
+
+    def assert_queries_do_not_grow(self, url_name, create_rows):
+        create_rows(range(5))
+        queries_for_few = self.changelist_queries(url_name)
+        create_rows(range(5, 50))
+        self.assertEqual(self.changelist_queries(url_name), queries_for_few)
+
+    def create_sessions(self, numbers):
+        start = self.session.start_date
+        sessions = CruiseSession.objects.bulk_create([
+            CruiseSession(
+                cruise_id=self.session.cruise_id,
+                start_date=start + timedelta(weeks=i + 1),
+                end_date=start + timedelta(weeks=i + 1, days=6),
+                embarkation_port_id=self.session.embarkation_port_id,
+                disembarkation_port_id=self.session.disembarkation_port_id,
+                capacity=180,
+                status='booking'
+            )
+            for i in numbers
+        ])
+        CruiseSessionCabinPrice.objects.bulk_create([
+            CruiseSessionCabinPrice(
+                cruise_session=session, cabin_category_id=self.cabin_price.cabin_category_id,
+                price=Decimal('899.00'), regular_price=Decimal('999.00'), available_cabins=4
+            )
+            for session in sessions
+        ])
+
+    def test_session_changelist(self):
+        self.assert_queries_do_not_grow('admin:cruises_cruisesession_changelist', self.create_sessions)
+
+    def test_cabin_price_changelist(self):
+        self.assert_queries_do_not_grow('admin:cruises_cruisesessioncabinprice_changelist', self.create_sessions)
+
+    def test_cruise_changelist(self):
+        cruise = self.session.cruise
+
+        def create_cruises(numbers):
+            cruises = Cruise.objects.bulk_create([
+                Cruise(
+                    name=f'Test Cruise {i}', slug=f'test-cruise-{i}', description='Test',
+                    cruise_type_id=cruise.cruise_type_id, ship_id=cruise.ship_id
+                )
+                for i in numbers
+            ])
+            sessions = CruiseSession.objects.bulk_create([
+                CruiseSession(
+                    cruise=cruise,
+                    start_date=self.session.start_date + timedelta(weeks=week),
+                    end_date=self.session.end_date + timedelta(weeks=week),
+                    embarkation_port_id=self.session.embarkation_port_id,
+                    disembarkation_port_id=self.session.disembarkation_port_id,
+                    capacity=180,
+                    status='booking'
+                )
+                for cruise in cruises for week in (1, 2)
+            ])
+            CruiseSessionCabinPrice.objects.bulk_create([
+                CruiseSessionCabinPrice(
+                    cruise_session=session, cabin_category_id=self.cabin_price.cabin_category_id,
+                    price=Decimal('899.00'), regular_price=Decimal('999.00'), available_cabins=4
+                )
+                for session in sessions
+            ])
+
+        self.assert_queries_do_not_grow('admin:cruises_cruise_changelist', create_cruises)
+
+    def test_region_changelist(self):
+        parent = Region.objects.create(name='Europe', description='Test')
+        port = Port.objects.get()
+
+        def create_regions(numbers):
+            regions = Region.objects.bulk_create([
+                Region(name=f'Region {i}', description='Test', parent_region=parent) for i in numbers
+            ])
+            Region.ports.through.objects.bulk_create([
+                Region.ports.through(region=region, port=port) for region in regions
+            ])
+
+        self.assert_queries_do_not_grow('admin:cruises_region_changelist', create_regions)
+
+    def test_company_changelist(self):
+        region = Region.objects.create(name='Europe', description='Test')
+
+        def create_companies(numbers):
+            companies = CruiseCompany.objects.bulk_create([
+                CruiseCompany(name=f'Company {i}', slug=f'company-{i}', description='Test') for i in numbers
+            ])
+            CruiseCompany.operating_regions.through.objects.bulk_create([
+                CruiseCompany.operating_regions.through(cruisecompany=company, region=region)
+                for company in companies
+            ])
+
+        self.assert_queries_do_not_grow('admin:cruises_cruisecompany_changelist', create_companies)
+
+    def test_ship_changelist(self):
+        brand = Brand.objects.create(name='Test Brand', description='Test', parent_company=self.ship.company)
+
+        def create_ships(numbers):
+            Ship.objects.bulk_create([
+                Ship(
+                    name=f'MS Test {i}', company=self.ship.company, brand=brand, year_built=2020,
+                    passenger_capacity=180, crew_capacity=40, gross_tonnage=2500,
+                    length=Decimal('110.00'), speed=Decimal('12.0')
+                )
+                for i in numbers
+            ])
+
+        self.assert_queries_do_not_grow('admin:cruises_ship_changelist', create_ships)
+
+
+class StartupBudgetTest(SimpleTestCase):
+    def test_cold_start_stays_within_the_budget(self):
+        out = StringIO()
+        # Raises CommandError over the budget or when PDF tooling loads at startup
+        call_command('benchmark_startup', '--runs', '3', stdout=out)
+        self.assertIn('Within the 600 ms budget', out.getvalue())
+
+    def test_exceeding_the_budget_fails(self):
+        with self.assertRaisesMessage(CommandError, 'over the 0 ms budget'):
+            call_command('benchmark_startup', '--runs', '1', '--budget-ms', '0', stdout=StringIO())
@@ -1,9 +1,25 @@
 #cruises/utils/pdf_utils.py
+import os
+from django.conf import settings
 from reportlab.graphics.shapes import Drawing, Rect, String
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+FONTS = {
+    'Roboto': 'Roboto-Regular.ttf',
+    'Roboto-Bold': 'Roboto-Bold.ttf',
+}
+
+def register_fonts():
+    """Register the flyer TTF fonts once per process (parsing them is slow)"""
+    registered = pdfmetrics.getRegisteredFontNames()
+    for name, filename in FONTS.items():
+        if name not in registered:
+            pdfmetrics.registerFont(TTFont(name, os.path.join(settings.BASE_DIR, 'fonts', filename)))
 
 def create_colored_box(text, width, height, bg_color, text_color):
     drawing = Drawing(width, height)
     drawing.add(Rect(0, 0, width, height, fillColor=bg_color, strokeColor=None))
     drawing.add(String(width/2, height/2, text, fontSize=14, fontName="Roboto-Bold", 
                        fillColor=text_color, textAnchor='middle'))
-    return drawing
\ No newline at end of file
+    return drawing
@@ -0,0 +1,32 @@
+#cruises/utils/process_utils.py
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.utils.module_loading import import_string
+
+
+def render_pool(max_workers=None, initializer=None):
+    """
+    Process pool for PDF rendering. Workers are spawned, not forked: they
+    share no database sockets or other state with the parent and open their
+    own connections. ``initializer`` is the dotted path of a warm-up function
+    run once per worker after Django is set up; a path rather than the
+    function, since unpickling it would import its module (and the models)
+    before that.
+    """
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=start_render_worker,
+        initargs=(initializer,)
+    )
+
+
+def start_render_worker(initializer=None):
+    """Render pool initializer: set up Django in the fresh worker, then run the warm-up"""
+    if not apps.ready:
+        django.setup()
+    if initializer:
+        import_string(initializer)()
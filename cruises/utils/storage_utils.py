@@ -0,0 +1,36 @@
+#cruises/utils/storage_utils.py
+import posixpath
+
+from django.core.files.storage import default_storage
+
+
+def save_if_absent(name, content):
+    """
+    Store ``content`` under ``name`` unless a file is there already; returns
+    whether this call stored it. Never replaces or deletes the file at
+    ``name``: when two requests race, the storage gives the second one a
+    suffixed name (files are created exclusively), and that copy is removed.
+    """
+    if default_storage.exists(name):
+        return False
+    saved = default_storage.save(name, content)
+    if saved != name:
+        default_storage.delete(saved)
+        return False
+    return True
+
+
+def remove_other_files(name):
+    """Delete every file next to ``name`` except ``name`` itself; returns the number deleted"""
+    directory = posixpath.dirname(name)
+    try:
+        _, files = default_storage.listdir(directory)
+    except (FileNotFoundError, NotImplementedError):
+        return 0
+    removed = 0
+    for filename in files:
+        other = posixpath.join(directory, filename)
+        if other != name:
+            default_storage.delete(other)
+            removed += 1
+    return removed
@@ -6,7 +6,12 @@ from django.conf import settings
 from django.views.generic import ListView
 from django.db.models import Min, OuterRef, Subquery, Prefetch, Q
 from django.utils import timezone
+from django.http import FileResponse
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+import logging
 import random
+from io import BytesIO
 
 from .models import (
     Cruise,
@@ -14,10 +19,13 @@ from .models import (
     Brand,
     CruiseSessionCabinPrice,
     CabinCategory,
-    CruiseItinerary,
-    Promotion
+    CruiseItinerary
 )
 from .forms import ContactForm
+from .flyer.storage import flyer_content_hash, get_prerendered_flyer, store_flyer
+from .promotions import get_active_promotions
+
+logger = logging.getLogger(__name__)
 
 def about(request):
     context = {
@@ -192,11 +200,7 @@ def cruise_detail(request, cruise_id):
     itinerary = cruise.itineraries.all().order_by('day')
 
     # Check for promotions
-    current_promotions = Promotion.objects.filter(
-        sessions__in=active_sessions,
-        start_date__lte=timezone.now().date(),
-        end_date__gte=timezone.now().date()
-    ).distinct()
+    current_promotions = get_active_promotions(session.pk for session in active_sessions)
 
     # Get min and max prices
     price_range = cruise.get_price_range()
@@ -314,9 +318,31 @@ class FeaturedCruisesView(ListView):
         ).distinct()[:6]
 
 def download_cruise_flyer(request, cruise_slug):
-    cruise = get_object_or_404(Cruise, slug=cruise_slug)
-    response = cruise.generate_pdf_flyer()
-    if response:
-        response['Content-Disposition'] = f'attachment; filename="{cruise.slug}_flyer.pdf"'
-        return response
-    return HttpResponse("Error generating PDF", status=500)
\ No newline at end of file
+    cruise = get_object_or_404(Cruise.objects.select_related('cruise_type', 'ship', 'ship__company'), slug=cruise_slug)
+    content_hash = flyer_content_hash(cruise)
+    flyer = None
+    name = get_prerendered_flyer(cruise, content_hash)
+    if name:
+        try:
+            flyer = default_storage.open(name, 'rb')
+        except FileNotFoundError:
+            # Being replaced by prerender_flyers --force right now
+            pass
+    if flyer is None:
+        # Not pre-rendered yet (or content changed since the last run). Import
+        # here so ReportLab is only loaded by the processes that render flyers.
+        from .flyer.generator import render_flyer
+
+        cruise_id, pdf, error = render_flyer(cruise.id)
+        if error:
+            logger.error(f"Error generating flyer for cruise {cruise.id}: {error}")
+            return HttpResponse("Error generating PDF", status=500)
+        store_flyer(cruise, content_hash, ContentFile(pdf))
+        # Served from memory: a concurrent download may be storing the same file
+        flyer = BytesIO(pdf)
+    return FileResponse(
+        flyer,
+        as_attachment=True,
+        filename=f"{cruise.slug}_flyer.pdf",
+        content_type='application/pdf'
+    )
\ No newline at end of file
@@ -1,14 +1,18 @@
 # quotes/admin.py
+import tempfile
 
 from django.contrib import admin, messages
 from django.utils.html import format_html
 from django.urls import path, reverse
-from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.http import HttpResponse, FileResponse
 from django.utils.translation import gettext_lazy as _
 
+from bookings.models import SearchDocument
+from bookings.search import IndexedSearchMixin
+from cruises.admin import PassengerSummaryAdminMixin
 from .models import Quote, QuotePassenger, QuoteAdditionalService
-from .utils import generate_quote_pdf
+from .services import convert_quotes_to_bookings, with_conversion_flags
 from .views import convert_quote_to_booking
 
 
@@ -30,7 +34,7 @@ class QuoteAdditionalServiceInline(admin.TabularInline):
     fields = ('service_type', 'service_name', 'description', 'price', 'quantity')
 
 @admin.register(Quote)
-class QuoteAdmin(admin.ModelAdmin):
+class QuoteAdmin(PassengerSummaryAdminMixin, IndexedSearchMixin, admin.ModelAdmin):
     list_display = (
         'id',
         'passenger_display',
@@ -55,6 +59,7 @@ class QuoteAdmin(admin.ModelAdmin):
         'cruise_session__cruise__name',
         'cabin_category__name'
     )
+    search_index_kind = SearchDocument.Kind.QUOTE
     readonly_fields = (
         'total_price',
         'base_price',
@@ -90,6 +95,17 @@ class QuoteAdmin(admin.ModelAdmin):
     )
     raw_id_fields = ('cruise_session', 'cabin_category', 'applied_promotion')
 
+    def get_queryset(self, request):
+        # The booking is joined, convertibility annotated and the lead passenger
+        # stored on the quote, so a page costs the same queries for any size
+        return with_conversion_flags(
+            super().get_queryset(request).select_related(None).select_related(
+                'cruise_session__cruise',
+                'cabin_category__ship',
+                'booking'
+            )
+        )
+
     def get_price_display(self, obj):
         return format_html(
             """Base: €{}<br>
@@ -109,10 +125,7 @@ class QuoteAdmin(admin.ModelAdmin):
     booking_link.short_description = _('Booking')
 
     def passenger_display(self, obj):
-        passenger = obj.passengers.first()
-        if passenger:
-            return f"{passenger.full_name}"
-        return _("No passenger")
+        return obj.lead_passenger_name or _("No passenger")
     passenger_display.short_description = _('Lead Passenger')
 
     def actions_display(self, obj):
@@ -125,7 +138,7 @@ class QuoteAdmin(admin.ModelAdmin):
         )
         
         # Convert to Booking button (if applicable)
-        if obj.can_convert_to_booking():
+        if obj.convertible:
             convert_url = reverse('admin:convert_quote_to_booking', args=[obj.pk])
             buttons.append(
                 f'<a class="button" href="{convert_url}">{_("Convert to Booking")}</a>'
@@ -135,12 +148,18 @@ class QuoteAdmin(admin.ModelAdmin):
     actions_display.short_description = _('Actions')
 
     def generate_quote_view(self, request, quote_id):
+        # Import here so ReportLab and PyPDF2 are only loaded when a PDF is requested
+        from .utils import get_quote_pdf
+
         quote = get_object_or_404(Quote, id=quote_id)
         try:
-            pdf = generate_quote_pdf(quote)
-            response = HttpResponse(pdf, content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="quote_{quote.id}.pdf"'
-            return response
+            pdf = get_quote_pdf(quote)
+            return FileResponse(
+                pdf,
+                as_attachment=True,
+                filename=f"quote_{quote.id}.pdf",
+                content_type='application/pdf'
+            )
         except Exception as e:
             self.message_user(request, f"Error generating PDF: {str(e)}", messages.ERROR)
             return redirect('admin:quotes_quote_change', quote_id)
@@ -161,51 +180,42 @@ class QuoteAdmin(admin.ModelAdmin):
         ]
         return custom_urls + urls
     
-    actions = ['convert_to_booking']
+    actions = ['convert_to_booking', 'export_pdfs']
 
     def convert_to_booking(self, request, queryset):
-        converted = 0
-        for quote in queryset:
-            if quote.can_convert_to_booking():
-                try:
-                    booking = quote.convert_to_booking()
-                    converted += 1
-                    self.message_user(
-                        request,
-                        _("Quote %(quote)s successfully converted to Booking %(booking)s") % {
-                            'quote': quote.id,
-                            'booking': booking.id
-                        },
-                        messages.SUCCESS
-                    )
-                except Exception as e:
-                    self.message_user(
-                        request,
-                        _("Error converting Quote %(quote)s to Booking: %(error)s") % {
-                            'quote': quote.id,
-                            'error': str(e)
-                        },
-                        messages.ERROR
-                    )
-            else:
-                self.message_user(
-                    request,
-                    _("Quote %(quote)s cannot be converted to a booking.") % {
-                        'quote': quote.id
-                    },
-                    messages.WARNING
-                )
-        
-        if converted:
+        bookings, errors = convert_quotes_to_bookings(list(queryset.values_list('pk', flat=True)))
+        for quote_id, error in sorted(errors.items()):
+            self.message_user(request, error, messages.WARNING)
+
+        if bookings:
             self.message_user(
                 request,
                 _("%(count)d quote(s) were converted to bookings.") % {
-                    'count': converted
+                    'count': len(bookings)
                 },
                 messages.SUCCESS
             )
     convert_to_booking.short_description = _("Convert selected quotes to bookings")
 
+    @admin.action(description=_("Download PDFs of selected quotes (ZIP)"))
+    def export_pdfs(self, request, queryset):
+        # Import here so ReportLab and PyPDF2 are only loaded when a PDF is requested
+        from .utils import export_quote_pdfs
+
+        archive = tempfile.TemporaryFile()
+        failures = export_quote_pdfs(list(queryset.values_list('pk', flat=True)), archive)
+        for quote_id, error in failures:
+            self.message_user(
+                request,
+                _("Error generating PDF for Quote %(quote)s: %(error)s") % {
+                    'quote': quote_id,
+                    'error': error
+                },
+                messages.ERROR
+            )
+        archive.seek(0)
+        return FileResponse(archive, as_attachment=True, filename='quotes.zip')
+
 @admin.register(QuotePassenger)
 class QuotePassengerAdmin(admin.ModelAdmin):
     list_display = (
@@ -221,8 +231,7 @@ class QuotePassengerAdmin(admin.ModelAdmin):
         'first_name',
         'last_name',
         'email',
-        'passport_number',
-        'quote__confirmation_number'
+        'passport_number'
     )
     raw_id_fields = ('quote',)
 
@@ -232,7 +241,7 @@ class QuotePassengerAdmin(admin.ModelAdmin):
     get_full_name.short_description = _('Full Name')
 
 @admin.register(QuoteAdditionalService)
-class QuoteAdditionalServiceAdmin(admin.ModelAdmin):
+class QuoteAdditionalServiceAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = (
         'service_name',
         'service_type',
@@ -248,4 +257,7 @@ class QuoteAdditionalServiceAdmin(admin.ModelAdmin):
         'quote__passengers__first_name',
         'quote__passengers__last_name'
     )
+    search_index_kind = SearchDocument.Kind.QUOTE
+    search_index_lookup = 'quote_id'
+    search_index_own_fields = ('service_name', 'description')
     raw_id_fields = ('quote',)
\ No newline at end of file
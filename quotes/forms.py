@@ -5,6 +5,8 @@ from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
 
+from cruises import pricing
+from cruises.promotions import get_active_promotion
 from cruises.models import (
     CruiseSession,
     CruiseSessionCabinPrice,
@@ -133,18 +135,13 @@ class QuoteForm(forms.ModelForm):
                 })
 
             # Calculate prices
-            base_price = cruise_session_cabin_price.get_current_price()
-            if number_of_passengers == 1:
-                base_price = cruise_session_cabin_price.get_single_price()
-            elif number_of_passengers > 2:
-                # For third person onwards, apply third person discount
-                base_price = (
-                    base_price * 2 +  # First two passengers at regular price
-                    cruise_session_cabin_price.get_third_person_price() * (number_of_passengers - 2)
-                ) / number_of_passengers
-
-            cleaned_data['base_price'] = base_price
-            cleaned_data['total_price'] = base_price * number_of_passengers
+            promotion = get_active_promotion(cruise_session_cabin_price.cruise_session_id)
+            breakdown = pricing.price(
+                pricing.PriceRequest(cruise_session_cabin_price, number_of_passengers, promotion)
+            )
+            cleaned_data['applied_promotion'] = promotion
+            cleaned_data['base_price'] = breakdown.base_price
+            cleaned_data['total_price'] = breakdown.total_price
 
         return cleaned_data
 
@@ -156,8 +153,26 @@ class QuoteForm(forms.ModelForm):
             instance.cabin_category = self.cleaned_data['cruise_session_cabin_price'].cabin_category
             instance.base_price = self.cleaned_data['base_price']
             instance.total_price = self.cleaned_data['total_price']
+            instance.applied_promotion = self.cleaned_data.get('applied_promotion')
         
         if commit:
             instance.save()
         
-        return instance
\ No newline at end of file
+        return instance
+
+
+class QuoteIntakeForm(forms.Form):
+    """
+    Field-level validation of a quote request posted as JSON.
+
+    Runs no queries; session and cabin price checks are done by the intake
+    service against a cached price snapshot.
+    """
+    cruise_session = forms.IntegerField()
+    cruise_session_cabin_price = forms.IntegerField()
+    number_of_passengers = forms.IntegerField(min_value=1)
+    cancellation_policy = forms.ChoiceField(choices=Quote.CancellationPolicy.choices)
+    first_name = forms.CharField(max_length=100)
+    last_name = forms.CharField(max_length=100)
+    email = forms.EmailField()
+    phone = forms.CharField(max_length=20)
@@ -0,0 +1,83 @@
+# quotes/holds.py
+"""
+Time-limited cabin holds for issued quotes.
+
+A hold promises cabins of a session price to a quote without touching
+``available_cabins``; the cabins free to sell are ``available_cabins`` minus
+the active holds (not released, not expired), summed over the partial index
+on active holds. Placing a hold locks only the one cabin price row.
+"""
+from datetime import timedelta
+
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from cruises.models import CruiseSessionCabinPrice
+from .models import CabinHold
+
+CABIN_HOLD_DURATION = timedelta(hours=48)
+
+
+def active_holds(now=None):
+    return CabinHold.objects.filter(released_at__isnull=True, expires_at__gt=now or timezone.now())
+
+
+def held_cabins(now=None):
+    """Expression for the cabins held on the outer CruiseSessionCabinPrice row"""
+    return Coalesce(
+        Subquery(
+            active_holds(now).filter(
+                cabin_price=OuterRef('pk')
+            ).order_by().values('cabin_price').annotate(
+                total=Sum('count')
+            ).values('total')
+        ),
+        0
+    )
+
+
+def with_free_cabins(cabin_prices, now=None):
+    """Annotate ``free_cabins``: available cabins not held by any quote"""
+    return cabin_prices.annotate(free_cabins=F('available_cabins') - held_cabins(now))
+
+
+def hold_cabins(quote, cabin_price_id, count=1, expires_at=None):
+    """
+    Hold ``count`` cabins for a quote; returns the hold, or None if fewer
+    cabins are free. Must run inside a transaction: the cabin price row stays
+    locked until it ends, so concurrent holds on it queue up.
+    """
+    now = timezone.now()
+    try:
+        available = CruiseSessionCabinPrice.objects.select_for_update().filter(
+            pk=cabin_price_id
+        ).values_list('available_cabins', flat=True).get()
+    except CruiseSessionCabinPrice.DoesNotExist:
+        return None
+    held = active_holds(now).filter(cabin_price_id=cabin_price_id).aggregate(total=Sum('count'))['total']
+    if available - (held or 0) < count:
+        return None
+    return CabinHold.objects.create(
+        cabin_price_id=cabin_price_id,
+        quote=quote,
+        count=count,
+        expires_at=expires_at or now + CABIN_HOLD_DURATION
+    )
+
+
+def release_quote_holds(quote_ids, now=None):
+    """Release the holds of the given quotes; returns the number released"""
+    return CabinHold.objects.filter(
+        quote_id__in=quote_ids,
+        released_at__isnull=True
+    ).update(released_at=now or timezone.now())
+
+
+def release_expired_holds(now=None):
+    """Mark expired holds as released so they drop out of the active index"""
+    now = now or timezone.now()
+    return CabinHold.objects.filter(
+        released_at__isnull=True,
+        expires_at__lte=now
+    ).update(released_at=now)
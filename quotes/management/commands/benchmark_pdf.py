@@ -0,0 +1,324 @@
+# quotes/management/commands/benchmark_pdf.py
+import cProfile
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import time as dt_time, timedelta
+from decimal import Decimal
+from functools import wraps
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from cruises.flyer import flowables
+from cruises.flyer.generator import CruiseFlyerGenerator
+from cruises.models import (
+    CabinCategory,
+    Cruise,
+    CruiseCompany,
+    CruiseItinerary,
+    CruiseSession,
+    CruiseSessionCabinPrice,
+    CruiseType,
+    Port,
+    Ship,
+)
+from quotes import utils as quote_utils
+from quotes.models import Quote, QuoteAdditionalService, QuotePassenger
+
+QUOTE_SECTIONS = (
+    'create_header',
+    'create_client_info',
+    'create_journey_details',
+    'create_pricing',
+    'create_cruise_flyer_section',
+    'create_notes',
+    'create_footer',
+    'merge_cruise_flyer',
+)
+FLYER_SECTIONS = (
+    '_register_fonts',
+    '_dates_and_prices_section',
+    '_included_services_section',
+    '_not_included_section',
+    '_cruise_description_section',
+    '_ship_details_section',
+    '_footer_section',
+)
+HEADER_SECTIONS = (
+    '_draw_background',
+    '_draw_logos',
+    '_draw_cruise_info',
+    '_draw_pricing_circle',
+    '_draw_qr_code',
+)
+
+
+class Rollback(Exception):
+    """Raised to discard the synthetic benchmark data"""
+
+
+class SectionTimer:
+    """Temporarily wraps named callables to accumulate their wall-clock time"""
+
+    def __init__(self):
+        self.timings = defaultdict(float)
+
+    @contextmanager
+    def instrument(self, owner, names, label):
+        originals = {name: getattr(owner, name) for name in names}
+        for name, func in originals.items():
+            setattr(owner, name, self._wrap(func, f"{label}.{name}"))
+        try:
+            yield
+        finally:
+            for name, func in originals.items():
+                setattr(owner, name, func)
+
+    def _wrap(self, func, key):
+        @wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.timings[key] += time.perf_counter() - start
+        return timed
+
+
+class SamplingProfiler:
+    """Samples the calling thread's stack and writes folded stacks (flamegraph input)"""
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.stacks = Counter()
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_filename}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Command(BaseCommand):
+    help = 'Benchmark quote and flyer PDF rendering against synthetic data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=10, help='Renders per document type')
+        parser.add_argument('--sessions', type=int, default=12, help='Sessions on the synthetic cruise')
+        parser.add_argument('--categories', type=int, default=8, help='Cabin categories on the synthetic ship')
+        parser.add_argument('--days', type=int, default=10, help='Itinerary days on the synthetic cruise')
+        parser.add_argument(
+            '--only',
+            choices=['quote', 'flyer'],
+            help='Benchmark only one document type',
+        )
+        parser.add_argument(
+            '--profile',
+            choices=['cprofile', 'sample'],
+            help='Profile the slowest run again and dump the result',
+        )
+        parser.add_argument(
+            '--profile-output',
+            default='benchmark_pdf.prof',
+            help='Where to write the profile (pstats file or folded stacks)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def _run(self, options):
+        cruise, quotes = self._create_synthetic_data(options)
+        try:
+            benchmarks = []
+            if options['only'] in (None, 'quote'):
+                benchmarks.append(('quote', quotes, self._render_quote, QUOTE_SECTIONS))
+            if options['only'] in (None, 'flyer'):
+                benchmarks.append(('flyer', [cruise] * options['runs'], self._render_flyer, FLYER_SECTIONS))
+
+            slowest = None
+            for kind, targets, render, sections in benchmarks:
+                runs = [self._measure(kind, render, target) for target in targets]
+                peak = self._peak_memory(render, targets[0])
+                self._report(kind, runs, sections, peak)
+                worst = max(runs, key=lambda run: run['total'])
+                if slowest is None or worst['total'] > slowest[0]['total']:
+                    slowest = (worst, render, targets[runs.index(worst)])
+
+            if options['profile'] and slowest:
+                self._profile(options, *slowest)
+        finally:
+            if cruise.flyer_pdf:
+                cruise.flyer_pdf.delete(save=False)
+
+    def _render_quote(self, quote):
+        return quote_utils.generate_quote_pdf(quote).getvalue()
+
+    def _render_flyer(self, cruise):
+        output = BytesIO()
+        CruiseFlyerGenerator(cruise.id).generate(output)
+        return output.getvalue()
+
+    def _measure(self, kind, render, target):
+        timer = SectionTimer()
+        with timer.instrument(quote_utils, QUOTE_SECTIONS, 'quote'), \
+                timer.instrument(CruiseFlyerGenerator, FLYER_SECTIONS, 'flyer'), \
+                timer.instrument(flowables.HeaderFlowable, HEADER_SECTIONS, 'header'):
+            start = time.perf_counter()
+            pdf = render(target)
+            total = time.perf_counter() - start
+        return {'kind': kind, 'total': total, 'bytes': len(pdf), 'sections': dict(timer.timings)}
+
+    def _peak_memory(self, render, target):
+        tracemalloc.start()
+        try:
+            render(target)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def _report(self, kind, runs, sections, peak):
+        totals = [run['total'] for run in runs]
+        mean_total = sum(totals) / len(totals)
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n{kind} PDF: {len(runs)} run(s)"))
+        self.stdout.write(
+            f"  total   mean {mean_total * 1000:8.1f} ms   min {min(totals) * 1000:8.1f} ms   "
+            f"max {max(totals) * 1000:8.1f} ms"
+        )
+        self.stdout.write(f"  output  {runs[0]['bytes']:,} bytes   peak memory {peak / 1024:,.0f} KiB")
+
+        keys = sorted({key for run in runs for key in run['sections']})
+        accounted = 0
+        for key in keys:
+            values = [run['sections'].get(key, 0) for run in runs]
+            mean = sum(values) / len(values)
+            # Header drawing happens inside the flyer build, not alongside the sections
+            if not key.startswith('header.'):
+                accounted += mean
+            self.stdout.write(
+                f"  {key:<42} mean {mean * 1000:8.2f} ms   max {max(values) * 1000:8.2f} ms   "
+                f"{mean / mean_total * 100:5.1f}%"
+            )
+        layout = mean_total - accounted
+        self.stdout.write(
+            f"  {'layout/build (remainder)':<42} mean {layout * 1000:8.2f} ms   "
+            f"{'':>16}{layout / mean_total * 100:5.1f}%"
+        )
+
+    def _profile(self, options, run, render, target):
+        path = options['profile_output']
+        if options['profile'] == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.runcall(render, target)
+            profiler.dump_stats(path)
+        else:
+            with SamplingProfiler() as profiler:
+                render(target)
+            profiler.dump(path)
+        self.stdout.write(self.style.SUCCESS(
+            f"\nProfiled slowest {run['kind']} run ({run['total'] * 1000:.1f} ms) into {path}"
+        ))
+
+    def _create_synthetic_data(self, options):
+        today = timezone.now().date()
+        company = CruiseCompany.objects.create(name='Benchmark Cruises', description='Synthetic data')
+        ship = Ship.objects.create(
+            name='MS Benchmark', company=company, year_built=2020, passenger_capacity=180,
+            crew_capacity=40, gross_tonnage=2500, length=Decimal('110.00'), speed=Decimal('12.0')
+        )
+        cruise_type = CruiseType.objects.create(
+            name='Benchmark River Cruise', description='Synthetic data', typical_duration=options['days']
+        )
+        ports = [
+            Port.objects.create(name=f'Benchmark Port {i}', country='Benchmark', port_code=f'BM{i}')
+            for i in range(options['days'])
+        ]
+        cruise = Cruise.objects.create(
+            name='Benchmark Cruise', description='Synthetic data. ' * 80,
+            cruise_type=cruise_type, ship=ship
+        )
+        CruiseItinerary.objects.bulk_create(
+            CruiseItinerary(
+                cruise=cruise, day=day + 1, port=ports[day], arrival_time=dt_time(8, 0),
+                departure_time=dt_time(18, 0), description='Sightseeing and excursions. ' * 10
+            )
+            for day in range(options['days'])
+        )
+        categories = CabinCategory.objects.bulk_create(
+            CabinCategory(
+                name=f'Category {i}', ship=ship, description='Synthetic cabin', capacity=3,
+                deck=f'Deck {i % 3}', category_code=f'BM{i}', square_meters=Decimal('16.00')
+            )
+            for i in range(options['categories'])
+        )
+        sessions = CruiseSession.objects.bulk_create(
+            CruiseSession(
+                cruise=cruise, start_date=today + timedelta(weeks=i + 1),
+                end_date=today + timedelta(weeks=i + 1, days=options['days'] - 1),
+                embarkation_port=ports[0], disembarkation_port=ports[-1],
+                capacity=180, status='booking'
+            )
+            for i in range(options['sessions'])
+        )
+        CruiseSessionCabinPrice.objects.bulk_create(
+            CruiseSessionCabinPrice(
+                cruise_session=session, cabin_category=category,
+                price=Decimal('999.00') + i * 100, regular_price=Decimal('1099.00') + i * 100,
+                available_cabins=10
+            )
+            for session in sessions
+            for i, category in enumerate(categories)
+        )
+
+        flyer = BytesIO()
+        CruiseFlyerGenerator(cruise.id).generate(flyer)
+        cruise.flyer_pdf.save('benchmark_flyer.pdf', ContentFile(flyer.getvalue()))
+
+        quotes = []
+        for i in range(options['runs']):
+            quote = Quote.objects.create(
+                cruise_session=sessions[i % len(sessions)], cabin_category=categories[i % len(categories)],
+                base_price=Decimal('999.00'), number_of_passengers=2, total_price=Decimal('1998.00'),
+                status=Quote.Status.PENDING
+            )
+            QuotePassenger.objects.create(
+                quote=quote, first_name='Bench', last_name=f'Mark {i}',
+                email='bench@example.com', phone='+352 000000'
+            )
+            QuoteAdditionalService.objects.create(
+                quote=quote, service_name='Transfer', description='Bus transfer', price=Decimal('49.00')
+            )
+            quotes.append(quote)
+        return cruise, quotes
@@ -0,0 +1,92 @@
+# quotes/management/commands/benchmark_startup.py
+import json
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Modules that only PDF rendering needs; they must not load during worker startup
+LAZY_MODULES = ('reportlab', 'PyPDF2', 'quotes.utils', 'cruises.flyer.generator')
+
+# Runs in a fresh interpreter: django.setup() plus the URLconf the first request loads
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter() - start
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps({
+    'setup': setup,
+    'total': time.perf_counter() - start,
+    'modules': sorted(sys.modules),
+}))
+"""
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+class Command(BaseCommand):
+    help = 'Measure cold-start import time of django.setup() and enforce a budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Cold starts to measure (best run is reported)')
+        parser.add_argument(
+            '--budget-ms',
+            type=float,
+            default=600,
+            help='Fail if the best cold start (setup + URLconf) exceeds this many milliseconds',
+        )
+        parser.add_argument('--top', type=int, default=15, help='Number of slowest imports to list')
+
+    def handle(self, *args, **options):
+        runs = [self._cold_start() for _ in range(options['runs'])]
+        best = min(runs, key=lambda run: run['total'])
+
+        self.stdout.write(
+            f"django.setup(): {best['setup'] * 1000:.1f} ms, with URLconf: {best['total'] * 1000:.1f} ms "
+            f"(best of {len(runs)}), {len(best['modules'])} modules loaded"
+        )
+        self.stdout.write("Slowest imports (cumulative, -X importtime):")
+        for module, cumulative in best['imports'][:options['top']]:
+            self.stdout.write(f"  {cumulative / 1000:8.1f} ms  {module}")
+
+        eager = [
+            module for module in best['modules']
+            if any(module == lazy or module.startswith(f"{lazy}.") for lazy in LAZY_MODULES)
+        ]
+        if eager:
+            raise CommandError(
+                f"PDF tooling imported during startup: {', '.join(sorted(eager)[:10])}"
+            )
+        if best['total'] * 1000 > options['budget_ms']:
+            raise CommandError(
+                f"Cold start took {best['total'] * 1000:.1f} ms, over the "
+                f"{options['budget_ms']:.0f} ms budget"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Within the {options['budget_ms']:.0f} ms budget"))
+
+    def _cold_start(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+            'DJANGO_SETTINGS_MODULE', 'azureproject.settings'
+        ))
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+            capture_output=True, text=True, cwd=settings.BASE_DIR, env=env
+        )
+        if result.returncode:
+            raise CommandError(f"Startup failed:\n{result.stderr[-2000:]}")
+
+        run = json.loads(result.stdout.strip().splitlines()[-1])
+        imports = []
+        for line in result.stderr.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            # Only top-level imports, so nested modules are not counted twice
+            if match and len(match.group(3)) == 1:
+                imports.append((match.group(4), int(match.group(2))))
+        run['imports'] = sorted(imports, key=lambda item: item[1], reverse=True)
+        return run
@@ -0,0 +1,34 @@
+# quotes/management/commands/expire_quotes.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from quotes.holds import release_expired_holds
+from quotes.services import expire_pending_quotes, purge_expired_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = 'Expire pending quotes and cabin holds past their expiry (safe to run every few minutes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Quotes updated per UPDATE statement',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        now = timezone.now()
+        expired = expire_pending_quotes(now=now, batch_size=options['batch_size'])
+        released = release_expired_holds(now=now)
+        purged = purge_expired_idempotency_keys(now=now)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Quotes expired: {expired}, cabin holds released: {released}, "
+                f"idempotency keys purged: {purged} in {elapsed:.2f}s"
+            )
+        )
@@ -0,0 +1,57 @@
+# quotes/management/commands/export_quote_pdfs.py
+from django.core.management.base import BaseCommand, CommandError
+
+from quotes.models import Quote
+from quotes.utils import export_quote_pdfs
+
+
+class Command(BaseCommand):
+    help = 'Render quote PDFs in parallel and write them into a ZIP archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'quote_ids',
+            nargs='*',
+            type=int,
+            help='Quotes to export (defaults to all quotes matching --status)',
+        )
+        parser.add_argument(
+            '--status',
+            choices=Quote.Status.values,
+            help='Only export quotes with this status',
+        )
+        parser.add_argument(
+            '--output',
+            default='quotes.zip',
+            help='Path of the ZIP archive to write',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Number of worker processes (defaults to the CPU count)',
+        )
+
+    def handle(self, *args, **options):
+        quotes = Quote.objects.all()
+        if options['quote_ids']:
+            quotes = quotes.filter(pk__in=options['quote_ids'])
+        if options['status']:
+            quotes = quotes.filter(status=options['status'])
+
+        quote_ids = list(quotes.values_list('pk', flat=True))
+        if not quote_ids:
+            raise CommandError('No quotes matched the given filters.')
+
+        self.stdout.write(f"Rendering {len(quote_ids)} quote PDF(s) into {options['output']}")
+        with open(options['output'], 'wb') as archive:
+            failures = export_quote_pdfs(quote_ids, archive, max_workers=options['workers'])
+
+        for quote_id, error in failures:
+            self.stdout.write(self.style.ERROR(f"Quote {quote_id}: {error}"))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Exported {len(quote_ids) - len(failures)} PDF(s) with {len(failures)} error(s)"
+            )
+        )
@@ -0,0 +1,122 @@
+# quotes/management/commands/loadtest_quote_intake.py
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from cruises.models import (
+    CabinCategory,
+    Cruise,
+    CruiseCompany,
+    CruiseSession,
+    CruiseSessionCabinPrice,
+    CruiseType,
+    Port,
+    Ship,
+)
+from quotes.models import Quote
+
+
+class Rollback(Exception):
+    """Raised to discard the synthetic load-test data"""
+
+
+class Command(BaseCommand):
+    help = 'Measure quote intake throughput by posting quote requests through the view'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quotes', type=int, default=1000, help='Number of quote requests to post')
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Commit the synthetic data and quotes instead of rolling them back',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options)
+                if not options['keep']:
+                    raise Rollback()
+        except Rollback:
+            pass
+
+    def _run(self, options):
+        cruise, session, price = self._create_synthetic_data(options['quotes'])
+        client = Client()
+        url = reverse('quotes:create_quote', args=[cruise.id])
+
+        def post(i):
+            payload = {
+                'session_id': session.id,
+                'cabin_price_id': price.id,
+                'number_of_passengers': 1 + i % 3,
+                'cancellation_policy': Quote.CancellationPolicy.MODERATE,
+                'passenger': {
+                    'first_name': 'Load',
+                    'last_name': f'Test {i}',
+                    'email': f'load{i}@example.com',
+                    'phone': '+352 000000',
+                },
+            }
+            response = client.post(url, json.dumps(payload), content_type='application/json')
+            if response.status_code != 200:
+                raise CommandError(f"Request {i} failed: {response.status_code} {response.content[:500]}")
+
+        # Warm up: loads the price snapshot into the cache
+        post(0)
+
+        start = time.perf_counter()
+        for i in range(1, options['quotes'] + 1):
+            post(i)
+        elapsed = time.perf_counter() - start
+
+        # Counted on a separate sample: capturing queries slows every request down
+        sample = min(options['quotes'], 100)
+        with CaptureQueriesContext(connection) as queries:
+            for i in range(sample):
+                post(options['quotes'] + 1 + i)
+        statements = [
+            q for q in queries.captured_queries
+            if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))
+        ]
+
+        self.stdout.write(
+            f"{options['quotes']} quotes in {elapsed:.2f}s: "
+            f"{options['quotes'] / elapsed:,.0f} quotes/s, "
+            f"{elapsed / options['quotes'] * 1000:.2f} ms/quote, "
+            f"{len(statements) / sample:.1f} queries/quote"
+        )
+
+    def _create_synthetic_data(self, cabins):
+        today = timezone.now().date()
+        company = CruiseCompany.objects.create(name='Load Test Cruises', description='Synthetic data')
+        ship = Ship.objects.create(
+            name='MS Load Test', company=company, year_built=2020, passenger_capacity=180,
+            crew_capacity=40, gross_tonnage=2500, length=Decimal('110.00'), speed=Decimal('12.0')
+        )
+        cruise_type = CruiseType.objects.create(name='Load Test Cruise', description='Synthetic data', typical_duration=7)
+        port = Port.objects.create(name='Load Test Port', country='Load Test', port_code='LT1')
+        cruise = Cruise.objects.create(
+            name='Load Test Cruise', description='Synthetic data', cruise_type=cruise_type, ship=ship
+        )
+        session = CruiseSession.objects.create(
+            cruise=cruise, start_date=today + timedelta(days=30), end_date=today + timedelta(days=36),
+            embarkation_port=port, disembarkation_port=port, capacity=180, status='booking'
+        )
+        category = CabinCategory.objects.create(
+            name='Load Test Cabin', ship=ship, description='Synthetic cabin', capacity=3,
+            deck='Main', category_code='LT', square_meters=Decimal('16.00')
+        )
+        price = CruiseSessionCabinPrice.objects.create(
+            cruise_session=session, cabin_category=category, price=Decimal('999.00'),
+            regular_price=Decimal('1099.00'), available_cabins=cabins + 101
+        )
+        return cruise, session, price
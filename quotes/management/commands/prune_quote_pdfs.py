@@ -0,0 +1,34 @@
+# quotes/management/commands/prune_quote_pdfs.py
+import posixpath
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from quotes.models import Quote
+from quotes.utils import QUOTE_PDF_DIR, remove_outdated_quote_pdfs
+
+
+class Command(BaseCommand):
+    help = 'Remove stored quote PDFs that are no longer current, and those of deleted quotes'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            directories, _files = default_storage.listdir(QUOTE_PDF_DIR)
+        except (FileNotFoundError, NotImplementedError):
+            directories = []
+        quotes = Quote.objects.in_bulk([int(name) for name in directories if name.isdigit()])
+
+        removed = 0
+        for name in directories:
+            quote = quotes.get(int(name)) if name.isdigit() else None
+            if quote is not None:
+                removed += remove_outdated_quote_pdfs(quote)
+                continue
+            directory = posixpath.join(QUOTE_PDF_DIR, name)
+            for filename in default_storage.listdir(directory)[1]:
+                default_storage.delete(posixpath.join(directory, filename))
+                removed += 1
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Quote PDFs removed: {removed} in {elapsed:.2f}s"))
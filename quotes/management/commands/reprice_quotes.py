@@ -0,0 +1,36 @@
+# quotes/management/commands/reprice_quotes.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from quotes.models import Quote
+from quotes.services import reprice_quotes
+
+
+class Command(BaseCommand):
+    help = 'Re-price open quotes against the current cabin prices of their sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--status',
+            nargs='+',
+            default=[Quote.Status.DRAFT, Quote.Status.PENDING],
+            choices=Quote.Status.values,
+            help='Quote statuses to re-price (default: draft and pending)',
+        )
+        parser.add_argument('--session', type=int, action='append', help='Only quotes of this cruise session')
+        parser.add_argument('--batch-size', type=int, default=500, help='Quotes priced per batch')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        quotes = Quote.objects.filter(status__in=options['status'])
+        if options['session']:
+            quotes = quotes.filter(cruise_session_id__in=options['session'])
+
+        updated, without_price = reprice_quotes(quotes, batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Quotes re-priced: {updated}, without a cabin price: {without_price} in {elapsed:.2f}s"
+            )
+        )
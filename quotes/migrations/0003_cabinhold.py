@@ -0,0 +1,33 @@
+# Generated by Django 5.0.6 on 2026-10-19 17:56
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cruises', '0001_initial'),
+        ('quotes', '0002_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CabinHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)])),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+                ('released_at', models.DateTimeField(blank=True, null=True)),
+                ('cabin_price', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='cruises.cruisesessioncabinprice')),
+                ('quote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cabin_holds', to='quotes.quote')),
+            ],
+            options={
+                'verbose_name': 'Cabin Hold',
+                'verbose_name_plural': 'Cabin Holds',
+                'indexes': [models.Index(condition=models.Q(('released_at__isnull', True)), fields=['cabin_price', 'expires_at'], name='quotes_cabinhold_active_idx'), models.Index(fields=['quote', 'released_at'], name='quotes_cabi_quote_i_4727b3_idx')],
+            },
+        ),
+    ]
@@ -6,10 +6,13 @@ from django.utils import timezone
 from django.db import transaction
 from django.utils.translation import gettext_lazy as _
 
+from cruises import pricing
 from cruises.models import (
     BaseModel,
+    PassengerSummaryModel,
     CruiseSession,
     CabinCategory,
+    CruiseSessionCabinPrice,
     Ship,
     Promotion
 )
@@ -41,7 +44,7 @@ class QuoteManager(models.Manager):
             cruise_session__cruise__ship_id=ship_id
         )
 
-class Quote(BaseModel):
+class Quote(PassengerSummaryModel, BaseModel):
     class Status(models.TextChoices):
         DRAFT = 'draft', _('Draft')
         PENDING = 'pending', _('Pending')
@@ -140,15 +143,13 @@ class Quote(BaseModel):
 
     def calculate_total_price(self):
         """Calculate total price including base price, passengers, and discounts"""
-        self.total_price = self.base_price * self.number_of_passengers
-        
-        if self.applied_promotion and self.applied_promotion.is_active():
-            if self.applied_promotion.discount_type == 'percentage':
-                discount = (self.total_price * self.applied_promotion.discount_value) / 100
-            else:  # fixed amount
-                discount = self.applied_promotion.discount_value
-            self.discount_amount = discount
-            self.total_price -= discount
+        breakdown = pricing.calculate_total(
+            self.base_price,
+            self.number_of_passengers,
+            promotion=self.applied_promotion
+        )
+        self.discount_amount = breakdown.discount_amount
+        self.total_price = breakdown.total_price
 
     def can_convert_to_booking(self):
         return (
@@ -159,47 +160,15 @@ class Quote(BaseModel):
             self.cabin_category.ship == self.cruise_session.cruise.ship  # Valid cabin category
         )
 
-    @transaction.atomic
     def convert_to_booking(self):
-        if not self.can_convert_to_booking():
-            raise ValueError(f"Quote {self.id} cannot be converted to a booking")
-
         # Import here to avoid circular import
-        from bookings.models import Booking, Passenger as BookingPassenger
-
-        # Create booking
-        booking = Booking.objects.create(
-            user=self.user,
-            quote=self,
-            cruise_session=self.cruise_session,
-            cabin_category=self.cabin_category,
-            number_of_passengers=self.number_of_passengers,
-            total_price=self.total_price,
-            applied_promotion=self.applied_promotion,
-            discount_amount=self.discount_amount,
-            status=Booking.Status.PENDING
-        )
+        from .services import convert_quotes_to_bookings
 
-        # Copy passengers
-        for quote_passenger in self.passengers.select_related():
-            BookingPassenger.objects.create(
-                booking=booking,
-                **quote_passenger.get_passenger_data()
-            )
-
-        # Copy additional services
-        for service in self.additional_services.all():
-            booking.add_service(
-                service_name=service.service_name,
-                description=service.description,
-                price=service.price
-            )
-
-        # Update quote status
+        bookings, errors = convert_quotes_to_bookings([self.pk])
+        if errors:
+            raise ValueError(errors[self.pk])
         self.status = self.Status.CONVERTED
-        self.save()
-
-        return booking
+        return bookings[0]
 
     def is_expired(self):
         return self.expiration_date <= timezone.now()
@@ -210,8 +179,7 @@ class Quote(BaseModel):
             self.save()
 
     def __str__(self):
-        passenger = self.passengers.first()
-        passenger_name = f"{passenger.first_name} {passenger.last_name}" if passenger else "No passenger"
+        passenger_name = self.lead_passenger_name or "No passenger"
         return f"Quote {self.id} - {passenger_name} - {self.cruise_session.cruise.name}"
 
 
@@ -325,4 +293,64 @@ class QuoteAdditionalService(BaseModel):
         return self.price * self.quantity
 
     def __str__(self):
-        return f"{self.get_service_type_display()}: {self.service_name} for Quote {self.quote.id}"
\ No newline at end of file
+        return f"{self.get_service_type_display()}: {self.service_name} for Quote {self.quote.id}"
+
+class IdempotencyKey(models.Model):
+    """Response of a quote request, replayed when a client retries with the same Idempotency-Key"""
+    key = models.CharField(max_length=255, unique=True)
+    request_fingerprint = models.CharField(
+        max_length=64,
+        help_text=_("SHA-256 of the request body the key was first used with")
+    )
+    response_status = models.PositiveSmallIntegerField()
+    response_body = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = _("Idempotency Key")
+        verbose_name_plural = _("Idempotency Keys")
+
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
+
+    def __str__(self):
+        return self.key
+
+
+class CabinHold(models.Model):
+    """Cabins promised to a quote until it is converted, or the hold expires or is released"""
+    cabin_price = models.ForeignKey(
+        CruiseSessionCabinPrice,
+        on_delete=models.CASCADE,
+        related_name='holds'
+    )
+    quote = models.ForeignKey(
+        Quote,
+        on_delete=models.CASCADE,
+        related_name='cabin_holds'
+    )
+    count = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)])
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    released_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Cabin Hold")
+        verbose_name_plural = _("Cabin Holds")
+        indexes = [
+            # Active holds only: keeps the availability aggregate small
+            models.Index(
+                fields=['cabin_price', 'expires_at'],
+                condition=models.Q(released_at__isnull=True),
+                name='quotes_cabinhold_active_idx'
+            ),
+            models.Index(fields=['quote', 'released_at']),
+        ]
+
+    @property
+    def is_active(self):
+        return self.released_at is None and self.expires_at > timezone.now()
+
+    def __str__(self):
+        return f"{self.count} x {self.cabin_price} for Quote {self.quote_id}"
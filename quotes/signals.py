@@ -0,0 +1,45 @@
+# quotes/signals.py
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from bookings.models import SearchDocument
+from bookings.search import schedule_index
+from bookings.signals import deleted_with_parent, sync_passenger_summary
+from cruises.models import CruiseSession, CruiseSessionCabinPrice
+from .models import Quote, QuotePassenger
+from .services import invalidate_price_snapshot
+
+
+# Snapshots are dropped once the write is committed: dropped any earlier, a
+# concurrent request could cache the old prices again before the commit.
+@receiver([post_save, post_delete], sender=CruiseSessionCabinPrice)
+def cabin_price_changed(sender, instance, **kwargs):
+    transaction.on_commit(partial(invalidate_price_snapshot, instance.cruise_session_id))
+
+
+@receiver([post_save, post_delete], sender=CruiseSession)
+def cruise_session_changed(sender, instance, **kwargs):
+    transaction.on_commit(partial(invalidate_price_snapshot, instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Quote)
+def quote_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_index(SearchDocument.Kind.QUOTE, instance.pk)
+
+
+@receiver(post_save, sender=QuotePassenger)
+def quote_passenger_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        sync_passenger_summary(instance, 'quote')
+        schedule_index(SearchDocument.Kind.QUOTE, instance.quote_id)
+
+
+@receiver(post_delete, sender=QuotePassenger)
+def quote_passenger_deleted(sender, instance, origin=None, **kwargs):
+    if not deleted_with_parent(origin, Quote):
+        sync_passenger_summary(instance, 'quote')
+        schedule_index(SearchDocument.Kind.QUOTE, instance.quote_id)
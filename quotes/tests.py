@@ -1,3 +1,453 @@
-from django.test import TestCase
+import json
+import tempfile
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.core.files.storage import default_storage
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from bookings.models import Booking
+from cruises.tests import create_cabin_price, thread_pool
+from .holds import hold_cabins, release_expired_holds
+from .models import CabinHold, IdempotencyKey, Quote, QuoteAdditionalService, QuotePassenger
+from .services import (
+    QuoteIntakeError,
+    convert_quotes_to_bookings,
+    create_quote_from_request,
+    expire_pending_quotes,
+    get_price_snapshot,
+    get_stored_response,
+    price_snapshot_key,
+    request_fingerprint,
+    store_response,
+    with_conversion_flags,
+)
+from .utils import export_quote_pdfs, get_quote_pdf
+
+
+def create_quote(cabin_price, **fields):
+    return Quote.objects.create(**{
+        'cruise_session_id': cabin_price.cruise_session_id,
+        'cabin_category_id': cabin_price.cabin_category_id,
+        'base_price': Decimal('999.00'),
+        'number_of_passengers': 2,
+        'status': Quote.Status.PENDING,
+        'expiration_date': timezone.now() + timedelta(days=7),
+        **fields
+    })
+
+
+class QuoteAdminChangelistTest(TestCase):
+    def setUp(self):
+        self.cabin_price = create_cabin_price(available_cabins=10)
+        self.client.force_login(
+            User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        )
+
+    def create_quotes(self, count):
+        quotes = Quote.objects.bulk_create([
+            Quote(
+                cruise_session_id=self.cabin_price.cruise_session_id,
+                cabin_category_id=self.cabin_price.cabin_category_id,
+                base_price=Decimal('999.00'),
+                total_price=Decimal('1998.00'),
+                status=Quote.Status.PENDING,
+                expiration_date=timezone.now() + timedelta(days=7),
+                lead_passenger_name=f'Guest {i}',
+                passenger_count=1
+            )
+            for i in range(count)
+        ])
+        # Every other quote already has a booking
+        Booking.objects.bulk_create([
+            Booking(
+                quote=quote,
+                cruise_session_id=quote.cruise_session_id,
+                cabin_category_id=quote.cabin_category_id,
+                base_price=quote.total_price,
+                total_price=quote.total_price
+            )
+            for quote in quotes[::2]
+        ])
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:quotes_quote_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Convert to Booking')
+        return len(queries.captured_queries)
+
+    def test_query_count_does_not_grow_with_quotes(self):
+        self.create_quotes(10)
+        queries_for_ten = self.changelist_queries()
+        self.create_quotes(90)
+        self.assertEqual(self.changelist_queries(), queries_for_ten)
+
+    def test_convertible_matches_can_convert_to_booking(self):
+        self.create_quotes(4)
+        Quote.objects.filter(pk=Quote.objects.order_by('pk')[1:2].values('pk')).update(
+            expiration_date=timezone.now() - timedelta(days=1)
+        )
+        for quote in with_conversion_flags(Quote.objects.all()):
+            self.assertEqual(quote.convertible, quote.can_convert_to_booking())
+
+
+@mock.patch('quotes.utils.render_pool', thread_pool)
+class QuotePdfExportTest(TransactionTestCase):
+    def setUp(self):
+        self.quote = create_quote(create_cabin_price(available_cabins=10))
+        QuotePassenger.objects.create(
+            quote=self.quote, first_name='Anna', last_name='Schmitt', email='anna@example.com', phone='123'
+        )
+
+    def test_export_writes_pdfs_and_errors(self):
+        archive = BytesIO()
+        failures = export_quote_pdfs([self.quote.pk, 0], archive, max_workers=2)
+        self.assertEqual([quote_id for quote_id, _error in failures], [0])
+        with zipfile.ZipFile(archive) as exported:
+            self.assertEqual(sorted(exported.namelist()), ['errors.txt', f'quote_{self.quote.pk}.pdf'])
+            self.assertTrue(exported.read(f'quote_{self.quote.pk}.pdf').startswith(b'%PDF'))
+
+    def test_admin_action_returns_zip(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.post(reverse('admin:quotes_quote_changelist'), {
+            'action': 'export_pdfs',
+            '_selected_action': [self.quote.pk],
+        })
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as exported:
+            self.assertEqual(exported.namelist(), [f'quote_{self.quote.pk}.pdf'])
+
+
+class QuotePdfStorageTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.quote = create_quote(create_cabin_price(available_cabins=10))
+        QuotePassenger.objects.create(
+            quote=self.quote, first_name='Anna', last_name='Schmitt', email='anna@example.com', phone='123'
+        )
+        # The passenger signal updated the quote's passenger summary
+        self.quote.refresh_from_db()
+        self.quote_id = self.quote.pk
+
+    def stored_pdfs(self):
+        return default_storage.listdir(f'quote_pdfs/{self.quote_id}')[1]
+
+    def test_pdf_is_stored_once_and_rendered_again_after_a_change(self):
+        get_quote_pdf(self.quote).close()
+        first, = self.stored_pdfs()
+        with get_quote_pdf(self.quote) as pdf:
+            self.assertTrue(pdf.read().startswith(b'%PDF'))
+        self.assertEqual(self.stored_pdfs(), [first])
+
+        # The cabin category name is printed in the PDF
+        cabin_category = self.quote.cabin_category
+        cabin_category.name = 'Renamed Cabin'
+        cabin_category.save()
+        with get_quote_pdf(self.quote) as pdf:
+            self.assertTrue(pdf.read().startswith(b'%PDF'))
+        # Outdated versions are only removed by prune_quote_pdfs, never while serving
+        self.assertEqual(len(self.stored_pdfs()), 2)
+        output = StringIO()
+        call_command('prune_quote_pdfs', stdout=output)
+        second, = self.stored_pdfs()
+        self.assertNotEqual(second, first)
+        self.assertIn('Quote PDFs removed: 1', output.getvalue())
+
+    def test_prune_removes_the_pdfs_of_deleted_quotes(self):
+        get_quote_pdf(self.quote).close()
+        self.quote.delete()
+        call_command('prune_quote_pdfs', stdout=StringIO())
+        self.assertEqual(self.stored_pdfs(), [])
+
+
+class QuoteIntakeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cabin_price = create_cabin_price(available_cabins=1)
+        self.cruise_id = self.cabin_price.cruise_session.cruise_id
+
+    def request_data(self, **changes):
+        return {
+            'session_id': self.cabin_price.cruise_session_id,
+            'cabin_price_id': self.cabin_price.pk,
+            'number_of_passengers': 2,
+            'cancellation_policy': 'flexible',
+            'passenger': {
+                'first_name': 'Anna', 'last_name': 'Schmitt', 'email': 'anna@example.com', 'phone': '123'
+            },
+            **changes
+        }
+
+    def test_creates_quote_passenger_and_hold(self):
+        quote = create_quote_from_request(self.cruise_id, self.request_data())
+        self.assertEqual(quote.total_price, Decimal('1998.00'))
+        self.assertEqual(quote.lead_passenger_name, 'Anna Schmitt')
+        self.assertEqual(quote.passengers.get().email, 'anna@example.com')
+        self.assertEqual(CabinHold.objects.get().quote, quote)
+
+        # The only cabin is held now
+        with self.assertRaises(QuoteIntakeError) as raised:
+            create_quote_from_request(self.cruise_id, self.request_data())
+        self.assertIn('cruise_session_cabin_price', raised.exception.errors)
+
+    def test_rejects_invalid_requests(self):
+        with self.assertRaises(QuoteIntakeError) as raised:
+            create_quote_from_request(self.cruise_id, self.request_data(number_of_passengers=3))
+        self.assertIn('number_of_passengers', raised.exception.errors)
+        with self.assertRaises(QuoteIntakeError) as raised:
+            create_quote_from_request(self.cruise_id + 1, self.request_data())
+        self.assertIn('cruise_session', raised.exception.errors)
+
+    def test_price_snapshot_is_dropped_on_commit(self):
+        key = price_snapshot_key(self.cabin_price.cruise_session_id)
+        get_price_snapshot(self.cabin_price.cruise_session_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cabin_price.regular_price = Decimal('899.00')
+            self.cabin_price.save()
+            self.assertIsNotNone(cache.get(key))
+        self.assertIsNone(cache.get(key))
+
+
+class IdempotentQuoteCreationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cabin_price = create_cabin_price(available_cabins=5)
+        self.url = reverse('quotes:create_quote', args=[self.cabin_price.cruise_session.cruise_id])
+
+    def body(self, number_of_passengers=2):
+        return json.dumps({
+            'session_id': self.cabin_price.cruise_session_id,
+            'cabin_price_id': self.cabin_price.pk,
+            'number_of_passengers': number_of_passengers,
+            'cancellation_policy': 'flexible',
+            'passenger': {
+                'first_name': 'Anna', 'last_name': 'Schmitt', 'email': 'anna@example.com', 'phone': '123'
+            },
+        })
+
+    def post(self, body, key='retry-1'):
+        return self.client.post(self.url, body, content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.post(self.body())
+        self.assertEqual(first.status_code, 200)
+        second = self.post(self.body())
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(Quote.objects.count(), 1)
+
+    def test_key_reused_with_another_body_is_rejected(self):
+        self.post(self.body())
+        response = self.post(self.body(number_of_passengers=1))
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Quote.objects.count(), 1)
+
+    def concurrent_request_stores_first(self, body, response_body):
+        # The key is stored by another request after this one looked it up
+        store_response('retry-1', request_fingerprint(body.encode()), 200, response_body)
+        lookups = iter([None])
+        return mock.patch(
+            'quotes.views.get_stored_response',
+            lambda key, fingerprint: next(lookups, None) or get_stored_response(key, fingerprint)
+        )
+
+    def test_race_replays_the_stored_response(self):
+        body = self.body()
+        with self.concurrent_request_stores_first(body, {'success': True, 'quote_id': 42}):
+            response = self.post(body)
+        self.assertEqual(response.json(), {'success': True, 'quote_id': 42})
+        self.assertEqual(Quote.objects.count(), 0)
+
+    def test_race_with_another_body_is_rejected(self):
+        with self.concurrent_request_stores_first(self.body(1), {'success': True, 'quote_id': 42}):
+            response = self.post(self.body())
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Quote.objects.count(), 0)
+
+    def test_other_integrity_errors_are_not_taken_for_a_replay(self):
+        with mock.patch('quotes.views.create_quote_from_request', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self.post(self.body())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class QuoteConversionTest(TestCase):
+    def setUp(self):
+        self.cabin_price = create_cabin_price(available_cabins=5)
+
+    def create_convertible_quote(self, last_name='Schmitt', passport_expiry_date=date(2035, 1, 1)):
+        quote = create_quote(self.cabin_price, number_of_passengers=1)
+        QuotePassenger.objects.create(
+            quote=quote, first_name='Anna', last_name=last_name, email='anna@example.com',
+            phone='123', date_of_birth=date(1980, 1, 1), nationality='LU', passport_number='P1',
+            passport_expiry_date=passport_expiry_date, is_lead_passenger=True
+        )
+        QuoteAdditionalService.objects.create(
+            quote=quote, service_type=QuoteAdditionalService.ServiceType.TRANSFER,
+            service_name='Airport transfer', description='Both ways', price=Decimal('40.00'), quantity=2
+        )
+        QuoteAdditionalService.objects.create(
+            quote=quote, service_type=QuoteAdditionalService.ServiceType.EXCURSION,
+            service_name='City tour', description='Half day', price=Decimal('25.00')
+        )
+        hold_cabins(quote, self.cabin_price.pk)
+        return quote
+
+    def available_cabins(self):
+        self.cabin_price.refresh_from_db()
+        return self.cabin_price.available_cabins
+
+    def test_converts_quotes_with_passengers_and_services(self):
+        quotes = [self.create_convertible_quote('Schmitt'), self.create_convertible_quote('Weber')]
+        bookings, errors = convert_quotes_to_bookings([quote.pk for quote in quotes], Booking.Status.CONFIRMED)
+
+        self.assertEqual(errors, {})
+        self.assertEqual([booking.quote_id for booking in bookings], [quote.pk for quote in quotes])
+        booking = Booking.objects.get(quote=quotes[0])
+        self.assertTrue(booking.cabin_reserved)
+        self.assertEqual(booking.total_price, Decimal('1104.00'))
+        self.assertEqual((booking.lead_passenger_name, booking.passenger_count), ('Anna Schmitt', 1))
+        passenger = booking.passengers.get()
+        self.assertEqual((passenger.passport_number, passenger.date_of_birth), ('P1', date(1980, 1, 1)))
+        self.assertEqual(
+            sorted(booking.additional_services.values_list('service_type', 'service_name', 'quantity')),
+            [('other', 'City tour', 1), ('transfer', 'Airport transfer', 2)]
+        )
+
+        # Confirmed bookings are numbered although bulk_create skips save()
+        numbers = set(Booking.objects.values_list('confirmation_number', flat=True))
+        self.assertEqual(len(numbers), 2)
+        self.assertTrue(all(number and number.startswith('BK') for number in numbers))
+
+        self.assertEqual(
+            set(Quote.objects.values_list('status', flat=True)), {Quote.Status.CONVERTED}
+        )
+        self.assertEqual(self.available_cabins(), 3)
+        self.assertFalse(CabinHold.objects.filter(released_at__isnull=True).exists())
+
+    def test_pending_bookings_are_not_numbered(self):
+        bookings, errors = convert_quotes_to_bookings([self.create_convertible_quote().pk])
+        self.assertEqual(errors, {})
+        self.assertEqual(bookings[0].status, Booking.Status.PENDING)
+        self.assertIsNone(Booking.objects.get().confirmation_number)
+
+    def test_skips_quotes_that_cannot_be_converted(self):
+        convertible = self.create_convertible_quote()
+        expired = self.create_convertible_quote()
+        Quote.objects.filter(pk=expired.pk).update(expiration_date=timezone.now() - timedelta(days=1))
+        booked = self.create_convertible_quote()
+        Booking.objects.create(
+            quote=booked,
+            cruise_session_id=self.cabin_price.cruise_session_id,
+            cabin_category_id=self.cabin_price.cabin_category_id,
+            base_price=Decimal('999.00'),
+            total_price=Decimal('999.00')
+        )
+        incomplete = self.create_convertible_quote(passport_expiry_date=None)
+        missing = incomplete.pk + 1000
+
+        bookings, errors = convert_quotes_to_bookings(
+            [convertible.pk, expired.pk, booked.pk, incomplete.pk, missing]
+        )
+
+        self.assertEqual([booking.quote_id for booking in bookings], [convertible.pk])
+        self.assertEqual(set(errors), {expired.pk, booked.pk, incomplete.pk, missing})
+        self.assertIn('expired', str(errors[expired.pk]))
+        self.assertIn('already has a booking', str(errors[booked.pk]))
+        self.assertIn('Anna Schmitt', str(errors[incomplete.pk]))
+        self.assertIn('does not exist', str(errors[missing]))
+        # Only the converted quote took a cabin; the others keep their holds
+        self.assertEqual(self.available_cabins(), 4)
+        self.assertEqual(CabinHold.objects.filter(released_at__isnull=True).count(), 3)
+        self.assertEqual(Quote.objects.get(pk=incomplete.pk).status, Quote.Status.PENDING)
+
+
+class QuoteExpiryTest(TestCase):
+    def setUp(self):
+        self.cabin_price = create_cabin_price(available_cabins=20)
+        self.now = timezone.now()
+
+    def create_held_quote(self, expires_in, status=Quote.Status.PENDING, hold_expires_in=timedelta(hours=48)):
+        quote = create_quote(self.cabin_price, status=status, expiration_date=self.now + expires_in)
+        CabinHold.objects.create(cabin_price=self.cabin_price, quote=quote, expires_at=self.now + hold_expires_in)
+        return quote
+
+    def active_hold_quote_ids(self):
+        return set(CabinHold.objects.filter(released_at__isnull=True).values_list('quote_id', flat=True))
+
+    def statuses(self, quotes):
+        return [Quote.objects.get(pk=quote.pk).status for quote in quotes]
+
+    def test_expires_pending_quotes_across_chunks(self):
+        past_due = [self.create_held_quote(-timedelta(hours=1)) for i in range(5)]
+        current = self.create_held_quote(timedelta(days=1))
+        approved = self.create_held_quote(-timedelta(hours=1), status=Quote.Status.APPROVED)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(expire_pending_quotes(now=self.now, batch_size=2), 5)
+
+        self.assertEqual(self.statuses(past_due), [Quote.Status.EXPIRED] * 5)
+        self.assertEqual(self.statuses([current, approved]), [Quote.Status.PENDING, Quote.Status.APPROVED])
+        self.assertEqual(self.active_hold_quote_ids(), {current.pk, approved.pk})
+        # Three chunks and the empty SELECT that ends the sweep
+        selects = [q for q in queries.captured_queries if q['sql'].startswith('SELECT "quotes_quote"."id"')]
+        self.assertEqual(len(selects), 4)
+
+    def test_quote_approved_during_the_sweep_is_left_alone(self):
+        approved, expired = [self.create_held_quote(-timedelta(hours=1)) for i in range(2)]
+        approvals = []
+
+        def approve_before_update(execute, sql, params, many, context):
+            if sql.startswith('UPDATE "quotes_quote"') and not approvals:
+                # Another request approves the quote after the ids were selected
+                approvals.append(execute(
+                    'UPDATE "quotes_quote" SET "status" = %s WHERE "id" = %s',
+                    [Quote.Status.APPROVED, approved.pk], False, context
+                ))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(approve_before_update):
+            self.assertEqual(expire_pending_quotes(now=self.now), 1)
+
+        self.assertTrue(approvals)
+        self.assertEqual(self.statuses([approved, expired]), [Quote.Status.APPROVED, Quote.Status.EXPIRED])
+        self.assertEqual(self.active_hold_quote_ids(), {approved.pk})
+
+    def test_releases_expired_holds_only(self):
+        lapsed = self.create_held_quote(timedelta(days=1), hold_expires_in=-timedelta(minutes=1))
+        held = self.create_held_quote(timedelta(days=1))
+        self.assertEqual(release_expired_holds(now=self.now), 1)
+        self.assertEqual(CabinHold.objects.get(quote=lapsed).released_at, self.now)
+        self.assertEqual(self.active_hold_quote_ids(), {held.pk})
+        self.assertEqual(release_expired_holds(now=self.now), 0)
+
+    def test_command_reports_counts(self):
+        for i in range(3):
+            self.create_held_quote(-timedelta(hours=1))
+        self.create_held_quote(timedelta(days=1), hold_expires_in=-timedelta(minutes=1))
+        kept = self.create_held_quote(timedelta(days=1))
+        IdempotencyKey.objects.create(
+            key='old', request_fingerprint='x', response_status=201, response_body={},
+            expires_at=self.now - timedelta(days=1)
+        )
+
+        out = StringIO()
+        call_command('expire_quotes', '--batch-size', '2', stdout=out)
+
+        self.assertIn(
+            'Quotes expired: 3, cabin holds released: 1, idempotency keys purged: 1 in', out.getvalue()
+        )
+        self.assertEqual(Quote.objects.filter(status=Quote.Status.EXPIRED).count(), 3)
+        self.assertEqual(self.active_hold_quote_ids(), {kept.pk})
@@ -1,4 +1,9 @@
+import hashlib
 import logging
+import zipfile
+from itertools import islice
+from concurrent.futures import FIRST_COMPLETED, wait
+from functools import lru_cache
 from io import BytesIO
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import cm
@@ -7,6 +12,9 @@ from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
 from reportlab.graphics.shapes import Drawing, Rect
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Count, Max
 from django.utils import timezone
 from django.contrib.staticfiles.finders import find
 from reportlab.platypus.flowables import Flowable
@@ -14,8 +22,14 @@ from decimal import Decimal
 import os
 from PyPDF2 import PdfReader, PdfWriter
 
+from cruises.utils.pdf_utils import register_fonts
+from cruises.utils.process_utils import render_pool
+from cruises.utils.storage_utils import remove_other_files, save_if_absent
+
 logger = logging.getLogger(__name__)
 
+QUOTE_PDF_DIR = 'quote_pdfs'
+
 class HorizontalRule(Flowable):
     def __init__(self, width, thickness=1, color=colors.black):
         super().__init__()
@@ -28,10 +42,27 @@ class HorizontalRule(Flowable):
         self.canv.setLineWidth(self.thickness)
         self.canv.line(0, 0, self.width, 0)
 
+@lru_cache(maxsize=None)
+def load_logo(logo_path):
+    """Read the logo once per process; returns None when it is missing"""
+    if logo_path and os.path.exists(logo_path):
+        with open(logo_path, 'rb') as f:
+            return f.read()
+    return None
+
+@lru_cache(maxsize=None)
+def get_styles():
+    """Build the quote stylesheet once per process"""
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(name='CenterBold', alignment=TA_CENTER, fontSize=16, fontName='Helvetica-Bold'))
+    styles.add(ParagraphStyle(name='RightAligned', alignment=TA_RIGHT, fontSize=10, fontName='Helvetica'))
+    return styles
+
 def get_logo(logo_path):
     try:
-        if logo_path and os.path.exists(logo_path):
-            return Image(logo_path, width=100, height=100)
+        logo_data = load_logo(logo_path)
+        if logo_data:
+            return Image(BytesIO(logo_data), width=100, height=100)
         raise FileNotFoundError("Logo file not found")
     except Exception as e:
         logger.error(f"Error loading logo: {e}")
@@ -97,11 +128,11 @@ def create_journey_details(quote, styles, doc):
         ["Cruise", cruise.name],
         ["Departure", quote.cruise_session.start_date.strftime('%d-%m-%Y')],
         ["Return", quote.cruise_session.end_date.strftime('%d-%m-%Y')],
-        ["Duration", f"{quote.cruise_session.duration()} days"],
+        ["Duration", f"{quote.cruise_session.duration} days"],
         ["Ship", cruise.company.name],
         ["Type", cruise.cruise_type.name],
         ["Brand", cruise.brand.name if cruise.brand else "N/A"],
-        ["Category", quote.cruise_cabin_price.cabin_type.name],
+        ["Category", quote.cabin_category.name],
         ["Passengers", str(quote.number_of_passengers)],
     ]
     t = Table(data, colWidths=[4*cm, doc.width-4*cm])
@@ -220,6 +251,23 @@ def create_cruise_flyer_section(quote, styles):
         ]
     return []
 
+def merge_cruise_flyer(buffer, cruise):
+    """Append the pages of the cruise's flyer PDF to a rendered quote"""
+    output = PdfWriter()
+    quote_pdf = PdfReader(buffer)
+    for page in quote_pdf.pages:
+        output.add_page(page)
+
+    with cruise.flyer_pdf.open('rb') as flyer_file:
+        flyer_pdf = PdfReader(flyer_file)
+        for page in flyer_pdf.pages:
+            output.add_page(page)
+
+    buffer_final = BytesIO()
+    output.write(buffer_final)
+    buffer_final.seek(0)
+    return buffer_final
+
 def generate_quote_pdf(quote):
     try:
         buffer = BytesIO()
@@ -227,9 +275,7 @@ def generate_quote_pdf(quote):
                                 leftMargin=1*cm, rightMargin=1*cm, 
                                 topMargin=1*cm, bottomMargin=1*cm)
 
-        styles = getSampleStyleSheet()
-        styles.add(ParagraphStyle(name='CenterBold', alignment=TA_CENTER, fontSize=16, fontName='Helvetica-Bold'))
-        styles.add(ParagraphStyle(name='RightAligned', alignment=TA_RIGHT, fontSize=10, fontName='Helvetica'))
+        styles = get_styles()
 
         elements = []
         elements.extend(create_header(quote, styles, doc))
@@ -244,21 +290,127 @@ def generate_quote_pdf(quote):
         buffer.seek(0)
 
         if quote.cruise_session.cruise.flyer_pdf:
-            output = PdfWriter()
-            quote_pdf = PdfReader(buffer)
-            for page in quote_pdf.pages:
-                output.add_page(page)
-
-            flyer_pdf = PdfReader(quote.cruise_session.cruise.flyer_pdf.path)
-            for page in flyer_pdf.pages:
-                output.add_page(page)
-
-            buffer_final = BytesIO()
-            output.write(buffer_final)
-            buffer_final.seek(0)
-            return buffer_final
+            return merge_cruise_flyer(buffer, quote.cruise_session.cruise)
 
         return buffer
     except Exception as e:
         logger.error(f"Error generating PDF for quote {quote.id}: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+
+def quote_pdf_version(quote):
+    """
+    Short hash of everything that ends up in a quote PDF: the quote itself,
+    its passengers and services, the session, cruise, cruise type, ship,
+    company, brand and cabin category it refers to, and the itinerary.
+    """
+    from cruises.models import CruiseItinerary
+
+    passengers = quote.passengers.aggregate(count=Count('id'), updated=Max('updated_at'))
+    services = quote.additional_services.aggregate(count=Count('id'), updated=Max('updated_at'))
+    related = type(quote)._base_manager.filter(pk=quote.pk).values_list(
+        'cruise_session__updated_at',
+        'cruise_session__cruise__updated_at',
+        'cruise_session__cruise__cruise_type__updated_at',
+        'cruise_session__cruise__ship__updated_at',
+        'cruise_session__cruise__ship__company__updated_at',
+        'cruise_session__cruise__ship__brand__updated_at',
+        'cabin_category__updated_at',
+    ).get()
+    itinerary = CruiseItinerary.objects.filter(cruise_id=quote.cruise_session.cruise_id).aggregate(
+        count=Count('id'), updated=Max('updated_at'), ports=Max('port__updated_at')
+    )
+    parts = [
+        quote.pk,
+        quote.updated_at,
+        passengers['count'], passengers['updated'],
+        services['count'], services['updated'],
+        *related,
+        itinerary['count'], itinerary['updated'], itinerary['ports'],
+    ]
+    return hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()[:12]
+
+def quote_pdf_path(quote, version):
+    return f"{QUOTE_PDF_DIR}/{quote.pk}/{version}.pdf"
+
+def get_quote_pdf(quote):
+    """
+    Return an open file with the current PDF for a quote.
+
+    PDFs are stored in media storage keyed by quote id and version; a new one
+    is rendered only when the quote or anything it depends on has changed.
+    A stored PDF is never deleted here, so concurrent requests cannot remove
+    each other's file; outdated versions are removed by prune_quote_pdfs.
+    """
+    name = quote_pdf_path(quote, quote_pdf_version(quote))
+    try:
+        return default_storage.open(name, 'rb')
+    except FileNotFoundError:
+        pass
+
+    pdf = generate_quote_pdf(quote)
+    if save_if_absent(name, ContentFile(pdf.getvalue())):
+        logger.info(f"Stored PDF for quote {quote.pk} as {name}")
+    # Served from memory: a concurrent request may be storing the same file
+    pdf.seek(0)
+    return pdf
+
+def remove_outdated_quote_pdfs(quote):
+    """Delete the stored PDFs of a quote other than its current version; returns the number deleted"""
+    return remove_other_files(quote_pdf_path(quote, quote_pdf_version(quote)))
+
+def warm_pdf_worker():
+    """Render pool warm-up: load fonts, styles and logo once per worker"""
+    register_fonts()
+    get_styles()
+    load_logo(find('images/logo_travel.png'))
+
+def render_quote_pdf(quote_id):
+    """Render a single quote in a worker; returns (quote_id, pdf_bytes, error)"""
+    from .models import Quote
+
+    try:
+        quote = Quote.objects.get(pk=quote_id)
+        return quote_id, generate_quote_pdf(quote).getvalue(), None
+    except Exception as e:
+        return quote_id, None, str(e)
+
+def export_quote_pdfs(quote_ids, fileobj, max_workers=None):
+    """
+    Render quotes in a process pool and stream them into a ZIP archive.
+
+    Only a bounded window of PDFs is in flight at any time; each one is written
+    to ``fileobj`` as soon as its worker finishes. Returns a list of
+    (quote_id, error) tuples for the quotes that could not be rendered.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    failures = []
+
+    with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_DEFLATED) as archive, \
+            render_pool(max_workers, 'quotes.utils.warm_pdf_worker') as executor:
+        window = max_workers * 2
+        pending = set()
+        remaining = iter(quote_ids)
+
+        while True:
+            for quote_id in islice(remaining, window - len(pending)):
+                pending.add(executor.submit(render_quote_pdf, quote_id))
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                quote_id, pdf, error = future.result()
+                if error:
+                    logger.error(f"Error generating PDF for quote {quote_id}: {error}")
+                    failures.append((quote_id, error))
+                else:
+                    archive.writestr(f"quote_{quote_id}.pdf", pdf)
+
+        if failures:
+            archive.writestr(
+                "errors.txt",
+                "\n".join(f"Quote {quote_id}: {error}" for quote_id, error in failures)
+            )
+
+    return failures
@@ -8,7 +8,7 @@ from django.http import JsonResponse, Http404
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.contrib.admin.views.decorators import staff_member_required
-from django.db import transaction
+from django.db import IntegrityError, transaction
 import json
 import logging
 from datetime import timedelta
@@ -21,10 +21,25 @@ from cruises.models import (
     CabinCategory  # Add this import
 )
 from .forms import QuoteForm
-from .models import Quote, QuotePassenger
+from .models import IdempotencyKey, Quote, QuotePassenger
+from .services import (
+    IdempotencyKeyReused,
+    QuoteIntakeError,
+    create_quote_from_request,
+    get_price_snapshot,
+    get_stored_response,
+    request_fingerprint,
+    store_response,
+)
 
 logger = logging.getLogger(__name__)
 
+def idempotency_key_reused():
+    return JsonResponse({
+        'success': False,
+        'errors': 'Idempotency-Key was already used for a different request'
+    }, status=422)
+
 @require_http_methods(["GET", "POST"])
 def create_quote(request, cruise_id):
     if request.method == 'GET':
@@ -33,94 +48,78 @@ def create_quote(request, cruise_id):
             return JsonResponse({'success': False, 'errors': 'No session_id provided'}, status=400)
         
         try:
-            session = CruiseSession.objects.get(id=session_id, cruise_id=cruise_id)
-            cabin_prices = CruiseSessionCabinPrice.objects.filter(
-                cruise_session=session,
-                is_active=True
-            ).select_related('cabin_category')
-            
-            cabin_prices_data = [
-                {
-                    'id': cp.id,
-                    'label': f"{cp.cabin_category.name} | {cp.cabin_category.description}",
-                    'price': float(cp.get_current_price()),
-                    'available': cp.available_cabins > 0,
-                    'early_bird_info': f"Early Bird until {cp.early_bird_deadline.strftime('%Y-%m-%d')}" if hasattr(cp, 'early_bird_deadline') and cp.is_early_bird else None,
-                    'is_early_bird': cp.is_early_bird if hasattr(cp, 'is_early_bird') else False
-                } 
-                for cp in cabin_prices if cp.is_available
-            ]
-            
-            return JsonResponse({
-                'success': True, 
-                'cabin_prices': cabin_prices_data
-            })
-            
-        except CruiseSession.DoesNotExist:
+            snapshot = get_price_snapshot(int(session_id))
+        except ValueError:
+            snapshot = None
+        if snapshot is None or snapshot['cruise_id'] != cruise_id:
             return JsonResponse({'success': False, 'errors': 'Invalid session_id'}, status=400)
+
+        cabin_prices_data = [
+            {
+                'id': cp.id,
+                'label': f"{cp.cabin_category.name} | {cp.cabin_category.description}",
+                'price': float(cp.get_current_price()),
+                'available': cp.free_cabins > 0,
+                'early_bird_info': f"Early Bird until {cp.early_bird_deadline.strftime('%Y-%m-%d')}" if cp.early_bird_deadline and cp.is_early_bird else None,
+                'is_early_bird': cp.is_early_bird
+            } 
+            for cp in snapshot['prices'].values()
+        ]
+        
+        return JsonResponse({
+            'success': True, 
+            'cabin_prices': cabin_prices_data
+        })
     
     elif request.method == 'POST':
+        # Retries of the same submission carry the same key and get the original response
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key:
+            if len(idempotency_key) > IdempotencyKey._meta.get_field('key').max_length:
+                return JsonResponse({'success': False, 'errors': 'Idempotency-Key is too long'}, status=400)
+            fingerprint = request_fingerprint(request.body)
+            try:
+                stored = get_stored_response(idempotency_key, fingerprint)
+            except IdempotencyKeyReused:
+                return idempotency_key_reused()
+            if stored:
+                return JsonResponse(stored.response_body, status=stored.response_status)
+
         try:
             data = json.loads(request.body)
             logger.debug(f"Received POST data: {data}")  # Debug logging
-            
-            session_id = data.get('session_id')
-            cabin_price_id = data.get('cabin_price_id')
-            passenger_data = data.get('passenger', {})
-            number_of_passengers = data.get('number_of_passengers', 1)
-            
-            cruise = get_object_or_404(Cruise, pk=cruise_id)
-            session = get_object_or_404(CruiseSession, pk=session_id, cruise=cruise)
-                        
-            # In your create_quote view, update the form_data dictionary:
-            form_data = {
-                'cruise_session': session_id,
-                'cruise_session_cabin_price': cabin_price_id,
-                'number_of_passengers': number_of_passengers,
-                'cancellation_policy': data.get('cancellation_policy'),  # Add this line
-                'first_name': passenger_data.get('first_name', ''),
-                'last_name': passenger_data.get('last_name', ''),
-                'email': passenger_data.get('email', ''),
-                'phone': passenger_data.get('phone', ''),
-            }
-            
-            logger.debug(f"Form data: {form_data}")  # Debug logging
-            form = QuoteForm(data=form_data, cruise=cruise, session=session)
-            
-            if form.is_valid():
-                with transaction.atomic():
-                    quote = form.save(commit=False)
-                    quote.user = request.user if not isinstance(request.user, AnonymousUser) else None
-                    quote.cruise = cruise
-                    
-                    cabin_price = form.cleaned_data['cruise_session_cabin_price']
-                    quote.base_price = cabin_price.get_current_price()
-                    quote.total_price = quote.base_price * quote.number_of_passengers
-                    quote.expiration_date = timezone.now() + timedelta(days=7)
-                    quote.cabin_category = cabin_price.cabin_category
-                    quote.save()
-                    
-                    # Create passenger record
-                    QuotePassenger.objects.create(
-                        quote=quote,
-                        first_name=form.cleaned_data['first_name'],
-                        last_name=form.cleaned_data['last_name'],
-                        email=form.cleaned_data['email'],
-                        phone=form.cleaned_data['phone']
-                    )
-                
-                return JsonResponse({
+
+            user = request.user if not isinstance(request.user, AnonymousUser) else None
+            with transaction.atomic():
+                quote = create_quote_from_request(cruise_id, data, user=user)
+                response_data = {
                     'success': True, 
                     'quote_id': quote.id,
                     'redirect_url': reverse('quotes:quote_confirmation')
-                })
-            else:
-                logger.error(f"Form validation errors: {form.errors}")  # Debug logging
-                return JsonResponse({
-                    'success': False, 
-                    'errors': form.errors
-                }, status=400)
-                
+                }
+                if idempotency_key:
+                    store_response(idempotency_key, fingerprint, 200, response_data)
+
+            return JsonResponse(response_data)
+
+        except IntegrityError:
+            if not idempotency_key:
+                raise
+            # A concurrent request stored the key first and our quote was
+            # rolled back; without a stored key the error had another cause
+            try:
+                stored = get_stored_response(idempotency_key, fingerprint)
+            except IdempotencyKeyReused:
+                return idempotency_key_reused()
+            if stored is None:
+                raise
+            return JsonResponse(stored.response_body, status=stored.response_status)
+        except QuoteIntakeError as e:
+            logger.error(f"Quote validation errors: {e.errors}")  # Debug logging
+            return JsonResponse({
+                'success': False, 
+                'errors': e.errors
+            }, status=400)
         except json.JSONDecodeError:
             return JsonResponse({'success': False, 'errors': 'Invalid JSON data'}, status=400)
         except Exception as e: